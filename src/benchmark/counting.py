@@ -0,0 +1,24 @@
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+
+
+class EventCounter(BaseAnalysis):
+    """Counts the runtime events of an already instrumented program.
+
+    runtime_event is called once for every event the instrumentation emits,
+    so running a file that was instrumented for another analysis under this
+    one counts the events that analysis receives. The count is written to
+    count_file at the end of the execution.
+    """
+
+    def __init__(self, count_file: str = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.count_file = count_file
+        self.events = 0
+
+    def runtime_event(self, dyn_ast: str, iid: int) -> None:
+        self.events += 1
+
+    def end_execution(self) -> None:
+        if self.count_file is not None:
+            with open(self.count_file, "w") as f:
+                f.write(str(self.events))
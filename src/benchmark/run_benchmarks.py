@@ -0,0 +1,277 @@
+"""Measures how much each DynaPerf analysis slows a program down.
+
+Every example program and every scaled workload is run in three modes:
+uninstrumented, instrumented for every hook but run under DynaPyt's
+BaseAnalysis, which handles none of them, and under each analysis. For each
+run the wall time and peak RSS are recorded, and a second run of the same
+instrumented file under EventCounter gives the number of events, from which
+events per second are derived.
+
+    python src/benchmark/run_benchmarks.py --output results.json
+    python src/benchmark/run_benchmarks.py --baseline results.json --threshold 0.2
+
+With --baseline, a run whose wall time or peak RSS grew by more than the
+threshold makes the benchmark exit with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+EXAMPLE_DIR = SRC_DIR / "example"
+WORKLOAD_DIR = Path(__file__).resolve().parent / "workloads"
+
+PLAIN = "plain"
+BASE = "base"
+BASE_ANALYSIS = "dynapyt.analyses.BaseAnalysis.BaseAnalysis"
+
+DEFAULT_ANALYSES = (
+    "my_analysis.RecursionAnalysis.RecursionAnalysis",
+    "my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis",
+    "my_analysis.NestedLoopingAnalysis.NestedLoopingAnalysis",
+    "my_analysis.ObjectCreationInLoopAnalysis.ObjectCreationInLoopAnalysis",
+    "my_analysis.UnusedVarAnalysis.UnusedVarAnalysis",
+    "my_analysis.InefficientApiAnalysis.InefficientApiAnalysis",
+    "my_analysis.LoopInvariantAnalysis.LoopInvariantAnalysis",
+    "my_analysis.VectorizationAnalysis.VectorizationAnalysis",
+    "my_analysis.MemoizationAnalysis.MemoizationAnalysis",
+    "my_analysis.CompositeAnalysis.CompositeAnalysis",
+)
+
+# Input sizes of the scaled workloads, passed to them in DYNAPERF_BENCH_SIZE
+WORKLOAD_SIZES = {
+    "wl_InefficientApiAnalysis.py": (250, 1000, 4000),
+    "wl_LoopInvariantAnalysis.py": (250, 1000, 4000),
+    "wl_VectorizationAnalysis.py": (250, 1000, 4000),
+    "wl_MemoizationAnalysis.py": (250, 1000, 4000),
+    "wl_NestedLoopingAnalysis.py": (10, 20, 40),
+    "wl_ObjectCreationInLoopAnalysis.py": (250, 1000, 4000),
+    "wl_RecursionAnalysis.py": (10, 14, 18),
+    "wl_SlowStringConcatAnalysis.py": (1000, 4000, 16000),
+    "wl_UnusedVarAnalysis.py": (250, 1000, 4000),
+}
+
+# EventCounter listens to runtime_event, the root of the hook hierarchy, so instrumenting for it selects every hook
+COUNTER_ANALYSIS = "benchmark.counting.EventCounter"
+
+# Differences below this many seconds are treated as noise by the regression check
+MIN_TIME_DELTA = 0.05
+
+
+class RunResult:
+    __slots__ = ("wall_time", "peak_rss_kb", "returncode")
+
+    def __init__(self, wall_time: float, peak_rss_kb: int, returncode: int) -> None:
+        self.wall_time = wall_time
+        self.peak_rss_kb = peak_rss_kb
+        self.returncode = returncode
+
+
+def run_measured(command: List[str], cwd: Path, env: Dict[str, str], timeout: float) -> RunResult:
+    """Runs a command and returns its wall time and the peak RSS of the child process"""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = start + timeout
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        if time.perf_counter() > deadline:
+            process.kill()
+            pid, status, usage = os.wait4(process.pid, 0)
+            break
+        time.sleep(0.001)
+    wall_time = time.perf_counter() - start
+    # Popen must not try to reap the process a second time
+    process.returncode = returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss_kb = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return RunResult(wall_time, peak_rss_kb, returncode)
+
+
+class Benchmark:
+    def __init__(self, analyses: List[str], repeat: int, timeout: float, work_dir: Path) -> None:
+        self.analyses = analyses
+        self.repeat = repeat
+        self.timeout = timeout
+        self.work_dir = work_dir
+        self.results: List[dict] = []
+
+    def env(self, size: Optional[int]) -> Dict[str, str]:
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_DIR), env.get("PYTHONPATH")]))
+        if size is not None:
+            env["DYNAPERF_BENCH_SIZE"] = str(size)
+        return env
+
+    def run_program(self, program: Path, sizes: Tuple[Optional[int], ...]) -> None:
+        plain_times = {}
+        # Mode, analysis to instrument for, analysis to run under
+        modes = [(PLAIN, None, None), (BASE, COUNTER_ANALYSIS, BASE_ANALYSIS)]
+        modes += [(_mode_name(analysis), analysis, analysis) for analysis in self.analyses]
+        for mode, instrumented_for, analysis in modes:
+            run_dir = Path(tempfile.mkdtemp(prefix=f"{program.stem}-{mode}-", dir=self.work_dir))
+            entry = run_dir / program.name
+            shutil.copy(program, entry)
+
+            instrument_time = None
+            if instrumented_for is not None:
+                start = time.perf_counter()
+                subprocess.run(
+                    [sys.executable, "-m", "dynapyt.instrument.instrument", "--files", entry.name, "--analysis", instrumented_for],
+                    cwd=run_dir, env=self.env(None), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+                )
+                instrument_time = time.perf_counter() - start
+
+            for size in sizes:
+                result = self.measure(entry, analysis, size)
+                if mode == PLAIN:
+                    plain_times[size] = result["wall_time"]
+                elif plain_times.get(size):
+                    result["slowdown"] = result["wall_time"] / plain_times[size]
+                result.update(program=program.name, size=size, mode=mode, instrument_time=instrument_time)
+                self.results.append(result)
+                print(_describe(result), flush=True)
+
+    def measure(self, entry: Path, analysis: Optional[str], size: Optional[int]) -> dict:
+        env = self.env(size)
+        if analysis is None:
+            command = [sys.executable, entry.name]
+        else:
+            command = [sys.executable, "-m", "dynapyt.run_analysis", "--entry", entry.name, "--analysis", analysis]
+
+        runs = [run_measured(command, entry.parent, env, self.timeout) for _ in range(self.repeat)]
+        result = {
+            # The fastest run is the one least disturbed by the rest of the machine
+            "wall_time": min(run.wall_time for run in runs),
+            "peak_rss_kb": max(run.peak_rss_kb for run in runs),
+            "returncode": runs[-1].returncode,
+        }
+
+        if analysis is not None:
+            events = self.count_events(entry, env)
+            result["events"] = events
+            if events is not None and result["wall_time"] > 0:
+                result["events_per_sec"] = events / result["wall_time"]
+        return result
+
+    def count_events(self, entry: Path, env: Dict[str, str]) -> Optional[int]:
+        count_file = entry.parent / "events.txt"
+        command = [sys.executable, "-m", "dynapyt.run_analysis", "--entry", entry.name,
+                   "--analysis", f"{COUNTER_ANALYSIS};count_file={count_file}"]
+        run_measured(command, entry.parent, env, self.timeout)
+        try:
+            return int(count_file.read_text())
+        except (OSError, ValueError):
+            return None
+
+
+def find_regressions(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """Runs whose wall time or peak RSS grew by more than threshold compared to the baseline"""
+    previous = {_result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(_result_key(result))
+        if old is None:
+            continue
+        name = "/".join(str(part) for part in _result_key(result) if part is not None)
+        if (result["wall_time"] > old["wall_time"] * (1 + threshold)
+                and result["wall_time"] - old["wall_time"] > MIN_TIME_DELTA):
+            regressions.append(f"{name}: wall time {old['wall_time']:.3f}s -> {result['wall_time']:.3f}s")
+        if result["peak_rss_kb"] > old["peak_rss_kb"] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {old['peak_rss_kb']} KB -> {result['peak_rss_kb']} KB")
+    return regressions
+
+
+def _result_key(result: dict) -> Tuple:
+    return result["program"], result["size"], result["mode"]
+
+
+def _mode_name(analysis: str) -> str:
+    """Analysis class name, followed by its options when it has any"""
+    path, _, options = analysis.partition(";")
+    name = path.rsplit(".", 1)[-1]
+    return f"{name};{options}" if options else name
+
+
+def _describe(result: dict) -> str:
+    size = f"[{result['size']}]" if result["size"] is not None else ""
+    line = f"{result['program']}{size} {result['mode']}: {result['wall_time']:.3f}s, {result['peak_rss_kb']} KB"
+    if "slowdown" in result:
+        line += f", {result['slowdown']:.1f}x"
+    if result.get("events_per_sec"):
+        line += f", {result['events']} events ({result['events_per_sec']:.0f}/s)"
+    if result["returncode"] != 0:
+        line += f", exit status {result['returncode']}"
+    return line
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the instrumentation overhead of DynaPerf analyses")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="Earlier results to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative growth that counts as a regression")
+    parser.add_argument("--analysis", nargs="+", default=list(DEFAULT_ANALYSES),
+                        help="Analyses to benchmark (full dotted path, optionally followed by ;key=value options)")
+    parser.add_argument("--programs", nargs="+", help="Only run programs whose file name contains one of these strings")
+    parser.add_argument("--no-workloads", action="store_true", help="Only run the example programs")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest one is kept")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds after which a run is killed")
+    args = parser.parse_args()
+
+    programs = [(path, (None,)) for path in sorted(EXAMPLE_DIR.glob("ex_*.py"))]
+    if not args.no_workloads:
+        programs += [(WORKLOAD_DIR / name, sizes) for name, sizes in sorted(WORKLOAD_SIZES.items())]
+    if args.programs:
+        programs = [(path, sizes) for path, sizes in programs if any(p in path.name for p in args.programs)]
+
+    with tempfile.TemporaryDirectory(prefix="dynaperf-bench-") as work_dir:
+        benchmark = Benchmark(args.analysis, max(1, args.repeat), args.timeout, Path(work_dir))
+        for program, sizes in programs:
+            benchmark.run_program(program, sizes)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "dynapyt": _dynapyt_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": benchmark.results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        regressions = find_regressions(benchmark.results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions above {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions above {args.threshold:.0%}")
+    return 0
+
+
+def _dynapyt_version() -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version("dynapyt")
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
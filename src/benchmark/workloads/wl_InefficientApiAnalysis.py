@@ -0,0 +1,10 @@
+import os
+
+# 查找次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+known = list(range(0, 2 * N, 2))
+hits = 0
+for i in range(N):
+    if i in known:
+        hits += 1
@@ -0,0 +1,16 @@
+import os
+
+# 迭代次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+OFFSET = 7
+
+
+def shift(values):
+    out = []
+    for v in values:
+        out.append(v + OFFSET * len(values))
+    return out
+
+
+shift(list(range(N)))
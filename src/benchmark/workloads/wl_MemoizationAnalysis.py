@@ -0,0 +1,14 @@
+import os
+
+# 调用次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+
+def weight(k):
+    total = 0
+    for d in range(1, 20):
+        total += k % d
+    return total
+
+
+print(sum(weight(i % 50) for i in range(N)))
@@ -0,0 +1,20 @@
+import os
+
+# 矩阵边长, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "20"))
+
+
+def matmul(a, b):
+    rows, inner, cols = len(a), len(b), len(b[0])
+    c = [[0] * cols for _ in range(rows)]
+    for i in range(rows):
+        for j in range(cols):
+            total = 0
+            for k in range(inner):
+                total += a[i][k] * b[k][j]
+            c[i][j] = total
+    return c
+
+
+matrix = [[i + j for j in range(N)] for i in range(N)]
+matmul(matrix, matrix)
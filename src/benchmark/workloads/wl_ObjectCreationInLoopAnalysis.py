@@ -0,0 +1,18 @@
+import os
+
+# 外层循环次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+
+def add_k_element(test_list, k):
+    res = []
+    for row in test_list:
+        temp = []
+        for value in row:
+            temp.append(value + k)
+        res.append(tuple(temp))
+        seen = {"row": len(temp)}
+    return res
+
+
+add_k_element([[i, i + 1, i + 2] for i in range(N)], 2)
@@ -0,0 +1,16 @@
+import os
+
+# 斐波那契参数, 调用次数随其指数增长
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "15"))
+
+
+def fib(n):
+    if n <= 0:
+        return 0
+    elif n == 1:
+        return 1
+    else:
+        return fib(n - 1) + fib(n - 2)
+
+
+fib(N)
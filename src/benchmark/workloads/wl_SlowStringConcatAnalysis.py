@@ -0,0 +1,8 @@
+import os
+
+# 拼接次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+s = ''
+for i in range(N):
+    s += str(i) + ' '
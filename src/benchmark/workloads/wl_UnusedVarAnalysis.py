@@ -0,0 +1,16 @@
+import os
+
+# 循环次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+
+def accumulate(n):
+    total = 0
+    for i in range(n):
+        temp = i * 2  # 从未读取
+        total = total + i
+        label = str(i)  # 被下一次迭代覆盖
+    return total
+
+
+accumulate(N)
@@ -0,0 +1,22 @@
+import os
+
+# 迭代次数, 由基准测试通过环境变量传入
+N = int(os.environ.get("DYNAPERF_BENCH_SIZE", "1000"))
+
+
+def axpy(a, xs, ys):
+    out = [0.0] * len(xs)
+    for i in range(len(xs)):
+        out[i] = a * xs[i] + ys[i]
+    return out
+
+
+def dot(xs, ys):
+    total = 0.0
+    for x, y in zip(xs, ys):
+        total += x * y
+    return total
+
+
+values = [float(i) for i in range(N)]
+dot(axpy(2.0, values, values), values)
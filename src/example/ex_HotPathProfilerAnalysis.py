@@ -0,0 +1,44 @@
+def slow_sum(n):
+    s = 0
+    for i in range(n):
+        s += i
+    return s
+
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def main():
+    # 热点1: 循环中重复调用
+    for k in range(3):
+        slow_sum(2000)
+    # 热点2: 指数级递归
+    fib(10)
+
+
+main()
+
+"""
+$ python3 -m dynapyt.instrument.instrument --files ex_HotPathProfilerAnalysis.py --analysis my_analysis.HotPathProfilerAnalysis.HotPathProfilerAnalysis
+Done with ex_HotPathProfilerAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_HotPathProfilerAnalysis.py --analysis my_analysis.HotPathProfilerAnalysis.HotPathProfilerAnalysis
+Setting coverage for None
+
+===== Hot Path Profile =====
+Total profiled time: 27.66 ms, collapsed stacks written to hotpath.folded
+Top 5 sites by inclusive time:
+      27.62 ms  99.8%  function main at /path/to/example/ex_HotPathProfilerAnalysis.py.orig:12 (iid: 5), 1 calls, 27621.7 us each
+      25.18 ms  91.0%  loop at /path/to/example/ex_HotPathProfilerAnalysis.py.orig:14 (iid: 6), 3 iterations, 8392.6 us each
+      25.03 ms  90.5%  function slow_sum at /path/to/example/ex_HotPathProfilerAnalysis.py.orig:1 (iid: 0), 3 calls, 8344.5 us each
+      24.00 ms  86.7%  loop at /path/to/example/ex_HotPathProfilerAnalysis.py.orig:3 (iid: 1), 6000 iterations, 4.0 us each
+       2.36 ms   8.5%  function fib at /path/to/example/ex_HotPathProfilerAnalysis.py.orig:8 (iid: 3), 177 calls, 13.3 us each
+
+===== Analysis Complete =====
+$ head -5 hotpath.folded
+<module> 42
+<module>;main@ex_HotPathProfilerAnalysis.py:12 83
+<module>;main@ex_HotPathProfilerAnalysis.py:12;<for_loop>@ex_HotPathProfilerAnalysis.py:14 144
+<module>;main@ex_HotPathProfilerAnalysis.py:12;<for_loop>@ex_HotPathProfilerAnalysis.py:14;slow_sum@ex_HotPathProfilerAnalysis.py:1 1036
+<module>;main@ex_HotPathProfilerAnalysis.py:12;<for_loop>@ex_HotPathProfilerAnalysis.py:14;slow_sum@ex_HotPathProfilerAnalysis.py:1;<for_loop>@ex_HotPathProfilerAnalysis.py:3 23997
+"""
@@ -0,0 +1,34 @@
+def common_ids(orders, customers):
+    known = [c["id"] for c in customers]
+    shared = []
+    for order in orders:
+        if order["customer"] in known:
+            shared.append(known.index(order["customer"]))
+    return shared
+
+customers = [{"id": i} for i in range(300)]
+orders = [{"customer": i * 2} for i in range(200)]
+print(len(common_ids(orders, customers)))
+
+"""
+$ python3 -m dynapyt.instrument.instrument --files ex_InefficientApiAnalysis.py --analysis my_analysis.InefficientApiAnalysis.InefficientApiAnalysis
+Done with ex_InefficientApiAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_InefficientApiAnalysis.py --analysis my_analysis.InefficientApiAnalysis.InefficientApiAnalysis
+Setting coverage for None
+150
+
+===== Inefficient API Usage Report =====
+Linear searches inside loops, ranked by projected savings:
+
+1. 'in' test on a list at /path/to/example/ex_InefficientApiAnalysis.py.orig:5 (iid: 3), inside the for loop at /path/to/example/ex_InefficientApiAnalysis.py.orig:4 (iid: 2)
+   200 searches of up to 300 elements, about 37500 elements compared
+   Suggestion: convert the list to a set once before the loop and test membership against the set
+   Projected: about 500 elements touched (200 lookups, 300 to build 1 set(s) or dict(s)), saving 37000 (98.7%)
+
+2. list.index() at /path/to/example/ex_InefficientApiAnalysis.py.orig:6 (iid: 4), inside the for loop at /path/to/example/ex_InefficientApiAnalysis.py.orig:4 (iid: 2)
+   150 searches of up to 300 elements, about 22500 elements compared
+   Suggestion: build a dict from value to position once before the loop, e.g. {v: i for i, v in enumerate(values)}
+   Projected: about 450 elements touched (150 lookups, 300 to build 1 set(s) or dict(s)), saving 22050 (98.0%)
+
+===== Analysis Complete =====
+"""
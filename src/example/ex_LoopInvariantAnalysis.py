@@ -0,0 +1,38 @@
+import math
+
+SCALE = 3
+
+
+def normalize(rows):
+    result = []
+    for row in rows:
+        scaled = []
+        for x in row:
+            scaled.append(x * SCALE / math.sqrt(len(rows[0])))
+        result.append(scaled)
+    return result
+
+
+rows = [[i + j for j in range(20)] for i in range(5)]
+print(len(normalize(rows)))
+
+"""
+$ python3 -m dynapyt.instrument.instrument --files ex_LoopInvariantAnalysis.py --analysis my_analysis.LoopInvariantAnalysis.LoopInvariantAnalysis
+Done with ex_LoopInvariantAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_LoopInvariantAnalysis.py --analysis my_analysis.LoopInvariantAnalysis.LoopInvariantAnalysis
+Setting coverage for None
+5
+
+===== Loop Invariant Report =====
+Expressions with the same result on every iteration of their loop, ranked by redundant evaluations:
+
+1. global `SCALE` at /path/to/example/ex_LoopInvariantAnalysis.py.orig:11 (iid: 8), inside the for loop at /path/to/example/ex_LoopInvariantAnalysis.py.orig:10 (iid: 3)
+   Same result (3) on every iteration in 5 of 5 loop execution(s), 95 of 100 evaluations were redundant
+   Suggestion: bind the global to a local variable before the loop, local reads are cheaper
+
+2. call `math.sqrt(len(rows[0]))` at /path/to/example/ex_LoopInvariantAnalysis.py.orig:11 (iid: 14), inside the for loop at /path/to/example/ex_LoopInvariantAnalysis.py.orig:10 (iid: 3)
+   Same result (4.47213595499958) on every iteration in 5 of 5 loop execution(s), 95 of 100 evaluations were redundant
+   Suggestion: call it once before the loop and reuse the result
+
+===== Analysis Complete =====
+"""
@@ -0,0 +1,57 @@
+import random
+
+
+def fib(n):
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+
+def distance(a, b):
+    total = 0
+    for x, y in zip(a, b):
+        total += (x - y) ** 2
+    return total ** 0.5
+
+
+def roll(sides):
+    return random.randint(1, sides)
+
+
+print(fib(18))
+points = [(i % 7, i % 5, i % 3) for i in range(30)]
+print(sum(distance(points[i % 30], points[(i * 7) % 30]) for i in range(2000)))
+print(sum(roll(6) for _ in range(500)))
+
+"""
+$ python3 -m dynapyt.instrument.instrument --files ex_MemoizationAnalysis.py --analysis my_analysis.MemoizationAnalysis.MemoizationAnalysis
+Done with ex_MemoizationAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_MemoizationAnalysis.py --analysis my_analysis.MemoizationAnalysis.MemoizationAnalysis
+Setting coverage for None
+2584
+4663.678416179482
+1721
+
+===== Memoization Report =====
+Functions called repeatedly with the same arguments, ranked by time a cache would save:
+
+1. fib at /path/to/example/ex_MemoizationAnalysis.py.orig:4 (iid: 0)
+   Calls: 8361 with 19 distinct argument tuples, 68.95 ms in total
+       maxsize=16:  45.7% hits of 35 lookups,  99.8% of the calls avoided, saves 68.47 ms
+      maxsize=128:  45.7% hits of 35 lookups,  99.8% of the calls avoided, saves 68.47 ms
+     maxsize=1024:  45.7% hits of 35 lookups,  99.8% of the calls avoided, saves 68.47 ms
+     maxsize=None:  45.7% hits of 35 lookups,  99.8% of the calls avoided, saves 68.47 ms
+   Suggestion: decorate it with @functools.lru_cache(maxsize=16)
+
+2. distance at /path/to/example/ex_MemoizationAnalysis.py.orig:10 (iid: 3)
+   Calls: 2000 with 30 distinct argument tuples, 5.17 ms in total
+       maxsize=16:   0.0% hits of 2000 lookups,   0.0% of the calls avoided, saves 0.00 ms
+      maxsize=128:  98.5% hits of 2000 lookups,  98.5% of the calls avoided, saves 5.07 ms
+     maxsize=1024:  98.5% hits of 2000 lookups,  98.5% of the calls avoided, saves 5.07 ms
+     maxsize=None:  98.5% hits of 2000 lookups,  98.5% of the calls avoided, saves 5.07 ms
+   Suggestion: decorate it with @functools.lru_cache(maxsize=128)
+
+Times are measured under instrumentation and only compare functions with each other. Caching is only safe for functions without side effects.
+
+===== Analysis Complete =====
+"""
@@ -40,40 +40,96 @@ def test_nested_loops():
 test_nested_loops()
 
 """
+$ python3 -m dynapyt.instrument.instrument --files ex_NestedLoopingAnalysis.py --analysis my_analysis.NestedLoopingAnalysis.NestedLoopingAnalysis
+Done with ex_NestedLoopingAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_NestedLoopingAnalysis.py --analysis my_analysis.NestedLoopingAnalysis.NestedLoopingAnalysis
+Setting coverage for None
+
 ===== Nested Looping Analysis Report =====
 Warning: Possible performance issue - maximum nesting depth is 3
-Detected 5 unique nested loop structures
+Detected 6 unique nested loop structures
 
-For /home/immengzi/test_dynapyt/example/example.py.orig: for loop (iid: 245):
+Outer for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:9 (iid: 2):
   Maximum nesting depth: 2
+  Iterations: 3 iterations over 1 entries (mean trip count 3.0, max 3)
+  Trip count histogram: 2-3: 1
   Nested loop structures:
   Structure #1:
-    Level 1: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 244)
-  Performance suggestion: Monitor the performance of this double loop for large datasets
+    Level 1: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:9 (iid: 1)
+      Iterations: 6 iterations over 3 entries (mean trip count 2.0, max 2)
+      Trip count histogram: 2-3: 3
+  Loop control flow stats:
+    Normal exits: 1
+    Breaks: 0
+    Continues: 0
+  Performance suggestion: Check how this double loop scales with my_analysis.complexity before it meets large datasets
 
-For /home/immengzi/test_dynapyt/example/example.py.orig: for loop (iid: 246):
+Outer for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:11 (iid: 3):
   Maximum nesting depth: 2
+  Iterations: 2 iterations over 1 entries (mean trip count 2.0, max 2)
+  Trip count histogram: 2-3: 1
   Nested loop structures:
   Structure #1:
-    Level 1: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 247)
-  Performance suggestion: Monitor the performance of this double loop for large datasets
+    Level 1: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:12 (iid: 4)
+      Iterations: 6 iterations over 2 entries (mean trip count 3.0, max 3)
+      Trip count histogram: 2-3: 2
+  Loop control flow stats:
+    Normal exits: 1
+    Breaks: 0
+    Continues: 0
+  Performance suggestion: Check how this double loop scales with my_analysis.complexity before it meets large datasets
 
-For /home/immengzi/test_dynapyt/example/example.py.orig: for loop (iid: 249):
+Outer for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:20 (iid: 6):
   Maximum nesting depth: 2
+  Iterations: 2 iterations over 1 entries (mean trip count 2.0, max 2)
+  Trip count histogram: 2-3: 1
   Nested loop structures:
   Structure #1:
-    Level 1: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 248)
-  Performance suggestion: Monitor the performance of this double loop for large datasets
+    Level 1: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:20 (iid: 5)
+      Iterations: 4 iterations over 2 entries (mean trip count 2.0, max 2)
+      Trip count histogram: 2-3: 2
+  Loop control flow stats:
+    Normal exits: 1
+    Breaks: 0
+    Continues: 0
+  Performance suggestion: Check how this double loop scales with my_analysis.complexity before it meets large datasets
 
-For /home/immengzi/test_dynapyt/example/example.py.orig: for loop (iid: 250):
+Outer for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:22 (iid: 7):
   Maximum nesting depth: 3
+  Iterations: 2 iterations over 1 entries (mean trip count 2.0, max 2)
+  Trip count histogram: 2-3: 1
   Nested loop structures:
   Structure #1:
-    Level 1: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 251)
+    Level 1: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:23 (iid: 8)
+      Iterations: 4 iterations over 2 entries (mean trip count 2.0, max 2)
+      Trip count histogram: 2-3: 2
   Structure #2:
-    Level 1: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 251)
-    Level 2: for loop at /home/immengzi/test_dynapyt/example/example.py.orig (iid: 252)
+    Level 1: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:23 (iid: 8)
+      Iterations: 4 iterations over 2 entries (mean trip count 2.0, max 2)
+      Trip count histogram: 2-3: 2
+    Level 2: for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:24 (iid: 9)
+      Iterations: 12 iterations over 4 entries (mean trip count 3.0, max 3)
+      Trip count histogram: 2-3: 4
+  Loop control flow stats:
+    Normal exits: 1
+    Breaks: 0
+    Continues: 0
   Performance suggestion: Consider refactoring code to reduce nesting depth, or use vectorization
 
-===== Analysis Complete ====="
+Outer for loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:29 (iid: 10):
+  Maximum nesting depth: 2
+  Iterations: 2 iterations over 1 entries (mean trip count 2.0, max 2)
+  Trip count histogram: 2-3: 1
+  Nested loop structures:
+  Structure #1:
+    Level 1: while loop at /path/to/example/ex_NestedLoopingAnalysis.py.orig:31 (iid: 11)
+      Iterations: 5 iterations over 2 entries (mean trip count 2.5, max 3)
+      Trip count histogram: 2-3: 2
+  Loop control flow stats:
+    Normal exits: 0
+    Breaks: 1
+    Continues: 0
+  Performance suggestion: Check how this double loop scales with my_analysis.complexity before it meets large datasets
+
+===== Analysis Complete =====
 """
@@ -4,15 +4,19 @@ for i in range(10):
 print(s)
 
 """
-immengzi@Meng-PC:~/test_dynapyt/example$ python3 -m dynapyt.instrument.instrument --files ex_SlowStringConcatAnalysis.py --analysis my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis
+$ python3 -m dynapyt.instrument.instrument --files ex_SlowStringConcatAnalysis.py --analysis my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis
 Done with ex_SlowStringConcatAnalysis.py
-immengzi@Meng-PC:~/test_dynapyt/example$ python3 -m dynapyt.run_analysis --entry ex_SlowStringConcatAnalysis --analysis my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis
+$ python3 -m dynapyt.run_analysis --entry ex_SlowStringConcatAnalysis.py --analysis my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis
 Setting coverage for None
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-Possible slow string concatenation in /home/immengzi/test_dynapyt/example/ex_SlowStringConcatAnalysis.py.orig at 1
-0 1 2 3 4 5 6 7 8 9
+0 1 2 3 4 5 6 7 8 9 
+
+===== Slow String Concatenation Report =====
+Sites ranked by estimated wasted copying:
+
+1. str concatenation (+=) at /path/to/example/ex_SlowStringConcatAnalysis.py.orig:3 (iid: 2)
+   10 concatenations in the longest growing run (10 in total), final length 20
+   Estimated copying: 110 bytes copied, 90 of them re-copying the accumulated str
+   Suggestion: collect the pieces in a list and use ''.join(), or write them to io.StringIO
+
+===== Analysis Complete =====
 """
@@ -21,17 +21,26 @@ def test_unused_vars():
 test_unused_vars()
 
 """
-UNUSED VARIABLE: var_at_iid_46 was written at IID 46 with value 0 but never read before being written again at IID 46
-UNUSED VARIABLE: var_at_iid_46 was written at IID 46 with value 1 but never read before being written again at IID 46
+$ python3 -m dynapyt.instrument.instrument --files ex_UnusedVarAnalysis.py --analysis my_analysis.UnusedVarAnalysis.UnusedVarAnalysis
+Done with ex_UnusedVarAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_UnusedVarAnalysis.py --analysis my_analysis.UnusedVarAnalysis.UnusedVarAnalysis
+Setting coverage for None
+10
+42
+$ cat unused_vars.log
+UNUSED VARIABLE: num1 (in test_unused_vars) was written at line 3 (IID 1) with value 5 but never read before being written again at line 4 (IID 2)
+UNUSED VARIABLE: temp (in test_unused_vars) was written at line 12 (IID 7) with value 0 but never read before being written again at line 12 (IID 7)
 ===== Analysis Complete =====
-NEVER USED: var_at_iid_40 was written at IID 40 with value 5 but never read until program end
-NEVER USED: var_at_iid_43 was written at IID 43 with value 这个变量永远不会被使用 but never read until program end
-NEVER USED: var_at_iid_46 was written at IID 46 with value 2 but never read until program end
+NEVER USED: never_used (in test_unused_vars) was written at line 8 (IID 4) with value '这个变量永远不会被使用' but never read until program end
+NEVER USED: temp (in test_unused_vars) was written at line 12 (IID 7) with value 2 but never read until program end
 Found 3 unused variables in total:
-  Variables never used until program end: 3
-  - var_at_iid_40 written at IID 40 with value 5 but never read
-  - var_at_iid_43 written at IID 43 with value 这个变量永远不会被使用 but never read
-  - var_at_iid_46 written at IID 46 with value 2 but never read
-Total write operations tracked: 5
-Total read operations tracked: 2
+  Variables overwritten before being used: 2
+  - num1 (in test_unused_vars) written at line 3 (IID 1) with value 5 but overwritten before being read (1 times)
+  - temp (in test_unused_vars) written at line 12 (IID 7) with value 0 but overwritten before being read (2 times)
+  Variables never used until program end: 2
+  - never_used (in test_unused_vars) written at line 8 (IID 4) with value '这个变量永远不会被使用' but never read
+  - temp (in test_unused_vars) written at line 12 (IID 7) with value 2 but never read
+Total variables tracked: 4
+Total write operations tracked: 7
+Total read operations tracked: 6
 """
@@ -0,0 +1,106 @@
+import math
+import random
+
+
+def matmul(a, b):
+    n, m, p = len(a), len(b[0]), len(b)
+    c = [[0.0] * m for _ in range(n)]
+    for i in range(n):
+        for j in range(m):
+            for k in range(p):
+                c[i][j] += a[i][k] * b[k][j]
+    return c
+
+
+def transpose(m):
+    t = [[0.0] * len(m) for _ in range(len(m[0]))]
+    for i in range(len(m)):
+        for j in range(len(m[0])):
+            t[j][i] = m[i][j]
+    return t
+
+
+def scale(xs, factor):
+    out = [0.0] * len(xs)
+    for i in range(len(xs)):
+        out[i] = xs[i] * factor + 1.0
+    return out
+
+
+def dot(xs, ys):
+    total = 0.0
+    for x, y in zip(xs, ys):
+        total += x * y
+    return total
+
+
+def norms(xs):
+    return [math.sqrt(x * x + 1.0) for x in xs]
+
+
+def total(xs):
+    return sum(x * 2 for x in xs)
+
+
+def labels(names):
+    out = []
+    for name in names:
+        out.append(name + "!")
+    return out
+
+
+a = [[random.random() for _ in range(20)] for _ in range(20)]
+b = [[random.random() for _ in range(20)] for _ in range(20)]
+matmul(a, b)
+transpose(a)
+xs = [random.random() for _ in range(500)]
+scale(xs, 3.0)
+dot(xs, xs)
+norms(xs)
+total(xs)
+labels(["n%d" % i for i in range(500)])
+
+"""
+$ python3 -m dynapyt.instrument.instrument --files ex_VectorizationAnalysis.py --analysis my_analysis.VectorizationAnalysis.VectorizationAnalysis
+Done with ex_VectorizationAnalysis.py
+$ python3 -m dynapyt.run_analysis --entry ex_VectorizationAnalysis.py --analysis my_analysis.VectorizationAnalysis.VectorizationAnalysis
+Setting coverage for None
+
+===== Vectorization Report =====
+Numeric loop nests that a NumPy operation could replace:
+
+1. matrix product (3 loops) at /path/to/example/ex_VectorizationAnalysis.py.orig:8 (iid: 4)
+   Iterations: 20 x 20 x 20 per execution, 8000 innermost iterations over 1 execution(s), values are float
+   NumPy idiom: c = a @ b  (numpy.matmul)
+   Estimated speedup: ~129x with the data already in NumPy arrays, ~26.5x including the conversion from lists
+
+2. element-wise map (1 loop) at /path/to/example/ex_VectorizationAnalysis.py.orig:25 (iid: 28)
+   Iterations: 500 per execution, 500 innermost iterations over 1 execution(s), values are float
+   NumPy idiom: out = xs * factor + 1.0
+   Estimated speedup: ~12x with the data already in NumPy arrays, ~2.6x including the conversion from lists
+
+3. reduction (1 loop) at /path/to/example/ex_VectorizationAnalysis.py.orig:32 (iid: 34)
+   Iterations: 500 per execution, 500 innermost iterations over 1 execution(s), values are float
+   NumPy idiom: total += numpy.dot(xs, ys)
+   Estimated speedup: ~12x with the data already in NumPy arrays, ~1.5x including the conversion from lists
+
+4. element-wise map (1 loop) at /path/to/example/ex_VectorizationAnalysis.py.orig:38 (iid: 41)
+   Iterations: 500 per execution, 500 innermost iterations over 1 execution(s), values are float
+   NumPy idiom: numpy.sqrt(xs * xs + 1.0)  (an array instead of the list comprehension)
+   Estimated speedup: ~12x with the data already in NumPy arrays, ~2.6x including the conversion from lists
+
+5. reduction (1 loop) at /path/to/example/ex_VectorizationAnalysis.py.orig:42 (iid: 45)
+   Iterations: 500 per execution, 500 innermost iterations over 1 execution(s), values are float and int
+   Note: ints and floats are mixed, NumPy would compute everything as float64
+   NumPy idiom: numpy.sum(xs * 2)
+   Estimated speedup: ~12x with the data already in NumPy arrays, ~2.6x including the conversion from lists
+
+6. transpose (2 loops) at /path/to/example/ex_VectorizationAnalysis.py.orig:17 (iid: 20)
+   Iterations: 20 x 20 per execution, 400 innermost iterations over 1 execution(s), values are float
+   NumPy idiom: t = m.T  (numpy.transpose)
+   Estimated speedup: ~11x with the data already in NumPy arrays, ~2.5x including the conversion from lists
+
+Speedups are estimated from the iteration counts with a fixed cost model, measure them on the real data before rewriting
+
+===== Analysis Complete =====
+"""
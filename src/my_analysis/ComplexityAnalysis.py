@@ -0,0 +1,65 @@
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import json
+
+from .findings import source_file
+from .reporting import get_sink
+from .source_index import iid_line
+
+
+class ComplexityAnalysis(BaseAnalysis):
+    """Counts loop iterations and function calls per site for the complexity driver.
+
+    One run only yields counts for a single input size; my_analysis.complexity
+    runs the program at several sizes and fits the counts to growth curves.
+    """
+
+    def __init__(self, output_file: str = "complexity_counts.json", **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.output_file = output_file
+        self.counts: Dict[Tuple[str, int], int] = {}  # {(file_path, iid): calls or iterations}
+        self.kinds: Dict[Tuple[str, int], Tuple[str, str]] = {}  # {(file_path, iid): (kind, name)}
+        self.report = get_sink()
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            self._count(dyn_ast, iid, "function", name)
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> None:
+        # The last call of a loop only finds the iterator exhausted and is not an iteration
+        if not isinstance(next_value, StopIteration):
+            try:
+                self._count(dyn_ast, iid, "for", "")
+            except Exception as e:
+                self.report.error("Error: enter_for execution exception: %s", e)
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> None:
+        if cond_value:
+            try:
+                self._count(dyn_ast, iid, "while", "")
+            except Exception as e:
+                self.report.error("Error: enter_while execution exception: %s", e)
+
+    def _count(self, dyn_ast: str, iid: int, kind: str, name: str) -> None:
+        key = (dyn_ast, iid)
+        count = self.counts.get(key)
+        if count is None:
+            self.kinds[key] = (kind, name)
+            count = 0
+        self.counts[key] = count + 1
+
+    def end_execution(self) -> None:
+        try:
+            sites = []
+            for (dyn_ast, iid), count in self.counts.items():
+                kind, name = self.kinds[(dyn_ast, iid)]
+                sites.append({"file": source_file(dyn_ast), "iid": iid, "line": iid_line(dyn_ast, iid),
+                              "kind": kind, "name": name, "count": count})
+            with open(self.output_file, "w", encoding="utf-8") as f:
+                json.dump({"sites": sites}, f)
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
@@ -0,0 +1,163 @@
+import importlib
+import importlib.resources as pkg_resources
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+
+from .call_context import CallTracker
+from .loop_context import LoopTracker
+
+# The analyses from the README table, run together when no list is given
+DEFAULT_ANALYSES = (
+    "RecursionAnalysis",
+    "SlowStringConcatAnalysis",
+    "NestedLoopingAnalysis",
+    "ObjectCreationInLoopAnalysis",
+    "UnusedVarAnalysis",
+    "InefficientApiAnalysis",
+    "LoopInvariantAnalysis",
+    "VectorizationAnalysis",
+    "MemoizationAnalysis",
+)
+
+# Contexts shared by all sub-analyses, {attribute: tracker class}
+SHARED_CONTEXTS = {
+    "loops": LoopTracker,
+    "calls": CallTracker,
+}
+
+# Hooks that move shared contexts, {hook: attributes of the contexts}
+CONTEXT_HOOKS = {
+    "enter_for": ("loops",), "exit_for": ("loops",), "normal_exit_for": ("loops",),
+    "enter_while": ("loops",), "exit_while": ("loops",), "normal_exit_while": ("loops",),
+    "_break": ("loops",), "_continue": ("loops",),
+    # Loop frames belong to calls, so calls move the loop context too
+    "function_enter": ("calls", "loops"), "function_exit": ("calls", "loops"),
+}
+
+
+class CompositeAnalysis(BaseAnalysis):
+    """Runs several analyses over a single instrumented execution.
+
+    The program is instrumented once for the union of the hooks of all
+    sub-analyses. Each hook is bound to a dispatcher built from a
+    precomputed hook-to-handler table, so an event only reaches the
+    sub-analyses that implement it, and a hook with a single handler calls
+    it directly. Sub-analyses share one loop tracker and one call tracker.
+    An option of a sub-analysis is prefixed with its class name.
+
+        --analysis "my_analysis.CompositeAnalysis.CompositeAnalysis;analyses=NestedLoopingAnalysis,RecursionAnalysis;NestedLoopingAnalysis.depth_threshold=3"
+    """
+
+    def __init__(self, analyses: Any = None, **kwargs) -> None:
+        # {(analysis, option): value} of the options given as Name.option=value
+        options = {tuple(key.rsplit(".", 1)): kwargs.pop(key) for key in list(kwargs) if "." in key}
+        super().__init__(**kwargs)
+
+        if analyses is None:
+            names = list(DEFAULT_ANALYSES)
+        elif isinstance(analyses, str):
+            names = [name.strip() for name in analyses.split(",") if name.strip()]
+        else:
+            names = list(analyses)
+        self.analyses = [self._load(name, kwargs, options) for name in names]
+        unused = sorted({analysis for analysis, _ in options} - self._option_prefixes())
+        if unused:
+            raise ValueError(f"Options given for analyses that are not run: {', '.join(unused)}")
+
+        # Loop and call contexts shared by all sub-analyses
+        for attribute, tracker_class in SHARED_CONTEXTS.items():
+            tracker = tracker_class()
+            setattr(self, attribute, tracker)
+            for analysis in self.analyses:
+                if isinstance(getattr(analysis, attribute, None), tracker_class):
+                    setattr(analysis, attribute, tracker)
+
+        self.dispatch_table = self._build_dispatch_table()
+        for hook, handlers in self.dispatch_table.items():
+            # Instance attributes show up in dir(), which is how DynaPyt selects hooks to instrument
+            setattr(self, hook, self._make_dispatcher(hook, handlers))
+
+    def _load(self, name: Any, kwargs: Dict[str, Any], options: Dict[Tuple[str, str], Any]) -> BaseAnalysis:
+        if isinstance(name, BaseAnalysis):
+            return name
+        if "." in name:
+            module_name, class_name = name.rsplit(".", 1)
+        else:
+            module_name, class_name = f"{__package__}.{name}", name
+        analysis_class = getattr(importlib.import_module(module_name), class_name)
+        # The options every analysis understands, and those addressed to this one by its class name or dotted path
+        own = {key: kwargs[key] for key in ("conf", "output_dir") if key in kwargs}
+        own.update((option, value) for (analysis, option), value in options.items()
+                   if analysis in (class_name, f"{module_name}.{class_name}"))
+        return analysis_class(**own)
+
+    def _option_prefixes(self) -> set:
+        """Names that address the options of the sub-analyses"""
+        prefixes = set()
+        for analysis in self.analyses:
+            analysis_class = type(analysis)
+            prefixes.add(analysis_class.__name__)
+            prefixes.add(f"{analysis_class.__module__}.{analysis_class.__name__}")
+        return prefixes
+
+    def _build_dispatch_table(self) -> Dict[str, Tuple[Callable, ...]]:
+        table: Dict[str, List[Callable]] = {}
+        for hook in _hook_names():
+            for analysis in self.analyses:
+                handler = getattr(analysis, hook, None)
+                if callable(handler):
+                    table.setdefault(hook, []).append(handler)
+        return {hook: tuple(handlers) for hook, handlers in table.items()}
+
+    def _make_dispatcher(self, hook: str, handlers: Tuple[Callable, ...]) -> Callable:
+        contexts = CONTEXT_HOOKS.get(hook)
+        if len(handlers) == 1:
+            return handlers[0]
+
+        if contexts is not None:
+            trackers = tuple(getattr(self, context) for context in contexts)
+
+            def dispatch_context_event(*args):
+                result = None
+                for tracker in trackers:
+                    tracker.begin_event()
+                try:
+                    for handler in handlers:
+                        value = handler(*args)
+                        if value is not None:
+                            result = value
+                finally:
+                    for tracker in trackers:
+                        tracker.end_event()
+                return result
+
+            dispatcher = dispatch_context_event
+        else:
+            def dispatch(*args):
+                result = None
+                for handler in handlers:
+                    value = handler(*args)
+                    if value is not None:
+                        result = value
+                return result
+
+            dispatcher = dispatch
+        dispatcher.__name__ = hook
+        dispatcher.__doc__ = handlers[0].__doc__
+        return dispatcher
+
+
+def _hook_names() -> List[str]:
+    """All hook names known to DynaPyt, read from its hook hierarchy"""
+    with pkg_resources.files("dynapyt.utils").joinpath("hierarchy.json").open("r") as f:
+        hierarchy = json.load(f)
+    names = []
+    pending = [hierarchy]
+    while pending:
+        for name, children in pending.pop().items():
+            if name not in names:
+                names.append(name)
+            pending.append(children)
+    return names
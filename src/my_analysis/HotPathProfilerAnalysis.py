@@ -0,0 +1,357 @@
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from array import array
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import os
+import threading
+
+from .call_context import CallTracker
+from .loop_context import LoopFrame, LoopTracker
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import format_location, get_source_index, iid_line
+from .task_local import TaskLocal
+
+ROOT_LABEL = "<module>"
+
+
+class SiteCounters:
+    """Execution counts and inclusive wall time of the sites of one file, indexed by iid"""
+
+    __slots__ = ("counts", "times")
+
+    def __init__(self, size: int) -> None:
+        self.counts = array("Q", bytes(8 * size))  # Calls of a function, iterations of a loop
+        self.times = array("d", bytes(8 * size))  # Seconds spent inside the site, inner sites included
+
+    def add(self, iid: int, count: int, elapsed: float) -> None:
+        if iid >= len(self.counts):
+            grow = iid + 1 - len(self.counts)
+            self.counts.extend(array("Q", bytes(8 * grow)))
+            self.times.extend(array("d", bytes(8 * grow)))
+        self.counts[iid] += count
+        self.times[iid] += elapsed
+
+    def merge(self, other: "SiteCounters") -> None:
+        """Add the counters of the same file recorded by another process"""
+        for iid, count in enumerate(other.counts):
+            if count or other.times[iid]:
+                self.add(iid, count, other.times[iid])
+
+
+class ContextTree:
+    """Calling context tree of functions and loops, node 0 is the module level.
+
+    Each distinct stack of sites becomes one node, so the current context is a
+    single int and the time spent in it is one array slot.
+    """
+
+    def __init__(self) -> None:
+        self.parents = array("l", [-1])
+        self.sites: List[Optional[tuple]] = [None]  # (kind, file, iid) of the site each node stands for
+        self.self_times = array("d", [0.0])  # Seconds spent in the node itself, outside its children
+        self._children: Dict[Tuple[int, tuple], int] = {}
+
+    def child(self, parent: int, site: tuple) -> int:
+        key = (parent, site)
+        node = self._children.get(key)
+        if node is None:
+            node = self._children[key] = len(self.sites)
+            self.parents.append(parent)
+            self.sites.append(site)
+            self.self_times.append(0.0)
+        return node
+
+    def merge(self, other: "ContextTree") -> None:
+        """Add the times of another process's tree, whose node numbers differ from this one's"""
+        nodes = [0]  # Node of this tree for each node of the other one
+        for node in range(1, len(other.sites)):
+            # A node is always added after its parent
+            nodes.append(self.child(nodes[other.parents[node]], other.sites[node]))
+        for node, seconds in enumerate(other.self_times):
+            self.self_times[nodes[node]] += seconds
+
+    def path(self, node: int) -> List[int]:
+        nodes = []
+        while node > 0:
+            nodes.append(node)
+            node = self.parents[node]
+        nodes.reverse()
+        return nodes
+
+
+class _TaskState:
+    __slots__ = ("node",)
+
+    def __init__(self) -> None:
+        self.node = 0  # Current calling context
+
+
+class _ThreadClock(threading.local):
+    """Time of the thread's last event and the task it happened in.
+
+    Tasks of one thread take turns, so the time between two events of the
+    thread is charged once, to the task of the earlier event, rather than
+    to every task that was merely suspended meanwhile.
+    """
+
+    def __init__(self) -> None:
+        self.last: Optional[float] = None
+        self.state: Optional[_TaskState] = None
+
+
+class HotPathProfilerAnalysis(BaseAnalysis):
+    """Attributes wall time to functions and loops.
+
+    Every call and loop entry moves the current calling context, and the time
+    between two such events is charged to the context that was current. At the
+    end of the execution the per-context times are written as collapsed stacks
+    for flamegraph tools, and the sites with the most inclusive time are
+    reported with the same source locations as the pattern analyses.
+    """
+
+    def __init__(self, output_file: str = "hotpath.folded", top: int = 20, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.output_file = output_file
+        self.top = int(top)  # Number of sites in the hot site report
+
+        self.calls = CallTracker()
+        self.loops = LoopTracker()
+        self.tree = ContextTree()
+        self.sites: Dict[str, SiteCounters] = {}  # {file_path: SiteCounters}
+        self.function_names: Dict[Tuple[str, int], str] = {}
+        self.tasks: TaskLocal[_TaskState] = TaskLocal(_TaskState)  # Context of each thread and asyncio task
+        self.clock = _ThreadClock()
+        self.report = get_sink()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            now = perf_counter()
+            state = self.tasks.get()
+            self._charge(state, now)
+            parent = self._live_context()
+            self._close_loops(self.loops.call_enter((dyn_ast, iid)), now)
+            frame = self.calls.enter((dyn_ast, iid))
+            frame.start = now
+            frame.node = state.node = self.tree.child(parent, ("function", dyn_ast, iid))
+            if (dyn_ast, iid) not in self.function_names:
+                self.function_names[(dyn_ast, iid)] = name
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        try:
+            now = perf_counter()
+            state = self.tasks.get()
+            self._charge(state, now)
+            # A return leaves the loops of the call without exit events
+            self._close_loops(self.loops.call_exit((dyn_ast, function_iid)), now)
+            # Frames above the function's own one were left through an exception
+            for frame in self.calls.exit((dyn_ast, function_iid)):
+                # Time of recursive calls is already inside the outermost call of the function
+                elapsed = now - frame.start if frame.recursion_depth == 1 else 0.0
+                self._site_counters(frame.function[0]).add(frame.function[1], 1, elapsed)
+            state.node = self._live_context()
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
+        return result
+
+    def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> None:
+        try:
+            self._enter_loop(dyn_ast, iid, "for", not isinstance(next_value, StopIteration))
+        except Exception as e:
+            self.report.error("Error: enter_for execution exception: %s", e)
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> None:
+        try:
+            self._enter_loop(dyn_ast, iid, "while", bool(cond_value))
+        except Exception as e:
+            self.report.error("Error: enter_while execution exception: %s", e)
+
+    def exit_for(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self._leave_loops(self.loops.exit((dyn_ast, iid)))
+        except Exception as e:
+            self.report.error("Error: exit_for execution exception: %s", e)
+
+    def exit_while(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self._leave_loops(self.loops.exit((dyn_ast, iid)))
+        except Exception as e:
+            self.report.error("Error: exit_while execution exception: %s", e)
+
+    def _break(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self._leave_loops(self.loops.break_((dyn_ast, loop_iid)))
+        except Exception as e:
+            self.report.error("Error: _break execution exception: %s", e)
+
+    def _continue(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.continue_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _continue execution exception: %s", e)
+
+    def _enter_loop(self, dyn_ast: str, iid: int, loop_type: str, proceeds: bool) -> None:
+        frame, is_new, popped = self.loops.enter((dyn_ast, iid), loop_type, proceeds)
+        state = self.tasks.get()
+        if is_new:
+            now = perf_counter()
+            self._charge(state, now)
+            self._close_loops(popped, now)
+            frame.start = now
+            frame.node = state.node = self.tree.child(self._context_of(frame.parent), (loop_type, dyn_ast, iid))
+        elif popped or (frame.node is not None and state.node != frame.node):
+            # Back in the loop body after inner loops that were left without an exit event
+            now = perf_counter()
+            self._charge(state, now)
+            self._close_loops(popped, now)
+            if frame.node is not None:
+                state.node = frame.node
+
+    def _leave_loops(self, popped: List[LoopFrame]) -> None:
+        if not popped:
+            return
+        now = perf_counter()
+        state = self.tasks.get()
+        self._charge(state, now)
+        self._close_loops(popped, now)
+        state.node = self._live_context()
+
+    def _close_loops(self, popped: List[LoopFrame], now: float) -> None:
+        for frame in popped:
+            self._site_counters(frame.loop_id[0]).add(frame.loop_id[1], frame.iterations, now - frame.start)
+
+    def _live_context(self) -> int:
+        """Context of the innermost site the current call is executing"""
+        return self._context_of(self.loops.top)
+
+    def _context_of(self, loop: Optional[LoopFrame]) -> int:
+        """Context of a loop if the current call is executing it, otherwise of the current call.
+
+        Stacks are only built from live frames of the current call, so a
+        loop of a caller never appears above the callee it called.
+        """
+        if loop is not None and loop.node is not None and self.loops.frame_of(loop.loop_id) is loop:
+            return loop.node
+        call = self.calls.top
+        return call.node if call is not None and call.node is not None else 0
+
+    def _charge(self, state: _TaskState, now: float) -> None:
+        """Charge the time since the thread's last event to the context that was current then"""
+        clock = self.clock
+        if clock.last is not None:
+            self.tree.self_times[clock.state.node] += now - clock.last
+        clock.last = now
+        clock.state = state
+
+    def _site_counters(self, dyn_ast: str) -> SiteCounters:
+        counters = self.sites.get(dyn_ast)
+        if counters is None:
+            # One slot per iid of the file, so recording a site never allocates
+            counters = self.sites[dyn_ast] = SiteCounters(get_source_index(dyn_ast).max_iid + 1)
+        return counters
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        self._charge(self.tasks.get(), perf_counter())
+        return {"tree": self.tree, "sites": self.sites, "function_names": self.function_names}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        self.tree.merge(state["tree"])
+        for dyn_ast, counters in state["sites"].items():
+            if dyn_ast in self.sites:
+                self.sites[dyn_ast].merge(counters)
+            else:
+                self.sites[dyn_ast] = counters
+        for function, name in state["function_names"].items():
+            self.function_names.setdefault(function, name)
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        # The child goes on in the contexts it was forked in, so the tree keeps its nodes and only their times start over
+        self.tree.self_times = array("d", bytes(8 * len(self.tree.self_times)))
+        self.sites = {}
+        self.clock = _ThreadClock()
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            self._charge(self.tasks.get(), perf_counter())
+            self._write_collapsed_stacks()
+            self._report_hot_sites()
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _label(self, site: Optional[tuple]) -> str:
+        if site is None:
+            return ROOT_LABEL
+        kind, dyn_ast, iid = site
+        name = self.function_names.get((dyn_ast, iid), "<function>") if kind == "function" else f"<{kind} loop>"
+        # Collapsed stacks separate frames with ";" and the count with the last space
+        return f"{name}@{_file_name(dyn_ast)}:{iid_line(dyn_ast, iid) or '?'}".replace(";", ",").replace(" ", "_")
+
+    def _write_collapsed_stacks(self) -> None:
+        tree = self.tree
+        labels = [self._label(site) for site in tree.sites]
+        with open(self.output_file, "w", encoding="utf-8") as f:
+            for node, seconds in enumerate(tree.self_times):
+                microseconds = int(seconds * 1e6)
+                if microseconds <= 0:
+                    continue
+                stack = ";".join([labels[0]] + [labels[n] for n in tree.path(node)])
+                f.write(f"{stack} {microseconds}\n")
+
+    def _busy_times(self) -> Dict[Tuple[str, int], float]:
+        """Time spent running inside each site, {(file_path, iid): seconds}.
+
+        Unlike the time between entering and leaving a site, this leaves out
+        the time a coroutine spent suspended while other tasks ran.
+        """
+        tree = self.tree
+        busy: Dict[Tuple[str, int], float] = {}
+        for node, seconds in enumerate(tree.self_times):
+            if seconds > 0:
+                # A recursive site appears on the path more than once but only runs once
+                for site in {tree.sites[n][1:] for n in tree.path(node)}:
+                    busy[site] = busy.get(site, 0.0) + seconds
+        return busy
+
+    def _report_hot_sites(self) -> None:
+        sites = []
+        total = sum(self.tree.self_times)
+        busy = self._busy_times()
+        for dyn_ast, counters in self.sites.items():
+            for iid, elapsed in enumerate(counters.times):
+                if elapsed > 0:
+                    sites.append((busy.get((dyn_ast, iid), 0.0), elapsed, dyn_ast, iid, counters.counts[iid]))
+        if not sites:
+            return
+        sites.sort(reverse=True)
+
+        self.report.info("\n===== Hot Path Profile =====")
+        self.report.info(f"Total profiled time: {total * 1e3:.2f} ms, collapsed stacks written to {self.output_file}")
+        self.report.info(f"Top {min(self.top, len(sites))} sites by inclusive time:")
+        for running, elapsed, dyn_ast, iid, count in sites[:self.top]:
+            name = self.function_names.get((dyn_ast, iid))
+            what = f"function {name}" if name is not None else "loop"
+            unit = "calls" if name is not None else "iterations"
+            share = 100.0 * running / total if total else 0.0
+            mean = running / count * 1e6 if count else 0.0
+            # Coroutines stay inside their sites while they await, which the running time leaves out
+            waiting = f", {(elapsed - running) * 1e3:.2f} ms more suspended" if elapsed > running * 1.01 + 1e-3 else ""
+            self.report.info(f"  {running * 1e3:9.2f} ms {share:5.1f}%  {what} at {format_location(dyn_ast, iid)}, "
+                             f"{count} {unit}, {mean:.1f} us each{waiting}")
+        self.report.info("\n===== Analysis Complete =====")
+
+
+def _file_name(dyn_ast: str) -> str:
+    name = os.path.basename(dyn_ast)
+    return name[:-5] if name.endswith(".orig") else name
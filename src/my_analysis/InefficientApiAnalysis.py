@@ -0,0 +1,266 @@
+from collections import deque
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .findings import Finding, get_findings_writer
+from .loop_context import LoopTracker
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import format_location
+
+# Sequences whose membership test and search methods compare elements one by one
+LINEAR_TYPES = (list, tuple, deque)
+
+# Unbound forms of the searching list methods, e.g. list.index(values, x)
+_UNBOUND_METHODS = {list.index: "index", list.count: "count", list.remove: "remove"}
+
+SUGGESTIONS = {
+    "in": "convert the {container} to a set once before the loop and test membership against the set",
+    "not in": "convert the {container} to a set once before the loop and test membership against the set",
+    "index": "build a dict from value to position once before the loop, e.g. {{v: i for i, v in enumerate(values)}}",
+    "count": "count all values once before the loop with collections.Counter",
+    "remove": "keep the elements in a set or dict and use discard() or pop(), which do not scan",
+}
+
+
+class ScanSite:
+    """Linear searches made by one membership test or list method call inside loops"""
+
+    __slots__ = ("operation", "container", "loop", "operations", "scanned", "max_size",
+                 "containers", "build_cost", "last_container")
+
+    def __init__(self, operation: str, container: str, loop: tuple) -> None:
+        self.operation = operation  # "in", "not in", "index", "count" or "remove"
+        self.container = container  # Type name of the searched sequence
+        self.loop = loop  # (kind, file, iid) of the innermost loop around the first search
+        self.operations = 0
+        self.scanned = 0  # Estimated elements compared, summed over all searches
+        self.max_size = 0
+        self.containers = 0  # Distinct sequences searched one after the other, each would need its own set
+        self.build_cost = 0  # Elements a set or dict built once per sequence would have to insert
+        self.last_container = 0  # id() of the sequence searched last
+
+    def record(self, sequence: Any, size: int, scanned: int) -> None:
+        self.operations += 1
+        self.scanned += scanned
+        if size > self.max_size:
+            self.max_size = size
+        if id(sequence) != self.last_container:
+            self.last_container = id(sequence)
+            self.containers += 1
+            self.build_cost += size
+
+    def merge(self, other: "ScanSite") -> None:
+        """Add the searches of the same site recorded by another process"""
+        self.operations += other.operations
+        self.scanned += other.scanned
+        self.max_size = max(self.max_size, other.max_size)
+        self.containers += other.containers
+        self.build_cost += other.build_cost
+
+    @property
+    def projected_cost(self) -> int:
+        """Elements touched with a hash lookup per search and one set or dict per sequence"""
+        return self.operations + self.build_cost
+
+    @property
+    def savings(self) -> int:
+        return self.scanned - self.projected_cost
+
+
+class InefficientApiAnalysis(BaseAnalysis):
+    """Finds linear searches of lists inside loops.
+
+    Membership tests and list.index, list.count and list.remove calls on
+    lists, tuples and deques compare elements one by one. Inside a loop this
+    makes the loop O(n*m), so every such site records the sequence sizes and
+    estimates the elements it compared: all of them for a miss, count and
+    remove, half of them for a hit, and the position plus one for index.
+    Method calls are recorded before they run, so an index() or remove() of
+    a missing value still counts its full scan when it raises ValueError.
+    """
+
+    def __init__(self, threshold: int = 10000, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.threshold = int(threshold)  # Compared elements from which a site is reported
+        self.loops = LoopTracker()
+        self.sites: Dict[Tuple[str, int], ScanSite] = {}  # {(file_path, iid): ScanSite}
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> None:
+        try:
+            self.loops.enter((dyn_ast, iid), "for", not isinstance(next_value, StopIteration))
+        except Exception as e:
+            self.report.error("Error: enter_for execution exception: %s", e)
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> None:
+        try:
+            self.loops.enter((dyn_ast, iid), "while", bool(cond_value))
+        except Exception as e:
+            self.report.error("Error: enter_while execution exception: %s", e)
+
+    def exit_for(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self.loops.exit((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: exit_for execution exception: %s", e)
+
+    def exit_while(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self.loops.exit((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: exit_while execution exception: %s", e)
+
+    def _break(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.break_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _break execution exception: %s", e)
+
+    def _continue(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.continue_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _continue execution exception: %s", e)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            self.loops.call_enter((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        # A return leaves the loops of the call without exit events
+        try:
+            self.loops.call_exit((dyn_ast, function_iid))
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
+        return result
+
+    def _in(self, dyn_ast: str, iid: int, left: Any, right: Any, result: Any) -> None:
+        if self.loops and isinstance(right, LINEAR_TYPES):
+            try:
+                size = len(right)
+                self._record(dyn_ast, iid, "in", right, size, (size + 1) // 2 if result else size)
+            except Exception as e:
+                self.report.error("Error: _in execution exception: %s", e)
+
+    def not_in(self, dyn_ast: str, iid: int, left: Any, right: Any, result: Any) -> None:
+        if self.loops and isinstance(right, LINEAR_TYPES):
+            try:
+                size = len(right)
+                self._record(dyn_ast, iid, "not in", right, size, size if result else (size + 1) // 2)
+            except Exception as e:
+                self.report.error("Error: not_in execution exception: %s", e)
+
+    def pre_call(self, dyn_ast: str, iid: int, function: Callable, pos_args: List, kw_args: Dict) -> None:
+        if not self.loops:
+            return
+        try:
+            method = _search_method(function, pos_args)
+            if method is None:
+                return
+            operation, sequence = method
+            # A miss scans the whole sequence, and remove shifts everything after the element it found,
+            # so only the scan of an index() that finds its value is lowered once the call returned
+            size = len(sequence)
+            self._record(dyn_ast, iid, operation, sequence, size, size)
+        except Exception as e:
+            self.report.error("Error: pre_call execution exception: %s", e)
+
+    def post_call(self, dyn_ast: str, iid: int, result: Any, call: Callable, pos_args: Tuple, kw_args: Dict) -> None:
+        if not self.loops:
+            return
+        try:
+            method = _search_method(call, pos_args)
+            if method is None or method[0] != "index" or not isinstance(result, int):
+                return
+            site = self.sites.get((dyn_ast, iid))
+            if site is not None:
+                site.scanned -= max(len(method[1]) - (result + 1), 0)
+        except Exception as e:
+            self.report.error("Error: post_call execution exception: %s", e)
+
+    def _record(self, dyn_ast: str, iid: int, operation: str, sequence: Any, size: int, scanned: int) -> None:
+        site = self.sites.get((dyn_ast, iid))
+        if site is None:
+            top = self.loops.top
+            site = self.sites[(dyn_ast, iid)] = ScanSite(operation, type(sequence).__name__, (top.kind,) + top.loop_id)
+        site.record(sequence, size, scanned)
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"sites": self.sites}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        for key, site in state["sites"].items():
+            if key in self.sites:
+                self.sites[key].merge(site)
+            else:
+                self.sites[key] = site
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        self.sites = {}
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            reported = [(key, site) for key, site in self.sites.items()
+                        if site.scanned >= self.threshold and site.savings > 0]
+            if not reported:
+                return
+            # Largest projected savings first
+            reported.sort(key=lambda item: item[1].savings, reverse=True)
+
+            self.report.info("\n===== Inefficient API Usage Report =====")
+            self.report.info("Linear searches inside loops, ranked by projected savings:")
+            for rank, ((dyn_ast, iid), site) in enumerate(reported, 1):
+                self._report_site(rank, dyn_ast, iid, site)
+                self._emit_finding(dyn_ast, iid, site)
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _report_site(self, rank: int, dyn_ast: str, iid: int, site: ScanSite) -> None:
+        what = f"'{site.operation}' test on a {site.container}" if site.operation in ("in", "not in") \
+            else f"{site.container}.{site.operation}()"
+        kind, loop_file, loop_iid = site.loop
+        self.report.info(f"\n{rank}. {what} at {format_location(dyn_ast, iid)}, inside the {kind} loop at "
+                         f"{format_location(loop_file, loop_iid)}")
+        self.report.info(f"   {site.operations} searches of up to {site.max_size} elements, "
+                         f"about {site.scanned} elements compared")
+        share = 100.0 * site.savings / site.scanned
+        self.report.info(f"   Suggestion: {SUGGESTIONS[site.operation].format(container=site.container)}")
+        self.report.info(f"   Projected: about {site.projected_cost} elements touched ({site.operations} lookups, "
+                         f"{site.build_cost} to build {site.containers} set(s) or dict(s)), saving {site.savings} ({share:.1f}%)")
+
+    def _emit_finding(self, dyn_ast: str, iid: int, site: ScanSite) -> None:
+        self.findings.emit(Finding.at(
+            "InefficientApiAnalysis", "R1-1", dyn_ast, iid,
+            f"linear '{site.operation}' search of a {site.container} inside a loop, about {site.scanned} elements compared",
+            metrics={"operation": site.operation, "container": site.container, "operations": site.operations,
+                     "scanned": site.scanned, "max_size": site.max_size, "projected": site.projected_cost},
+            cost=site.savings, cost_unit="element comparisons"))
+
+
+def _search_method(call: Callable, pos_args: Tuple) -> Optional[Tuple[str, Any]]:
+    """(operation, sequence) for a call of list.index, list.count or list.remove, None for any other call"""
+    owner = getattr(call, "__self__", None)
+    if isinstance(owner, LINEAR_TYPES):
+        name = getattr(call, "__name__", None)
+        if name in ("index", "count") or (name == "remove" and isinstance(owner, (list, deque))):
+            return name, owner
+        return None
+    operation = _UNBOUND_METHODS.get(call) if type(call).__name__ == "method_descriptor" else None
+    if operation is not None and pos_args and isinstance(pos_args[0], list):
+        return operation, pos_args[0]
+    return None
@@ -0,0 +1,311 @@
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import reprlib
+
+from .findings import Finding, get_findings_writer
+from .loop_context import LoopFrame, LoopTracker
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import format_location, get_source_index, iid_location
+
+# Results compared by value, other results only match if they are the very same object
+VALUE_TYPES = (int, float, complex, str, bytes, bool, type(None))
+
+SUGGESTIONS = {
+    "call": "call it once before the loop and reuse the result",
+    "attribute": "read the attribute into a local variable before the loop",
+    "subscript": "index once before the loop and keep the element in a local variable",
+    "operation": "compute it once before the loop",
+    "global": "bind the global to a local variable before the loop, local reads are cheaper",
+}
+
+
+class InvariantSite:
+    """Fingerprint of the last evaluation of one expression and how often it repeated"""
+
+    __slots__ = ("kind", "loop", "instance", "operands", "result", "evaluations", "first_iteration",
+                 "last_iteration", "invariant", "instances", "invariant_instances", "redundant", "total", "value")
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind  # Key of SUGGESTIONS
+        self.loop: Optional[tuple] = None  # (kind, file, iid) of the innermost loop around the expression
+        self.instance: Optional[LoopFrame] = None  # Execution of that loop the fingerprint belongs to
+        # Last fingerprint. The objects themselves are kept so their ids cannot be reused by new objects.
+        self.operands: tuple = ()
+        self.result: Any = None
+        self.evaluations = 0  # Evaluations in the current loop execution
+        self.first_iteration = 0
+        self.last_iteration = 0
+        self.invariant = True  # Every evaluation in the current loop execution had the same fingerprint
+        self.instances = 0  # Loop executions that evaluated the expression in more than one iteration
+        self.invariant_instances = 0  # Those of them in which it was invariant
+        self.redundant = 0  # Evaluations that repeated the first one of an invariant loop execution
+        self.total = 0  # Every evaluation inside a loop
+        self.value = ""  # repr of an invariant result
+
+    def evaluate(self, frame: LoopFrame, operands: tuple, result: Any) -> None:
+        self.total += 1
+        if frame is not self.instance:
+            self.close()
+            self.instance = frame
+            self.loop = (frame.kind,) + tuple(frame.loop_id)
+            self.evaluations = 1
+            self.first_iteration = self.last_iteration = frame.iterations
+            self.invariant = True
+            self.operands, self.result = operands, result
+            return
+        self.evaluations += 1
+        self.last_iteration = frame.iterations
+        if self.invariant:
+            if _same_operands(operands, self.operands) and _same_result(result, self.result):
+                return
+            self.invariant = False
+        # Only the first fingerprint of an execution is compared against, the others need not be kept
+        self.operands, self.result = (), None
+
+    def close(self) -> None:
+        """Fold the current loop execution into the totals"""
+        if self.instance is None:
+            return
+        if self.last_iteration > self.first_iteration:
+            self.instances += 1
+            if self.invariant:
+                self.invariant_instances += 1
+                self.redundant += self.evaluations - 1
+                self.value = reprlib.repr(self.result)
+        self.instance = None
+        self.operands, self.result = (), None
+
+    def merge(self, other: "InvariantSite") -> None:
+        """Add the closed loop executions of the same expression recorded by another process"""
+        self.instances += other.instances
+        self.invariant_instances += other.invariant_instances
+        self.redundant += other.redundant
+        self.total += other.total
+        if self.loop is None:
+            self.loop = other.loop
+        if not self.value:
+            self.value = other.value
+
+
+class LoopInvariantAnalysis(BaseAnalysis):
+    """Finds expressions that give the same result on every iteration of a loop.
+
+    Calls, attribute reads, subscripts, binary operations and reads of
+    globals inside functions are fingerprinted by the identity of their
+    operands and their result. Only the last fingerprint per expression is
+    kept. An expression whose fingerprint never changed during an execution
+    of its innermost loop could be computed once before that loop.
+    """
+
+    def __init__(self, threshold: int = 10, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.threshold = int(threshold)  # Redundant evaluations from which an expression is reported
+        self.loops = LoopTracker()
+        self.sites: Dict[Tuple[str, int], InvariantSite] = {}  # {(file_path, iid): InvariantSite}
+        self.global_reads: Dict[Tuple[str, int], bool] = {}  # {(file_path, iid): whether the name read is a global}
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> None:
+        try:
+            self.loops.enter((dyn_ast, iid), "for", not isinstance(next_value, StopIteration))
+        except Exception as e:
+            self.report.error("Error: enter_for execution exception: %s", e)
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> None:
+        try:
+            self.loops.enter((dyn_ast, iid), "while", bool(cond_value))
+        except Exception as e:
+            self.report.error("Error: enter_while execution exception: %s", e)
+
+    def exit_for(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self.loops.exit((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: exit_for execution exception: %s", e)
+
+    def exit_while(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self.loops.exit((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: exit_while execution exception: %s", e)
+
+    def _break(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.break_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _break execution exception: %s", e)
+
+    def _continue(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.continue_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _continue execution exception: %s", e)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            self.loops.call_enter((dyn_ast, iid))
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        # A return leaves the loops of the call without exit events
+        try:
+            self.loops.call_exit((dyn_ast, function_iid))
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
+        return result
+
+    def post_call(self, dyn_ast: str, iid: int, result: Any, call: Callable, pos_args: Tuple, kw_args: Dict) -> None:
+        # None is what procedures return, a call made for its side effects is not worth hoisting
+        if self.loops and result is not None and result is not call:
+            try:
+                operands = (call,) + tuple(pos_args) + (tuple(kw_args.values()) if kw_args else ())
+                self._evaluate(dyn_ast, iid, "call", operands, result)
+            except Exception as e:
+                self.report.error("Error: post_call execution exception: %s", e)
+
+    def read_attribute(self, dyn_ast: str, iid: int, base: Any, name: str, val: Any) -> None:
+        if self.loops:
+            try:
+                # A bound method is a new object on every read, what stays the same is its instance and function
+                method = getattr(val, "__func__", None)
+                result = (getattr(val, "__self__", None), method) if method is not None else val
+                self._evaluate(dyn_ast, iid, "attribute", (base,), result)
+            except Exception as e:
+                self.report.error("Error: read_attribute execution exception: %s", e)
+
+    def read_subscript(self, dyn_ast: str, iid: int, base: Any, sl: List[Any], val: Any) -> None:
+        if self.loops:
+            try:
+                self._evaluate(dyn_ast, iid, "subscript", (base,) + tuple(sl), val)
+            except Exception as e:
+                self.report.error("Error: read_subscript execution exception: %s", e)
+
+    def binary_operation(self, dyn_ast: str, iid: int, op: str, left: Any, right: Any, result: Any) -> None:
+        if self.loops:
+            try:
+                self._evaluate(dyn_ast, iid, "operation", (left, right), result)
+            except Exception as e:
+                self.report.error("Error: binary_operation execution exception: %s", e)
+
+    def read_identifier(self, dyn_ast: str, iid: int, val: Any) -> None:
+        if self.loops:
+            try:
+                if self._is_global_read(dyn_ast, iid):
+                    self._evaluate(dyn_ast, iid, "global", (), val)
+            except Exception as e:
+                self.report.error("Error: read_identifier execution exception: %s", e)
+
+    def _evaluate(self, dyn_ast: str, iid: int, kind: str, operands: tuple, result: Any) -> None:
+        site = self.sites.get((dyn_ast, iid))
+        if site is None:
+            site = self.sites[(dyn_ast, iid)] = InvariantSite(kind)
+        site.evaluate(self.loops.top, operands, result)
+
+    def _is_global_read(self, dyn_ast: str, iid: int) -> bool:
+        key = (dyn_ast, iid)
+        is_global = self.global_reads.get(key)
+        if is_global is None:
+            index = get_source_index(dyn_ast)
+            location = index.location(iid)
+            is_global = (location is not None and location.snippet.isidentifier() and index.in_function(location.line)
+                         and index.binding_scope(location.line, location.snippet) == "<module>")
+            self.global_reads[key] = is_global
+        return is_global
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        # Closing drops the loop frame and the fingerprinted objects, which stay in this process
+        for site in self.sites.values():
+            site.close()
+        return {"sites": self.sites}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        for key, site in state["sites"].items():
+            if key in self.sites:
+                self.sites[key].merge(site)
+            else:
+                self.sites[key] = site
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        self.sites = {}
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            for site in self.sites.values():
+                site.close()
+            reported = [(key, site) for key, site in self.sites.items()
+                        if site.invariant_instances and site.redundant >= self.threshold]
+            reported = _outermost(reported)
+            if not reported:
+                return
+            reported.sort(key=lambda item: item[1].redundant, reverse=True)
+
+            self.report.info("\n===== Loop Invariant Report =====")
+            self.report.info("Expressions with the same result on every iteration of their loop, ranked by redundant evaluations:")
+            for rank, ((dyn_ast, iid), site) in enumerate(reported, 1):
+                self._report_site(rank, dyn_ast, iid, site)
+                self._emit_finding(dyn_ast, iid, site)
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _report_site(self, rank: int, dyn_ast: str, iid: int, site: InvariantSite) -> None:
+        location = iid_location(dyn_ast, iid)
+        snippet = f" `{location.snippet}`" if location is not None and location.snippet else ""
+        loop_kind, loop_file, loop_iid = site.loop
+        self.report.info(f"\n{rank}. {site.kind}{snippet} at {format_location(dyn_ast, iid)}, "
+                         f"inside the {loop_kind} loop at {format_location(loop_file, loop_iid)}")
+        self.report.info(f"   Same result ({site.value}) on every iteration in {site.invariant_instances} of "
+                         f"{site.instances} loop execution(s), {site.redundant} of {site.total} evaluations were redundant")
+        self.report.info(f"   Suggestion: {SUGGESTIONS[site.kind]}")
+
+    def _emit_finding(self, dyn_ast: str, iid: int, site: InvariantSite) -> None:
+        self.findings.emit(Finding.at(
+            "LoopInvariantAnalysis", "R2-4", dyn_ast, iid,
+            f"loop-invariant {site.kind} evaluated {site.redundant} times more than needed",
+            metrics={"kind": site.kind, "evaluations": site.total, "instances": site.instances,
+                     "invariant_instances": site.invariant_instances, "value": site.value},
+            cost=site.redundant, cost_unit="evaluations"))
+
+
+def _same_operands(operands: tuple, previous: tuple) -> bool:
+    return len(operands) == len(previous) and all(a is b for a, b in zip(operands, previous))
+
+
+def _same_result(result: Any, previous: Any) -> bool:
+    if result is previous:
+        return True
+    if type(result) is tuple and type(previous) is tuple:
+        return _same_operands(result, previous)
+    return type(result) is type(previous) and type(result) in VALUE_TYPES and result == previous
+
+
+def _outermost(reported: List[Tuple[Tuple[str, int], InvariantSite]]) -> List[Tuple[Tuple[str, int], InvariantSite]]:
+    """Drop expressions that are part of another reported expression of the same loop, hoisting that one hoists them"""
+    spans = {}
+    for key, site in reported:
+        location = iid_location(*key)
+        if location is not None:
+            spans[key] = (key[0], site.loop, (location.line, location.column), (location.end_line, location.end_column))
+    kept = []
+    for key, site in reported:
+        span = spans.get(key)
+        inside = span is not None and any(
+            other != key and other_span[:2] == span[:2] and other_span[2] <= span[2] and span[3] <= other_span[3]
+            and (other_span[2], other_span[3]) != (span[2], span[3])
+            for other, other_span in spans.items())
+        if not inside:
+            kept.append((key, site))
+    return kept
@@ -0,0 +1,326 @@
+from collections import OrderedDict
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import pickle
+import time
+
+from .call_context import CallFrame, CallTracker
+from .findings import Finding, get_findings_writer
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import format_location
+
+# Cache sizes simulated by default, 128 is the default maxsize of functools.lru_cache
+DEFAULT_SIZES = "16,128,1024"
+
+# Argument tuples remembered by the unbounded cache of one function
+MAX_ARGUMENT_KEYS = 1 << 16
+
+# A size is recommended once it saves this share of the time the best simulated size saves
+GOOD_ENOUGH = 0.9
+
+
+class SimulatedCache:
+    """LRU cache of argument tuples with the hits and the time they would have saved"""
+
+    __slots__ = ("size", "keys", "lookups", "hits", "saved", "shadowed")
+
+    def __init__(self, size: Optional[int]) -> None:
+        self.size = size  # None for an unbounded cache, like lru_cache(maxsize=None)
+        # {argument tuple: result}, keys are compared by equality like lru_cache does, not by their hash alone
+        self.keys: "OrderedDict[tuple, Any]" = OrderedDict()
+        self.lookups = 0  # Calls that would still reach the cache
+        self.hits = 0
+        self.saved = 0.0  # Seconds spent in the calls that were hits
+        # Active calls that were hits. Their recursive calls would not happen with the cache and are not looked up.
+        self.shadowed = 0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def lookup(self, key: tuple) -> bool:
+        self.lookups += 1
+        if key in self.keys:
+            self.keys.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def store(self, key: tuple, result: Any) -> None:
+        """Add the result of a miss, which lru_cache only does once the call returned"""
+        if self.size is None:
+            if len(self.keys) < MAX_ARGUMENT_KEYS:
+                self.keys[key] = result
+            return
+        self.keys[key] = result
+        if len(self.keys) > self.size:
+            self.keys.popitem(last=False)
+
+    def merge(self, other: "SimulatedCache") -> None:
+        """Add the lookups of the same cache in another process, which had a cache of its own"""
+        self.lookups += other.lookups
+        self.hits += other.hits
+        self.saved += other.saved
+        if self.size is None:
+            for key, result in other.keys.items():
+                if len(self.keys) >= MAX_ARGUMENT_KEYS:
+                    break
+                self.keys.setdefault(key, result)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """State written to a shard, which keeps the argument tuples but not the results they are compared with"""
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state["keys"] = OrderedDict((key, None) for key in self.keys if _picklable(key))
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def label(self) -> str:
+        return "maxsize=None" if self.size is None else f"maxsize={self.size}"
+
+
+class MemoStats:
+    """Calls of one function and how caches of each simulated size would have served them"""
+
+    __slots__ = ("name", "calls", "completed", "unhashable_calls", "total_time", "caches", "changed_results")
+
+    def __init__(self, name: str, sizes: List[Optional[int]]) -> None:
+        self.name = name
+        self.calls = 0
+        self.completed = 0  # Calls that returned, calls that raised have no result to cache
+        self.unhashable_calls = 0  # Calls whose arguments cannot be used as a cache key
+        self.total_time = 0.0  # Seconds spent in the completed outermost calls, callees included
+        self.caches = [SimulatedCache(size) for size in sizes]
+        self.changed_results = 0  # Repeated argument tuples that returned a different result, i.e. not pure
+
+    @property
+    def unbounded(self) -> SimulatedCache:
+        return self.caches[-1]
+
+    def merge(self, other: "MemoStats") -> None:
+        """Add the calls of the same function made by another process"""
+        self.calls += other.calls
+        self.completed += other.completed
+        self.unhashable_calls += other.unhashable_calls
+        self.total_time += other.total_time
+        self.changed_results += other.changed_results
+        for mine, theirs in zip(self.caches, other.caches):
+            mine.merge(theirs)
+
+    def avoided(self, cache: SimulatedCache) -> float:
+        """Share of the hashable calls a cache would have answered or made unnecessary, only misses still run"""
+        hashable = self.calls - self.unhashable_calls
+        return 1.0 - (cache.lookups - cache.hits) / hashable if hashable else 0.0
+
+    def recommended(self) -> SimulatedCache:
+        """Smallest simulated cache that saves almost as much time as the best one"""
+        best = max(cache.saved for cache in self.caches)
+        return next(cache for cache in self.caches if cache.saved >= best * GOOD_ENOUGH)
+
+
+class MemoizationAnalysis(BaseAnalysis):
+    """Finds functions whose results a functools.lru_cache could reuse.
+
+    Every call looks its argument tuple up in simulated LRU caches of
+    several sizes plus an unbounded one. A hit saves the time the call took,
+    callees included, and the recursive calls it made are not looked up
+    since a cached call would not have made them. Results of repeated
+    argument tuples are compared with ==, a function that returned a
+    different result for the same arguments is not pure and is not
+    recommended for caching. Like lru_cache, the caches keep their argument
+    tuples and results alive.
+
+        --analysis "my_analysis.MemoizationAnalysis.MemoizationAnalysis;sizes=8,64,512"
+    """
+
+    def __init__(self, sizes: str = DEFAULT_SIZES, min_calls: int = 100, min_hit_rate: float = 0.5, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # The unbounded cache comes last, it bounds what any size can reach
+        self.sizes: List[Optional[int]] = sorted(int(size) for size in str(sizes).split(",") if size.strip()) + [None]
+        self.min_calls = int(min_calls)  # Calls from which a function is considered
+        # Share of the calls the recommended size avoids from which a function is reported
+        self.min_hit_rate = float(min_hit_rate)
+        # Per-thread stack of the active calls
+        self.calls = CallTracker()
+        self.functions: Dict[tuple, MemoStats] = {}  # {(file_path, function iid): MemoStats}
+        # {frame: (argument tuple, caches that missed, caches that hit)} of the active calls with hashable arguments
+        self.pending: Dict[CallFrame, Tuple[tuple, List[SimulatedCache], List[SimulatedCache]]] = {}
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            function = (dyn_ast, iid)
+            frame = self.calls.enter(function)
+            stats = self.functions.get(function)
+            if stats is None:
+                stats = self.functions[function] = MemoStats(name, self.sizes)
+            stats.calls += 1
+
+            key = _cache_key(tuple(arg() for arg in args))
+            if key is None:
+                stats.unhashable_calls += 1
+            else:
+                missed, hit = [], []
+                for cache in stats.caches:
+                    if not cache.shadowed:
+                        (hit if cache.lookup(key) else missed).append(cache)
+                for cache in hit:
+                    cache.shadowed += 1
+                self.pending[frame] = (key, missed, hit)
+            frame.start = time.perf_counter()
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        try:
+            now = time.perf_counter()
+            popped = self.calls.exit((dyn_ast, function_iid))
+            # Frames above the function's own one were left through an exception and cache nothing
+            for frame in popped[:-1]:
+                pending = self.pending.pop(frame, None)
+                if pending is not None:
+                    for cache in pending[2]:
+                        cache.shadowed -= 1
+            if popped:
+                self._complete(popped[-1], now - popped[-1].start, result)
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
+
+        return result
+
+    def _complete(self, frame: CallFrame, duration: float, result: Any) -> None:
+        stats = self.functions.get(frame.function)
+        if stats is None:
+            return
+        stats.completed += 1
+        if frame.recursion_depth == 1:
+            # Recursive calls are already part of the outermost call's duration
+            stats.total_time += duration
+        pending = self.pending.pop(frame, None)
+        if pending is None:
+            return
+        key, missed, hit = pending
+        for cache in missed:
+            cache.store(key, result)
+        for cache in hit:
+            cache.shadowed -= 1
+            cache.saved += duration
+        if stats.unbounded in hit and key in stats.unbounded.keys:
+            if not _same_result(stats.unbounded.keys[key], result):
+                stats.changed_results += 1
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"functions": self.functions}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process.
+
+        Argument tuples that cannot be pickled are not written to shards,
+        so the distinct argument tuples of the other processes may be
+        undercounted.
+        """
+        for function, stats in state["functions"].items():
+            if function in self.functions:
+                self.functions[function].merge(stats)
+            else:
+                self.functions[function] = stats
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        # A forked child inherits the caches of its parent, so they keep their contents and only the counts start over
+        for stats in self.functions.values():
+            stats.calls = stats.completed = stats.unhashable_calls = stats.changed_results = 0
+            stats.total_time = 0.0
+            for cache in stats.caches:
+                cache.lookups = cache.hits = 0
+                cache.saved = 0.0
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            reported = [(function, stats) for function, stats in self.functions.items()
+                        if stats.calls >= self.min_calls and not stats.changed_results
+                        and stats.avoided(stats.recommended()) >= self.min_hit_rate]
+            if not reported:
+                return
+            # Most time saved by the recommended size first
+            reported.sort(key=lambda item: item[1].recommended().saved, reverse=True)
+
+            self.report.info("\n===== Memoization Report =====")
+            self.report.info("Functions called repeatedly with the same arguments, ranked by time a cache would save:")
+            for rank, (function, stats) in enumerate(reported, 1):
+                self._report_function(rank, function, stats)
+                self._emit_finding(function, stats)
+            self.report.info("\nTimes are measured under instrumentation and only compare functions with each other. "
+                             "Caching is only safe for functions without side effects.")
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _report_function(self, rank: int, function: tuple, stats: MemoStats) -> None:
+        distinct = len(stats.unbounded.keys)
+        self.report.info(f"\n{rank}. {stats.name} at {format_location(*function)}")
+        self.report.info(f"   Calls: {stats.calls} with {distinct}{'+' if distinct >= MAX_ARGUMENT_KEYS else ''} "
+                         f"distinct argument tuples, {_format_seconds(stats.total_time)} in total")
+        if stats.unhashable_calls:
+            self.report.info(f"   {stats.unhashable_calls} calls have unhashable arguments and could not be cached")
+        for cache in stats.caches:
+            self.report.info(f"   {cache.label:>14}: {100.0 * cache.hit_rate:5.1f}% hits of {cache.lookups} lookups, "
+                             f"{100.0 * stats.avoided(cache):5.1f}% of the calls avoided, saves {_format_seconds(cache.saved)}")
+        best = stats.recommended()
+        self.report.info(f"   Suggestion: decorate it with @functools.lru_cache({best.label})")
+
+    def _emit_finding(self, function: tuple, stats: MemoStats) -> None:
+        best = stats.recommended()
+        self.findings.emit(Finding.at(
+            "MemoizationAnalysis", "R1-3", function[0], function[1],
+            f"an lru_cache({best.label}) on {stats.name} would avoid {100.0 * stats.avoided(best):.1f}% of its calls",
+            metrics={"function": stats.name, "calls": stats.calls, "distinct": len(stats.unbounded.keys),
+                     "unhashable_calls": stats.unhashable_calls, "total_seconds": round(stats.total_time, 6),
+                     "hit_rates": {cache.label: round(cache.hit_rate, 4) for cache in stats.caches},
+                     "avoided": {cache.label: round(stats.avoided(cache), 4) for cache in stats.caches},
+                     "recommended": best.label},
+            cost=round(best.saved, 6), cost_unit="seconds"))
+
+
+def _cache_key(args: tuple) -> Optional[Hashable]:
+    """Argument tuple as a cache key, None if it cannot be hashed"""
+    try:
+        hash(args)
+    except Exception:
+        return None
+    return args
+
+
+def _same_result(cached: Any, result: Any) -> bool:
+    """Whether a repeated call returned an equal result, results that cannot be compared count as equal"""
+    try:
+        return cached is result or bool(cached == result)
+    except Exception:
+        return True
+
+
+def _picklable(value: Any) -> bool:
+    try:
+        pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    return True
+
+
+def _format_seconds(seconds: float) -> str:
+    if seconds >= 1.0:
+        return f"{seconds:.2f} s"
+    return f"{seconds * 1000.0:.2f} ms"
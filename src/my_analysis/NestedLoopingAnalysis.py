@@ -1,389 +1,435 @@
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
-from typing import Any, Optional, Iterable
+from typing import Any, Callable, Iterable, List, Optional
 import sys
+import threading
+import time
+
+from .loop_context import LoopTracker
+from .findings import Finding, get_findings_writer
+from .governor import get_governor
+from .reporting import get_sink
+from .sampling import Sampler
+from .shards import register_shards, write_shard
+from .source_index import format_location
+from .streaming import LoopStats
+
+
+# Entries of a nested loop without a new loop chain after which its chains are considered settled
+SETTLE_AFTER = 256
+
+
+class _Processing(threading.local):
+    """Set while a hook runs on the thread, a hook runs to completion before another task of the thread can run"""
+
+    def __init__(self) -> None:
+        self.active = False
+
 
 class NestedLoopingAnalysis(BaseAnalysis):
-    def __init__(self, depth_threshold: int = 2, **kwargs) -> None:
+    def __init__(self, depth_threshold: int = 2, sample_size: int = 0, sample_rate: int = 1, **kwargs) -> None:
         super().__init__(**kwargs)
 
-        # Dictionary to record loop count and occurrence
-        self.active_loops = {}  # {(file_path, iid): {"type": "for/while", "count": 1, "depth": 1}}
-
-        # Record the loop hierarchy - each loop ID maps to its parent loop ID
-        self.loop_hierarchy = {}  # {(file_path, iid): (parent_file_path, parent_iid)}
+        # Stack of the currently executing loops, each frame links to its parent loop
+        self.loops = LoopTracker()
 
         # Store nested structure
         self.loop_data = {}  # Stores information about each loop
         self.max_depth_seen = 0  # Tracks the maximum nested depth
-        self.depth_threshold = depth_threshold  # Threshold setting
+        self.depth_threshold = int(depth_threshold)  # Threshold setting
         self.nested_loops_detected = set()  # Records detected nested loops
         self.break_continue_stats = {}  # Tracks break and continue usage in loops
 
-        # Debugging and safety measures
-        self.currently_processing = False
+        # Bounded per-loop iteration statistics, memory does not grow with the number of iterations
+        self.loop_stats = {}  # {(file_path, iid): LoopStats}
+        self.sample_size = int(sample_size)  # Size of the per-loop value sample, 0 disables sampling
+
+        # Iterations and entries are always counted, only 1-in-sample_rate of them per loop are fully processed:
+        # the iteration value offered to the sample, and the loop chain of an entry into a nested loop
+        sample_rate = int(sample_rate)
+        self.sampler = Sampler(sample_rate) if sample_rate > 1 else None
+
+        # Loops whose chains stopped changing are settled, their later entries are only counted
+        self.governor = get_governor()
+        self.governed = {}  # {(file_path, iid): GovernedSite}
+        self.chain_found_at = {}  # {(file_path, iid): processed entries when the loop's last new chain was found}
+
+        # Report output, written in batches by a background thread
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Re-entrancy guard against events raised while a hook runs, e.g. by the __repr__ of a sampled value.
+        # It is per thread so that a hook running on one thread does not drop the events of the others.
+        self.processing = _Processing()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
 
     def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> Optional[Any]:
         """Record entering for loop"""
-        if self.currently_processing:
+        if self.processing.active:
             return None
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
-            loop_id = (dyn_ast, iid)
-
-            # Initialize loop if it is seen for the first time
-            if loop_id not in self.active_loops:
-                # Find the parent loop (the deepest active loop)
-                parent_loop = None
-                max_depth = -1
-
-                for other_id, other_loop in self.active_loops.items():
-                    if other_id != loop_id and other_loop["depth"] > max_depth:
-                        parent_loop = other_id
-                        max_depth = other_loop["depth"]
-
-                depth = 1
-                if parent_loop:
-                    self.loop_hierarchy[loop_id] = parent_loop
-                    depth = self.active_loops[parent_loop]["depth"] + 1
-
-                self.active_loops[loop_id] = {
-                    "type": "for",
-                    "count": 1,
-                    "depth": depth,
-                    "iterations": []
-                }
-
-                # If depth exceeds the threshold, record as nested loop
-                if depth >= self.depth_threshold:
-                    self.currently_processing = False
-                    self._record_nested_structure(loop_id)
-            else:
-                # Loop is already active, increment the count
-                self.active_loops[loop_id]["count"] += 1
+            # The StopIteration that ends the loop is not an iteration
+            proceeds = not isinstance(next_value, StopIteration)
+            frame = self._enter_loop((dyn_ast, iid), "for", proceeds)
 
             # Record iteration value
-            try:
-                self.active_loops[loop_id]["iterations"].append(str(next_value))
-            except:
-                self.active_loops[loop_id]["iterations"].append("<non-serializable>")
-
-            # Update max depth
-            current_depth = self.active_loops[loop_id]["depth"]
-            if current_depth > self.max_depth_seen:
-                self.max_depth_seen = current_depth
+            if proceeds:
+                stats = self.loop_stats[frame.loop_id]
+                weight = 1.0 if self.sampler is None or stats.sample is None else self.sampler.sample(frame.loop_id)
+                if weight:
+                    stats.record_iteration(next_value, weight)
+                else:
+                    stats.count_iteration()
         except Exception as e:
-            print(f"Error: enter_for execution exception: {e}")
+            self.report.error("Error: enter_for execution exception: %s", e)
         finally:
-            self.currently_processing = False
+            self.processing.active = False
 
         return None
 
     def exit_for(self, dyn_ast: str, iid: int) -> None:
         """Record exiting for loop"""
-        if self.currently_processing:
+        if self.processing.active:
             return
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
-            loop_id = (dyn_ast, iid)
-            if loop_id in self.active_loops:
-                depth = self.active_loops[loop_id]["depth"]
-
-                # Remove from active loops
-                self.active_loops.pop(loop_id)
-
-                # Also clear its children loops (if any)
-                children_to_remove = []
-                for child_id, parent_id in self.loop_hierarchy.items():
-                    if parent_id == loop_id:
-                        children_to_remove.append(child_id)
-
-                for child_id in children_to_remove:
-                    if child_id in self.active_loops:
-                        self.active_loops.pop(child_id)
+            self._exit_loop((dyn_ast, iid))
         except Exception as e:
-            print(f"Error: exit_for execution exception: {e}")
+            self.report.error("Error: exit_for execution exception: %s", e)
         finally:
-            self.currently_processing = False
-
-    def normal_exit_for(self, dyn_ast: str, iid: int) -> None:
-        """Record normal exit from for loop"""
-        if self.currently_processing:
-            return
-
-        self.currently_processing = True
-
-        try:
-            loop_id = (dyn_ast, iid)
-            if loop_id not in self.break_continue_stats:
-                self.break_continue_stats[loop_id] = {"normal_exits": 0, "breaks": 0, "continues": 0}
-            self.break_continue_stats[loop_id]["normal_exits"] += 1
-        except Exception as e:
-            print(f"Error: normal_exit_for execution exception: {e}")
-        finally:
-            self.currently_processing = False
+            self.processing.active = False
 
     def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> Optional[bool]:
         """Record entering while loop"""
-        if self.currently_processing:
+        if self.processing.active:
             return None
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
-            loop_id = (dyn_ast, iid)
+            # The final condition check that ends the loop is not an iteration
+            proceeds = bool(cond_value)
+            frame = self._enter_loop((dyn_ast, iid), "while", proceeds)
 
-            # Initialize loop if it is seen for the first time
-            if loop_id not in self.active_loops:
-                # Find the parent loop (the deepest active loop)
-                parent_loop = None
-                max_depth = -1
-
-                for other_id, other_loop in self.active_loops.items():
-                    if other_id != loop_id and other_loop["depth"] > max_depth:
-                        parent_loop = other_id
-                        max_depth = other_loop["depth"]
-
-                depth = 1
-                if parent_loop:
-                    self.loop_hierarchy[loop_id] = parent_loop
-                    depth = self.active_loops[parent_loop]["depth"] + 1
-
-                self.active_loops[loop_id] = {
-                    "type": "while",
-                    "count": 1,
-                    "depth": depth,
-                    "conditions": [cond_value]
-                }
-
-                # If depth exceeds the threshold, record as nested loop
-                if depth >= self.depth_threshold:
-                    self._record_nested_structure(loop_id)
-            else:
-                # Loop is already active, increment the count
-                self.active_loops[loop_id]["count"] += 1
-                self.active_loops[loop_id]["conditions"].append(cond_value)
-
-            # Update max depth
-            current_depth = self.active_loops[loop_id]["depth"]
-            if current_depth > self.max_depth_seen:
-                self.max_depth_seen = current_depth
+            if proceeds:
+                self.loop_stats[frame.loop_id].record_iteration()
         except Exception as e:
-            print(f"Error: enter_while execution exception: {e}")
+            self.report.error("Error: enter_while execution exception: %s", e)
         finally:
-            self.currently_processing = False
+            self.processing.active = False
 
         return None
 
     def exit_while(self, dyn_ast: str, iid: int) -> None:
         """Record exiting while loop"""
-        if self.currently_processing:
+        if self.processing.active:
             return
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
-            loop_id = (dyn_ast, iid)
-            if loop_id in self.active_loops:
-                depth = self.active_loops[loop_id]["depth"]
-
-                # Remove from active loops
-                self.active_loops.pop(loop_id)
-
-                # Also clear its children loops (if any)
-                children_to_remove = []
-                for child_id, parent_id in self.loop_hierarchy.items():
-                    if parent_id == loop_id:
-                        children_to_remove.append(child_id)
-
-                for child_id in children_to_remove:
-                    if child_id in self.active_loops:
-                        self.active_loops.pop(child_id)
+            self._exit_loop((dyn_ast, iid))
         except Exception as e:
-            print(f"Error: exit_while execution exception: {e}")
+            self.report.error("Error: exit_while execution exception: %s", e)
         finally:
-            self.currently_processing = False
-
-    def normal_exit_while(self, dyn_ast: str, iid: int) -> None:
-        """Record normal exit from while loop"""
-        if self.currently_processing:
-            return
-
-        self.currently_processing = True
-
-        try:
-            loop_id = (dyn_ast, iid)
-            if loop_id not in self.break_continue_stats:
-                self.break_continue_stats[loop_id] = {"normal_exits": 0, "breaks": 0, "continues": 0}
-            self.break_continue_stats[loop_id]["normal_exits"] += 1
-        except Exception as e:
-            print(f"Error: normal_exit_while execution exception: {e}")
-        finally:
-            self.currently_processing = False
+            self.processing.active = False
 
     def _break(self, dyn_ast: str, iid: int, loop_iid: int) -> Optional[bool]:
         """Record break statement"""
-        if self.currently_processing:
+        if self.processing.active:
             return None
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
             loop_id = (dyn_ast, loop_iid)
+            self._close_loops(self.loops.break_(loop_id))
 
             if loop_id not in self.break_continue_stats:
                 self.break_continue_stats[loop_id] = {"normal_exits": 0, "breaks": 0, "continues": 0}
             self.break_continue_stats[loop_id]["breaks"] += 1
         except Exception as e:
-            print(f"Error: _break execution exception: {e}")
+            self.report.error("Error: _break execution exception: %s", e)
         finally:
-            self.currently_processing = False
+            self.processing.active = False
 
         return None
 
     def _continue(self, dyn_ast: str, iid: int, loop_iid: int) -> Optional[bool]:
         """Record continue statement"""
-        if self.currently_processing:
+        if self.processing.active:
             return None
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
             loop_id = (dyn_ast, loop_iid)
+            # The exit event sent before a continue did not end the loop
+            self.loops.continue_(loop_id)
 
             if loop_id not in self.break_continue_stats:
                 self.break_continue_stats[loop_id] = {"normal_exits": 0, "breaks": 0, "continues": 0}
             self.break_continue_stats[loop_id]["continues"] += 1
         except Exception as e:
-            print(f"Error: _continue execution exception: {e}")
+            self.report.error("Error: _continue execution exception: %s", e)
         finally:
-            self.currently_processing = False
+            self.processing.active = False
 
         return None
 
-    def _get_loop_chain(self, loop_id):
-        """Get the complete chain from the outermost to the current loop"""
-        chain = []
-        current = loop_id
-
-        # Prevent infinite loop
-        visited = set()
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        """Record a call, the loops it executes belong to it"""
+        if self.processing.active:
+            return
 
-        while current and current not in visited:
-            chain.append(current)
-            visited.add(current)
-            current = self.loop_hierarchy.get(current)
+        self.processing.active = True
 
-        # Reverse the chain to display from outer to inner
-        chain.reverse()
-        return chain
+        try:
+            self._close_loops(self.loops.call_enter((dyn_ast, iid)))
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+        finally:
+            self.processing.active = False
 
-    def _record_nested_structure(self, loop_id):
-        if self.currently_processing:
-            return None
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        """Record the end of a call, a return leaves the loops of the call without exit events"""
+        if self.processing.active:
+            return result
 
-        self.currently_processing = True
+        self.processing.active = True
 
         try:
-            loop_chain = self._get_loop_chain(loop_id)
-
-            # Ensure all loops in the chain are active
-            for l_id in loop_chain:
-                if l_id not in self.active_loops:
-                    return
-
-            # Ensure chain length exceeds threshold
-            if len(loop_chain) >= self.depth_threshold:
-                signature = tuple(loop_chain)
-
-                if signature not in self.nested_loops_detected:
-                    self.nested_loops_detected.add(signature)
-
-                    # Record outer loop information
-                    outer_loop_id = loop_chain[0]
-                    outer_loop = self.active_loops.get(outer_loop_id)
-                    if not outer_loop:
-                        return
-
-                    if outer_loop_id not in self.loop_data:
-                        self.loop_data[outer_loop_id] = {
-                            "type": outer_loop["type"],
-                            "max_depth": len(loop_chain),
-                            "nested_loops": []
-                        }
-                    else:
-                        if len(loop_chain) > self.loop_data[outer_loop_id]["max_depth"]:
-                            self.loop_data[outer_loop_id]["max_depth"] = len(loop_chain)
-
-                    # Record inner loops
-                    inner_loops = []
-                    for i in range(1, len(loop_chain)):
-                        inner_id = loop_chain[i]
-                        inner_loop = self.active_loops.get(inner_id)
-                        if not inner_loop:
-                            continue
-                        inner_loops.append((
-                            inner_id[0],  # File path
-                            inner_id[1],  # iid
-                            inner_loop["type"]  # Loop type
-                        ))
-
-                    # Add to nested loop list to avoid duplicates
-                    if inner_loops and inner_loops not in self.loop_data[outer_loop_id]["nested_loops"]:
-                        self.loop_data[outer_loop_id]["nested_loops"].append(inner_loops)
+            self._close_loops(self.loops.call_exit((dyn_ast, function_iid)))
         except Exception as e:
-            print(f"Error: _record_nested_structure execution exception: {e}")
+            self.report.error("Error: function_exit execution exception: %s", e)
         finally:
-            self.currently_processing = False
+            self.processing.active = False
+
+        return result
+
+    def _enter_loop(self, loop_id, loop_type, proceeds):
+        """Push a newly entered loop or advance the active one, returns its frame"""
+        frame, is_new, popped = self.loops.enter(loop_id, loop_type, proceeds)
+        self._close_loops(popped)
+
+        if is_new:
+            # Initialize loop if it is seen for the first time
+            if loop_id not in self.loop_stats:
+                self.loop_stats[loop_id] = LoopStats(loop_type, self.sample_size)
+
+            # Update max depth
+            if frame.depth > self.max_depth_seen:
+                self.max_depth_seen = frame.depth
+
+            # If depth exceeds the threshold, record as nested loop
+            if frame.depth >= self.depth_threshold:
+                self._govern_nested_structure(frame)
+
+        return frame
+
+    def _exit_loop(self, loop_id):
+        """Record a loop exit event, inner loops that are still active are popped with the loop"""
+        self._close_loops(self.loops.exit(loop_id))
+
+    def _close_loops(self, popped):
+        """Record the trip counts of loop executions that ended"""
+        for frame in popped:
+            self.loop_stats[frame.loop_id].end_entry(frame.iterations)
+            # DynaPyt reports a normal exit as an exit event after the header event that ended the loop
+            if frame.finished:
+                if frame.loop_id not in self.break_continue_stats:
+                    self.break_continue_stats[frame.loop_id] = {"normal_exits": 0, "breaks": 0, "continues": 0}
+                self.break_continue_stats[frame.loop_id]["normal_exits"] += 1
+
+    def _print_loop_stats(self, loop_id, indent):
+        stats = self.loop_stats.get(loop_id)
+        if stats is None:
+            return
+        self.report.info(f"{indent}Iterations: {stats.describe()}")
+        if stats.trips.entries:
+            self.report.info(f"{indent}Trip count histogram: {stats.trips.describe()}")
+        if stats.sample is not None and stats.sample.items:
+            self.report.info(f"{indent}Sampled values: {', '.join(stats.sample.items)}")
+
+    def _govern_nested_structure(self, frame):
+        """Record the chain of a nested loop entry unless the loop's chains are settled"""
+        governed = self.governed.get(frame.loop_id)
+        if governed is None:
+            governed = self.governed[frame.loop_id] = self.governor.site("NestedLoopingAnalysis", frame.loop_id)
+        if governed.settled:
+            governed.counted += 1
+            return
+        # A chain that only occurs in skipped entries is missed
+        if self.sampler is not None and not self.sampler.sample((frame.loop_id, "entry")):
+            return
+        start = time.perf_counter()
+        if self._record_nested_structure(frame):
+            self.chain_found_at[frame.loop_id] = governed.events
+        self.governor.charge(governed, time.perf_counter() - start)
+        if governed.events - self.chain_found_at.get(frame.loop_id, 0) >= SETTLE_AFTER:
+            self.governor.settle(governed)
+
+    def _record_nested_structure(self, frame):
+        """Returns whether the chain of the entry was not seen before"""
+        # Complete chain from the outermost to the current loop
+        loop_chain = frame.chain()
+
+        # Ensure chain length exceeds threshold
+        if len(loop_chain) >= self.depth_threshold:
+            signature = tuple(f.loop_id for f in loop_chain)
+
+            if signature not in self.nested_loops_detected:
+                self.nested_loops_detected.add(signature)
+
+                # Record outer loop information
+                outer_loop = loop_chain[0]
+                outer_loop_id = outer_loop.loop_id
+
+                if outer_loop_id not in self.loop_data:
+                    self.loop_data[outer_loop_id] = {
+                        "type": outer_loop.kind,
+                        "max_depth": len(loop_chain),
+                        "nested_loops": []
+                    }
+                else:
+                    if len(loop_chain) > self.loop_data[outer_loop_id]["max_depth"]:
+                        self.loop_data[outer_loop_id]["max_depth"] = len(loop_chain)
+
+                # Record inner loops
+                inner_loops = []
+                for inner_loop in loop_chain[1:]:
+                    inner_loops.append((
+                        inner_loop.loop_id[0],  # File path
+                        inner_loop.loop_id[1],  # iid
+                        inner_loop.kind  # Loop type
+                    ))
+
+                # Add to nested loop list to avoid duplicates
+                if inner_loops and inner_loops not in self.loop_data[outer_loop_id]["nested_loops"]:
+                    self.loop_data[outer_loop_id]["nested_loops"].append(inner_loops)
+                return True
+        return False
+
+    def _emit_finding(self, loop_id, data):
+        stats = self.loop_stats.get(loop_id)
+        # The work done by a nest is the iterations of its innermost loops
+        innermost = {(structure[-1][0], structure[-1][1]) for structure in data["nested_loops"]}
+        work = sum(self.loop_stats[inner].iterations for inner in innermost if inner in self.loop_stats)
+        metrics = {"max_depth": data["max_depth"], "structures": len(data["nested_loops"])}
+        if stats is not None:
+            metrics.update(iterations=stats.iterations, entries=stats.trips.entries,
+                           mean_trips=round(stats.trips.mean(), 2), max_trips=stats.trips.max)
+        self.findings.emit(Finding.at(
+            "NestedLoopingAnalysis", "R2-2", loop_id[0], loop_id[1],
+            f"{data['type']} loop nests loops {data['max_depth']} levels deep",
+            metrics=metrics, cost=work, cost_unit="innermost iterations"))
+
+    def shard_state(self):
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"loop_data": self.loop_data, "max_depth_seen": self.max_depth_seen,
+                "nested_loops_detected": self.nested_loops_detected,
+                "break_continue_stats": self.break_continue_stats, "loop_stats": self.loop_stats}
+
+    def merge_shard(self, state):
+        """Add the aggregates of another process"""
+        self.max_depth_seen = max(self.max_depth_seen, state["max_depth_seen"])
+        self.nested_loops_detected |= state["nested_loops_detected"]
+        for loop_id, data in state["loop_data"].items():
+            mine = self.loop_data.get(loop_id)
+            if mine is None:
+                self.loop_data[loop_id] = data
+                continue
+            mine["max_depth"] = max(mine["max_depth"], data["max_depth"])
+            for inner_loops in data["nested_loops"]:
+                if inner_loops not in mine["nested_loops"]:
+                    mine["nested_loops"].append(inner_loops)
+        for loop_id, counts in state["break_continue_stats"].items():
+            mine = self.break_continue_stats.setdefault(loop_id, {"normal_exits": 0, "breaks": 0, "continues": 0})
+            for name, count in counts.items():
+                mine[name] = mine.get(name, 0) + count
+        for loop_id, stats in state["loop_stats"].items():
+            if loop_id in self.loop_stats:
+                self.loop_stats[loop_id].merge(stats)
+            else:
+                self.loop_stats[loop_id] = stats
+
+    def reset_shard(self):
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        self.loop_data = {}
+        self.max_depth_seen = 0
+        self.nested_loops_detected = set()
+        self.break_continue_stats = {}
+        # The loops the child was forked in still end in the child
+        self.loop_stats = {loop_id: LoopStats(stats.kind, self.sample_size) for loop_id, stats in self.loop_stats.items()}
 
     def end_execution(self):
         """Generate report at the end of execution"""
+        if write_shard(self):
+            return
         try:
-            print("\n===== Nested Looping Analysis Report =====")
+            self.report.info("\n===== Nested Looping Analysis Report =====")
 
             if self.max_depth_seen >= self.depth_threshold:
-                print(f"Warning: Possible performance issue - maximum nesting depth is {self.max_depth_seen}")
+                self.report.info(f"Warning: Possible performance issue - maximum nesting depth is {self.max_depth_seen}")
 
                 # Ensure correct counting - use loop_data rather than nested_loops_detected
                 total_nested_structures = sum(len(data["nested_loops"]) for data in self.loop_data.values())
-                print(f"Detected {total_nested_structures} unique nested loop structures")
+                self.report.info(f"Detected {total_nested_structures} unique nested loop structures")
 
                 # Detailed report for each outer loop and its nesting
                 for loop_id, data in self.loop_data.items():
-                    print(f"\nFor {loop_id[0]}: {data['type']} loop (iid: {loop_id[1]}):")
-                    print(f"  Maximum nesting depth: {data['max_depth']}")
-                    print(f"  Nested loop structures:")
+                    self.report.info(f"\nOuter {data['type']} loop at {format_location(*loop_id)}:")
+                    self.report.info(f"  Maximum nesting depth: {data['max_depth']}")
+                    self._print_loop_stats(loop_id, "  ")
+                    self.report.info(f"  Nested loop structures:")
 
                     for i, nested_loop in enumerate(data["nested_loops"]):
-                        print(f"  Structure #{i+1}:")
+                        self.report.info(f"  Structure #{i+1}:")
                         for j, loop in enumerate(nested_loop):
-                            print(f"    Level {j+1}: {loop[2]} loop at {loop[0]} (iid: {loop[1]})")
+                            self.report.info(f"    Level {j+1}: {loop[2]} loop at {format_location(loop[0], loop[1])}")
+                            self._print_loop_stats((loop[0], loop[1]), "      ")
 
                     # Add break/continue stats
                     if loop_id in self.break_continue_stats:
                         stats = self.break_continue_stats[loop_id]
-                        print(f"  Loop control flow stats:")
-                        print(f"    Normal exits: {stats['normal_exits']}")
-                        print(f"    Breaks: {stats['breaks']}")
-                        print(f"    Continues: {stats['continues']}")
+                        self.report.info(f"  Loop control flow stats:")
+                        self.report.info(f"    Normal exits: {stats['normal_exits']}")
+                        self.report.info(f"    Breaks: {stats['breaks']}")
+                        self.report.info(f"    Continues: {stats['continues']}")
 
                         # Provide additional recommendations based on break/continue frequency
                         if stats.get('breaks', 0) > 5:
-                            print("    Suggestion: High use of break may indicate optimization opportunities in the loop logic")
+                            self.report.info("    Suggestion: High use of break may indicate optimization opportunities in the loop logic")
                         if stats.get('continues', 0) > 5:
-                            print("    Suggestion: High use of continue may indicate filter conditions should be moved upfront")
+                            self.report.info("    Suggestion: High use of continue may indicate filter conditions should be moved upfront")
+
+                    self._emit_finding(loop_id, data)
 
                     # Performance recommendations
                     if data["max_depth"] >= 3:
-                        print("  Performance suggestion: Consider refactoring code to reduce nesting depth, or use vectorization")
+                        self.report.info("  Performance suggestion: Consider refactoring code to reduce nesting depth, or use vectorization")
                     elif data["max_depth"] == 2:
-                        print("  Performance suggestion: Monitor the performance of this double loop for large datasets")
+                        self.report.info("  Performance suggestion: Check how this double loop scales with my_analysis.complexity before it meets large datasets")
             else:
-                print(f"No loops exceeded the threshold depth ({self.depth_threshold}). Maximum nesting depth was {self.max_depth_seen}.")
+                self.report.info(f"No loops exceeded the threshold depth ({self.depth_threshold}). Maximum nesting depth was {self.max_depth_seen}.")
 
-            print("\n===== Analysis Complete =====")
+            if self.sampler is not None:
+                self.report.info(f"\nSampling: {self.sampler.describe()}")
+                self.report.info("Iteration counts, trip counts and control flow stats are exact, nested loop structures "
+                                 "and sampled values come from the fully processed events")
+
+            governed = self.governor.describe("NestedLoopingAnalysis")
+            if governed is not None:
+                self.report.info(f"\nGovernor: {governed}")
+
+            self.report.info("\n===== Analysis Complete =====")
         except Exception as e:
-            print(f"Error: end_execution execution exception: {e}")
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
@@ -1,253 +1,505 @@
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+import gc
+import sys
+import time
+import tracemalloc
+
+from .loop_context import LoopTracker
+from .findings import Finding, get_findings_writer
+from .governor import get_governor
+from .reporting import DEBUG, INFO, as_bool, get_sink
+from .sampling import Estimate, Sampler
+from .shards import register_shards, write_shard
+from .source_index import format_location, iid_line
+
+# Loops whose peak allocation reaches this many bytes are reported, at most MEMORY_REPORT_LOOPS of them
+MEMORY_REPORT_BYTES = 64 * 1024
+MEMORY_REPORT_LOOPS = 10
+
+
+class LoopMemory:
+    """Allocations of one loop, aggregated over all its executions"""
+
+    __slots__ = ("kind", "executions", "iterations", "net_bytes", "max_net_bytes", "peak_bytes",
+                 "net_blocks", "gc_collections")
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.executions = 0
+        self.iterations = 0
+        self.net_bytes = 0  # Bytes still allocated when the executions ended, summed over them
+        self.max_net_bytes = 0
+        self.peak_bytes = 0  # Most bytes allocated on top of the loop's starting point during one execution
+        self.net_blocks = 0  # Memory blocks still allocated when the executions ended, summed over them
+        self.gc_collections = 0  # Garbage collections that ran during the executions
+
+    def record(self, iterations, net_bytes, peak_bytes, net_blocks, gc_collections):
+        self.executions += 1
+        self.iterations += iterations
+        self.net_bytes += net_bytes
+        self.max_net_bytes = max(self.max_net_bytes, net_bytes)
+        self.peak_bytes = max(self.peak_bytes, peak_bytes)
+        self.net_blocks += net_blocks
+        self.gc_collections += gc_collections
+
+    def merge(self, other):
+        """Add the executions of the same loop recorded by another process"""
+        self.executions += other.executions
+        self.iterations += other.iterations
+        self.net_bytes += other.net_bytes
+        self.max_net_bytes = max(self.max_net_bytes, other.max_net_bytes)
+        self.peak_bytes = max(self.peak_bytes, other.peak_bytes)
+        self.net_blocks += other.net_blocks
+        self.gc_collections += other.gc_collections
+
+
+class _MemoryWindow:
+    """Traced memory at the start of one loop execution"""
+
+    __slots__ = ("current", "blocks", "collections", "peak", "mark")
+
+    def __init__(self, current, blocks, collections, mark):
+        self.current = current
+        self.blocks = blocks
+        self.collections = collections
+        self.peak = current  # Highest traced memory seen during the execution so far
+        self.mark = mark  # Peak reported by tracemalloc when the execution started
+
+
+class _Identities:
+    """Objects seen at one site during one loop execution, only the first identity is kept"""
+
+    __slots__ = ("first", "differs", "count")
+
+    def __init__(self, first):
+        self.first = first  # id() of the first object
+        self.differs = False  # Set once an object with another id was seen
+        self.count = Estimate()  # Estimated number of all creations at the site during the execution
+
+    def add(self, obj_id):
+        if obj_id != self.first:
+            self.differs = True
+
 
 class ObjectCreationInLoopAnalysis(BaseAnalysis):
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, debug: bool = False, sample_rate: int = 1, trace_memory: bool = True, **kwargs) -> None:
         super().__init__(**kwargs)
-        # 开启DEBUG模式
-        self.debug = True
+        # DEBUG模式, 默认关闭
+        self.debug = as_bool(debug)
+        self.report = get_sink(level=DEBUG if self.debug else INFO)
+        self.findings = get_findings_writer()
+
+        # Only 1-in-sample_rate creations per site are fully processed, 1 processes all of them
+        sample_rate = int(sample_rate)
+        self.sampler = Sampler(sample_rate) if sample_rate > 1 else None
+
+        # Creation sites found to be repeated are settled and their later creations only counted
+        self.governor = get_governor()
+        self.governed = {}  # {(file_path, iid, type): GovernedSite}
 
         # Loop tracking
-        self.loop_stack = []
-        self.loop_depth = 0
+        self.loops = LoopTracker()
 
-        # Track object creations by location and type
-        self.object_creations = {}
+        # Creation sites are keyed by (file_path, iid, type) and loops by (file_path, loop iid)
+        # Track object creations by location and type during each loop execution, dropped when it closes
+        self.object_creations = {}  # {LoopFrame: {site: _Identities}}
 
         # Track objects created multiple times in the same loop
-        self.repeated_creations = {}
+        self.repeated_creations = {}  # {site: data}
 
-        # Track objects by their memory address to detect new allocations
-        self.objects_in_loop = {}
-
-        # Keep track of variable assignments within loops
-        self.loop_assignments = {}
+        # Keep track of variable assignments within loop executions, dropped when they close
+        self.loop_assignments = {}  # {LoopFrame: {site: _Identities}}
 
         # Line numbers where objects are created
-        self.creation_locations = {}
+        self.creation_locations = {}  # {site: set of lines}
 
-        # Track memory allocations in loops
-        self.loop_allocations = []
+        # Allocation accounting per loop with tracemalloc, started at the first loop so instrumenting stays cheap
+        self.trace_memory = as_bool(trace_memory)
+        self.loop_memory = {}  # {(file_path, loop iid): LoopMemory}
+        self._windows = {}  # {LoopFrame: _MemoryWindow} of the loops being executed
+        self._started_tracing = False
+        self._owns_tracing = False
+        self._gc_collections = 0
 
-    def enter_for(self, dyn_ast, iid, *args, **kwargs):
-        if self.debug:
-            print(f"[DEBUG] Entering for loop with iid {iid}, current loop_stack: {self.loop_stack}")
-        # 检查整个循环栈中是否已存在当前 iid
-        if any(existing_iid == iid for _, existing_iid in self.loop_stack):
-            self._record_iteration(iid)
-            if self.debug:
-                print(f"[DEBUG] Iteration recorded in for loop with iid {iid}")
-        else:
-            self.loop_depth += 1
-            self.loop_stack.append(("for", iid))
-            self._reset_loop_tracking(iid)
-            if self.debug:
-                print(f"[DEBUG] New for loop started. Loop depth: {self.loop_depth}")
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
 
-    def enter_while(self, dyn_ast, iid, *args, **kwargs):
-        if self.debug:
-            print(f"[DEBUG] Entering while loop with iid {iid}, current loop_stack: {self.loop_stack}")
-        # 检查整个循环栈中是否已存在当前 iid
-        if any(existing_iid == iid for _, existing_iid in self.loop_stack):
-            self._record_iteration(iid)
-            if self.debug:
-                print(f"[DEBUG] Iteration recorded in while loop with iid {iid}")
-        else:
-            self.loop_depth += 1
-            self.loop_stack.append(("while", iid))
-            self._reset_loop_tracking(iid)
-            if self.debug:
-                print(f"[DEBUG] New while loop started. Loop depth: {self.loop_depth}")
+    def enter_for(self, dyn_ast, iid, next_value, *args, **kwargs):
+        # The StopIteration that ends the loop is not an iteration
+        self._enter_loop(dyn_ast, iid, "for", not isinstance(next_value, StopIteration))
+
+    def enter_while(self, dyn_ast, iid, cond_value, *args, **kwargs):
+        self._enter_loop(dyn_ast, iid, "while", bool(cond_value))
+
+    def exit_for(self, dyn_ast, iid, *args, **kwargs):
+        self._exit_loop(dyn_ast, iid, "for")
+
+    def exit_while(self, dyn_ast, iid, *args, **kwargs):
+        self._exit_loop(dyn_ast, iid, "while")
 
     def normal_exit_for(self, dyn_ast, iid, *args, **kwargs):
-        if self.loop_stack and self.loop_stack[-1][1] == iid:
-            if self.debug:
-                print(f"[DEBUG] Exiting for loop with iid {iid}")
-            loop_type, loop_iid = self.loop_stack.pop()
-            self._analyze_loop_objects(loop_iid)
-            self.loop_depth = max(0, self.loop_depth - 1)
-            if self.debug:
-                print(f"[DEBUG] For loop exited. Current loop depth: {self.loop_depth}")
+        self._exit_loop(dyn_ast, iid, "for")
 
     def normal_exit_while(self, dyn_ast, iid, *args, **kwargs):
-        if self.loop_stack and self.loop_stack[-1][1] == iid:
-            if self.debug:
-                print(f"[DEBUG] Exiting while loop with iid {iid}")
-            loop_type, loop_iid = self.loop_stack.pop()
-            self._analyze_loop_objects(loop_iid)
-            self.loop_depth = max(0, self.loop_depth - 1)
-            if self.debug:
-                print(f"[DEBUG] While loop exited. Current loop depth: {self.loop_depth}")
+        self._exit_loop(dyn_ast, iid, "while")
 
-    def _break(self, dyn_ast, iid, *args, **kwargs):
-        if self.loop_stack and self.loop_stack[-1][1] == iid:
-            if self.debug:
-                print(f"[DEBUG] Break encountered in loop with iid {iid}")
-            loop_type, loop_iid = self.loop_stack.pop()
-            self._analyze_loop_objects(loop_iid)
-            self.loop_depth = max(0, self.loop_depth - 1)
-            if self.debug:
-                print(f"[DEBUG] Loop exited via break. Current loop depth: {self.loop_depth}")
+    def _break(self, dyn_ast, iid, loop_iid, *args, **kwargs):
+        if self.debug:
+            self.report.debug("[DEBUG] Break encountered in loop with iid %s", loop_iid)
+        self._close_loops(self.loops.break_((dyn_ast, loop_iid)), "break")
 
-    def _continue(self, dyn_ast, iid, *args, **kwargs):
-        if self.loop_stack:
-            loop_type, loop_iid = self.loop_stack[-1]
-            self._record_iteration(loop_iid)
-            if self.debug:
-                print(f"[DEBUG] Continue in loop with iid {loop_iid}")
+    def _continue(self, dyn_ast, iid, loop_iid, *args, **kwargs):
+        # The exit event sent before a continue did not end the loop, its next header event counts the iteration
+        self.loops.continue_((dyn_ast, loop_iid))
+        if self.debug:
+            self.report.debug("[DEBUG] Continue in loop with iid %s", loop_iid)
+
+    def function_enter(self, dyn_ast, iid, *args, **kwargs):
+        self._close_loops(self.loops.call_enter((dyn_ast, iid)), "call")
+
+    def function_exit(self, dyn_ast, function_iid, name, result, *args, **kwargs):
+        # A return leaves the loops of the call without exit events
+        self._close_loops(self.loops.call_exit((dyn_ast, function_iid)), "return")
+        return result
 
     def _list(self, dyn_ast, iid, val, *args, **kwargs):
-        if self.loop_depth > 0 and val is not None:
+        if self.loops and val is not None:
             if self.debug:
-                print(f"[DEBUG] List created in loop (iid {iid}).")
+                self.report.debug("[DEBUG] List created in loop (iid %s).", iid)
             self._record_object_creation("list", iid, val, dyn_ast)
 
     def _tuple(self, dyn_ast, iid, val, *args, **kwargs):
-        if self.loop_depth > 0 and val is not None:
+        if self.loops and val is not None:
             if self.debug:
-                print(f"[DEBUG] Tuple created in loop (iid {iid}).")
+                self.report.debug("[DEBUG] Tuple created in loop (iid %s).", iid)
             self._record_object_creation("tuple", iid, val, dyn_ast)
 
     def _set(self, dyn_ast, iid, val, *args, **kwargs):
-        if self.loop_depth > 0 and val is not None:
+        if self.loops and val is not None:
             if self.debug:
-                print(f"[DEBUG] Set created in loop (iid {iid}).")
+                self.report.debug("[DEBUG] Set created in loop (iid %s).", iid)
             self._record_object_creation("set", iid, val, dyn_ast)
 
     def dictionary(self, dyn_ast, iid, val, *args, **kwargs):
-        if self.loop_depth > 0 and val is not None:
+        if self.loops and val is not None:
             if self.debug:
-                print(f"[DEBUG] Dict created in loop (iid {iid}).")
+                self.report.debug("[DEBUG] Dict created in loop (iid %s).", iid)
             self._record_object_creation("dict", iid, val, dyn_ast)
 
     def write(self, dyn_ast, iid, old_vals, new_val, *args, **kwargs):
-        if self.loop_depth > 0 and new_val is not None:
+        if self.loops and new_val is not None:
             obj_type = self._get_object_type(new_val)
-            if obj_type and self.loop_stack:
-                loop_iid = self.loop_stack[-1][1]
-                if loop_iid not in self.loop_assignments:
-                    self.loop_assignments[loop_iid] = {}
-                key = f"{iid}:{obj_type}"
-                if key not in self.loop_assignments[loop_iid]:
-                    self.loop_assignments[loop_iid][key] = []
-                self.loop_assignments[loop_iid][key].append(id(new_val))
-                if self.debug:
-                    print(f"[DEBUG] Variable assignment in loop (iid {loop_iid}): key {key} id {id(new_val)}")
-                if len(self.loop_assignments[loop_iid][key]) > 1:
-                    addresses = set(self.loop_assignments[loop_iid][key])
-                    if len(addresses) > 1:
-                        if key not in self.repeated_creations:
-                            self.repeated_creations[key] = {
-                                'count': 0,
-                                'locations': [],
-                                'type': obj_type,
-                                'iid': iid,
-                                'dyn_ast': dyn_ast
-                            }
-                        self.repeated_creations[key]['count'] += 1
-                        try:
-                            import ast
-                            with open(dyn_ast, 'r') as f:
-                                tree = ast.parse(f.read())
-                            for node in ast.walk(tree):
-                                if hasattr(node, 'lineno') and getattr(node, 'lineno', 0) > 0:
-                                    self.repeated_creations[key]['locations'].append(node.lineno)
-                                    break
-                        except:
-                            pass
-
-    def memory_access(self, dyn_ast, iid, val, *args, **kwargs):
-        if self.loop_depth > 0 and val is not None:
-            obj_type = self._get_object_type(val)
-            if obj_type and obj_type in ('list', 'dict', 'set', 'tuple'):
-                self.loop_allocations.append({
-                    'iid': iid,
+            if obj_type:
+                governed = self._governed(dyn_ast, iid, obj_type)
+                if governed.settled:
+                    self._count_settled(governed, (dyn_ast, iid, obj_type))
+                    return
+                start = time.perf_counter()
+                self._record_assignment(obj_type, iid, new_val, dyn_ast, governed)
+                self.governor.charge(governed, time.perf_counter() - start)
+
+    def _record_assignment(self, obj_type, iid, new_val, dyn_ast, governed):
+        weight = self._sample_weight(dyn_ast, iid)
+        if not weight:
+            return
+        frame = self.loops.top
+        assignments = self.loop_assignments.get(frame)
+        if assignments is None:
+            assignments = self.loop_assignments[frame] = {}
+        key = (dyn_ast, iid, obj_type)
+        identities = assignments.get(key)
+        if identities is None:
+            identities = assignments[key] = _Identities(id(new_val))
+        else:
+            identities.add(id(new_val))
+        if self.debug:
+            self.report.debug("[DEBUG] Variable assignment in loop (iid %s): key %s id %s", frame.loop_id[1], key, id(new_val))
+        if identities.differs:
+            if key not in self.repeated_creations:
+                self.repeated_creations[key] = {
+                    'count': Estimate(),
+                    'locations': [],
                     'type': obj_type,
-                    'size': self._estimate_object_size(val),
-                    'obj_id': id(val)
-                })
-                if self.debug:
-                    print(f"[DEBUG] Memory access recorded for {obj_type} (iid {iid}, size {self._estimate_object_size(val)})")
+                    'iid': iid,
+                    'dyn_ast': dyn_ast
+                }
+            self.repeated_creations[key]['count'].add(weight)
+            line = iid_line(dyn_ast, iid)
+            if line is not None and line not in self.repeated_creations[key]['locations']:
+                self.repeated_creations[key]['locations'].append(line)
+            self.governor.settle(governed)
 
     def end_execution(self, *args, **kwargs):
+        # Loops still running when the program ends, e.g. after sys.exit() inside one
+        if self.loops:
+            self._close_loops(reversed(self.loops.top.chain()), "end of execution")
+        self._windows.clear()
+        self._stop_tracing()
+        if write_shard(self):
+            return
         if self.repeated_creations:
-            print("\n=== Object Creation in Loops Analysis ===\n")
-            print("Detected repeated object creation in loops:")
+            self.report.info("\n=== Object Creation in Loops Analysis ===\n")
+            self.report.info("Detected repeated object creation in loops:")
             for key, data in self.repeated_creations.items():
                 obj_type = data['type']
                 count = data['count']
-                locations = set(data['locations'])
-                if count >= 3:
+                locations = sorted(set(data['locations']))
+                if count.total >= 3:
                     location_str = ', '.join(map(str, locations)) if locations else "unknown"
-                    print(f"  - {obj_type} created repeatedly ({count} times) at line(s): {location_str}")
-                    print("    Impact: Increased memory allocation and garbage collection overhead")
+                    self.report.info(f"  - {obj_type} created repeatedly ({count.describe()} times) at line(s): {location_str}")
+                    self._emit_finding(key, data, locations)
+                    self.report.info("    Impact: Increased memory allocation and garbage collection overhead")
                     if obj_type == 'list':
-                        print("    Suggestion: Move list creation outside the loop and clear it between iterations if needed")
-                        print("               Consider using list comprehension instead of building list in loop")
+                        self.report.info("    Suggestion: Move list creation outside the loop and clear it between iterations if needed")
+                        self.report.info("               Consider using list comprehension instead of building list in loop")
                     elif obj_type == 'dict':
-                        print("    Suggestion: Create the dictionary before the loop and update it inside")
+                        self.report.info("    Suggestion: Create the dictionary before the loop and update it inside")
                     elif obj_type == 'set':
-                        print("    Suggestion: Initialize the set outside the loop, or use set comprehension")
-                    print()
-            print("\nGeneral advice for improving loop performance:")
-            print("1. Move object creation outside loops when possible")
-            print("2. Use comprehensions (list/dict/set) instead of building collections in loops")
-            print("3. Consider using generators for large data processing")
-            print("4. Preallocate containers to their expected size when possible")
-
-    def _reset_loop_tracking(self, loop_iid):
-        if loop_iid not in self.objects_in_loop:
-            self.objects_in_loop[loop_iid] = {}
-        if self.debug:
-            print(f"[DEBUG] Loop tracking reset for iid {loop_iid}")
+                        self.report.info("    Suggestion: Initialize the set outside the loop, or use set comprehension")
+                    self.report.info("")
+            self.report.info("\nGeneral advice for improving loop performance:")
+            self.report.info("1. Move object creation outside loops when possible")
+            self.report.info("2. Use comprehensions (list/dict/set) instead of building collections in loops")
+            self.report.info("3. Consider using generators for large data processing")
+            self.report.info("4. Preallocate containers to their expected size when possible")
+            if self.sampler is not None:
+                self.report.info(f"\nSampling: {self.sampler.describe()}")
+                self.report.info("Counts marked ~ are estimates with 95% error bounds")
+            governed = self.governor.describe("ObjectCreationInLoopAnalysis")
+            if governed is not None:
+                self.report.info(f"\nGovernor: {governed}")
+        self._report_loop_memory()
+        self.report.flush()
 
-    def _record_object_creation(self, obj_type, iid, value, dyn_ast):
-        if not self.loop_stack:
+    def shard_state(self):
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"repeated_creations": self.repeated_creations, "loop_memory": self.loop_memory}
+
+    def merge_shard(self, state):
+        """Add the aggregates of another process"""
+        for key, data in state["repeated_creations"].items():
+            mine = self.repeated_creations.get(key)
+            if mine is None:
+                self.repeated_creations[key] = data
+                continue
+            mine['count'].merge(data['count'])
+            for line in data['locations']:
+                if line not in mine['locations']:
+                    mine['locations'].append(line)
+        for loop_id, memory in state["loop_memory"].items():
+            if loop_id in self.loop_memory:
+                self.loop_memory[loop_id].merge(memory)
+            else:
+                self.loop_memory[loop_id] = memory
+
+    def reset_shard(self):
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        # Sites already found to repeat stay known, settled sites only count into them
+        self.repeated_creations = {key: dict(data, count=Estimate(), locations=list(data['locations']))
+                                   for key, data in self.repeated_creations.items()}
+        self.object_creations = {}
+        self.loop_assignments = {}
+        self.loop_memory = {}
+
+    def _report_loop_memory(self):
+        reported = sorted(((key, memory) for key, memory in self.loop_memory.items()
+                           if memory.peak_bytes >= MEMORY_REPORT_BYTES),
+                          key=lambda item: item[1].peak_bytes, reverse=True)[:MEMORY_REPORT_LOOPS]
+        if not reported:
             return
-        loop_iid = self.loop_stack[-1][1]
-        key = f"{iid}:{obj_type}"
-        if loop_iid not in self.object_creations:
-            self.object_creations[loop_iid] = {}
-        if key not in self.object_creations[loop_iid]:
-            self.object_creations[loop_iid][key] = []
-        self.object_creations[loop_iid][key].append(id(value))
+        self.report.info("\n=== Memory Allocated in Loops ===\n")
+        for (dyn_ast, iid), memory in reported:
+            per_iteration = memory.net_bytes / memory.iterations if memory.iterations else 0
+            self.report.info(f"  - {memory.kind} loop at {format_location(dyn_ast, iid)}: peak {_format_bytes(memory.peak_bytes)} "
+                             f"above its start, {memory.executions} execution(s), {memory.iterations} iteration(s)")
+            self.report.info(f"    Still allocated when it ends: up to {_format_bytes(memory.max_net_bytes)} per execution, "
+                             f"{_format_bytes(per_iteration)} per iteration on average, "
+                             f"{memory.net_blocks / memory.executions:.0f} memory blocks per execution")
+            self.report.info(f"    Garbage collections during the loop: {memory.gc_collections}")
+            self.findings.emit(Finding.at(
+                "ObjectCreationInLoopAnalysis", "R2-3", dyn_ast, iid,
+                f"{memory.kind} loop allocates up to {_format_bytes(memory.peak_bytes)} per execution",
+                metrics={slot: getattr(memory, slot) for slot in LoopMemory.__slots__},
+                cost=memory.peak_bytes, cost_unit="bytes"))
+
+    def _enter_loop(self, dyn_ast, iid, loop_type, proceeds):
         if self.debug:
-            print(f"[DEBUG] Recorded creation of {obj_type} (key {key}, object id {id(value)}) in loop iid {loop_iid}")
-        try:
-            import ast
-            with open(dyn_ast, 'r') as f:
-                tree = ast.parse(f.read())
-            for node in ast.walk(tree):
-                if hasattr(node, 'lineno') and getattr(node, 'lineno', 0) > 0:
-                    if key not in self.creation_locations:
-                        self.creation_locations[key] = set()
-                    self.creation_locations[key].add(node.lineno)
-                    break
-        except Exception as e:
+            self.report.debug("[DEBUG] Entering %s loop with iid %s, current loop depth: %s", loop_type, iid, self.loops.depth)
+        frame, is_new, popped = self.loops.enter((dyn_ast, iid), loop_type, proceeds)
+        self._close_loops(popped, "left without an exit event")
+        if is_new:
+            if self.trace_memory:
+                self._open_window(frame)
+            if self.debug:
+                self.report.debug("[DEBUG] New %s loop started. Loop depth: %s", loop_type, self.loops.depth)
+        elif proceeds and self.debug:
+            self.report.debug("[DEBUG] Iteration %s of %s loop with iid %s", frame.iterations, loop_type, iid)
+
+    def _exit_loop(self, dyn_ast, iid, reason):
+        # Inner loops still on the stack are closed together with this one
+        self._close_loops(self.loops.exit((dyn_ast, iid)), reason)
+
+    def _close_loops(self, popped, reason):
+        for frame in popped:
+            if self.debug:
+                self.report.debug("[DEBUG] Exiting loop with iid %s (%s)", frame.loop_id[1], reason)
+            self._close_window(frame)
+            self._analyze_loop_objects(frame)
+            self.loop_assignments.pop(frame, None)
             if self.debug:
-                print(f"[DEBUG] Failed to record creation location: {e}")
+                self.report.debug("[DEBUG] Loop exited. Current loop depth: %s", self.loops.depth)
 
-    def _record_iteration(self, loop_iid):
-        if loop_iid in self.objects_in_loop:
-            self.objects_in_loop[loop_iid]['iterations'] = self.objects_in_loop[loop_iid].get('iterations', 0) + 1
+    def _open_window(self, frame):
+        if not self._started_tracing:
+            self._start_tracing()
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak so far belongs to the enclosing loop, the new one starts its own
+        parent = self._windows.get(frame.parent) if frame.parent is not None else None
+        if parent is not None:
+            parent.peak = max(parent.peak, self._peak_since(parent, current, peak))
+        if self._owns_tracing:
+            # Only our own session has its peak reset, tracing started by the program keeps the peak it expects
+            tracemalloc.reset_peak()
+            peak = current
+        self._windows[frame] = _MemoryWindow(current, sys.getallocatedblocks(), self._gc_collections, peak)
+
+    def _close_window(self, frame):
+        window = self._windows.pop(frame, None)
+        if window is None or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        window.peak = max(window.peak, self._peak_since(window, current, peak))
+        # The enclosing loop was executing the whole time, so its peak is at least this one
+        parent = self._windows.get(frame.parent) if frame.parent is not None else None
+        if parent is not None and window.peak > parent.peak:
+            parent.peak = window.peak
+
+        memory = self.loop_memory.get(frame.loop_id)
+        if memory is None:
+            memory = self.loop_memory[frame.loop_id] = LoopMemory(frame.kind)
+        memory.record(frame.iterations, current - window.current, window.peak - window.current,
+                      sys.getallocatedblocks() - window.blocks, self._gc_collections - window.collections)
+
+    def _peak_since(self, window, current, peak):
+        """Highest traced memory since the window opened, as far as tracemalloc shows it.
+
+        Without resetting the peak, one that did not rise above its value at
+        the start could have been reached before, so only the current size
+        is known to belong to the window.
+        """
+        if self._owns_tracing or peak > window.mark:
+            return peak
+        return current
+
+    def _start_tracing(self):
+        self._started_tracing = True
+        # Tracing started by the program itself is shared and left running
+        self._owns_tracing = not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start()
+        gc.callbacks.append(self._on_gc)
+
+    def _stop_tracing(self):
+        if self._started_tracing:
+            self._started_tracing = False
+            if self._on_gc in gc.callbacks:
+                gc.callbacks.remove(self._on_gc)
+            if self._owns_tracing:
+                tracemalloc.stop()
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_collections += 1
+
+    def _record_object_creation(self, obj_type, iid, value, dyn_ast):
+        if not self.loops:
+            return
+        governed = self._governed(dyn_ast, iid, obj_type)
+        if governed.settled:
+            self._count_settled(governed, (dyn_ast, iid, obj_type))
+            return
+        start = time.perf_counter()
+        self._process_object_creation(obj_type, iid, value, dyn_ast)
+        self.governor.charge(governed, time.perf_counter() - start)
+
+    def _process_object_creation(self, obj_type, iid, value, dyn_ast):
+        weight = self._sample_weight(dyn_ast, iid)
+        if not weight:
+            return
+        frame = self.loops.top
+        key = (dyn_ast, iid, obj_type)
+        creations = self.object_creations.get(frame)
+        if creations is None:
+            creations = self.object_creations[frame] = {}
+        identities = creations.get(key)
+        if identities is None:
+            identities = creations[key] = _Identities(id(value))
+        else:
+            identities.add(id(value))
+        identities.count.add(weight)
         if self.debug:
-            print(f"[DEBUG] Loop iid {loop_iid} iteration count: {self.objects_in_loop[loop_iid].get('iterations')}")
+            self.report.debug("[DEBUG] Recorded creation of %s (key %s, object id %s) in loop iid %s", obj_type, key, id(value), frame.loop_id[1])
+        line = iid_line(dyn_ast, iid)
+        if line is not None:
+            if key not in self.creation_locations:
+                self.creation_locations[key] = set()
+            self.creation_locations[key].add(line)
+        elif self.debug:
+            self.report.debug("[DEBUG] Failed to record creation location for iid %s", iid)
 
-    def _analyze_loop_objects(self, loop_iid):
+    def _analyze_loop_objects(self, frame):
         if self.debug:
-            print(f"[DEBUG] Analyzing objects in loop iid {loop_iid}")
-        if loop_iid in self.object_creations:
-            for key, obj_ids in self.object_creations[loop_iid].items():
-                if len(set(obj_ids)) > 1:
-                    obj_type = key.split(':')[1]
+            self.report.debug("[DEBUG] Analyzing objects in loop iid %s", frame.loop_id[1])
+        creations = self.object_creations.pop(frame, None)
+        if creations is not None:
+            for key, identities in creations.items():
+                if identities.differs:
+                    dyn_ast, iid, obj_type = key
                     if key not in self.repeated_creations:
                         self.repeated_creations[key] = {
-                            'count': len(obj_ids),
+                            'count': identities.count,
                             'type': obj_type,
                             'locations': list(self.creation_locations.get(key, [])) if key in self.creation_locations else [],
-                            'iid': int(key.split(':')[0])
+                            'iid': iid,
+                            'dyn_ast': dyn_ast
                         }
+                        # Later creations at the site cannot change the verdict, they are only counted
+                        self.governor.settle(self._governed(dyn_ast, iid, obj_type))
                     if self.debug:
-                        print(f"[DEBUG] Detected repeated creation for {key}: count {len(obj_ids)}")
+                        self.report.debug("[DEBUG] Detected repeated creation for %s: count %s", key, identities.count.describe())
+
+    def _emit_finding(self, key, data, locations):
+        dyn_ast = data['dyn_ast']
+        count = data['count']
+        metrics = {'type': data['type'], 'count': round(count.total), 'lines': locations}
+        if not count.exact:
+            metrics['count_error'] = round(count.error())
+        self.findings.emit(Finding.at(
+            "ObjectCreationInLoopAnalysis", "R2-3", dyn_ast, data['iid'],
+            f"{data['type']} created repeatedly inside a loop ({count.describe()} times)",
+            metrics=metrics, cost=round(count.total), cost_unit="allocations"))
+
+    def _governed(self, dyn_ast, iid, obj_type):
+        site = (dyn_ast, iid, obj_type)
+        governed = self.governed.get(site)
+        if governed is None:
+            governed = self.governed[site] = self.governor.site("ObjectCreationInLoopAnalysis", site)
+        return governed
+
+    def _count_settled(self, governed, key):
+        """Counter-only processing of a creation at a settled site"""
+        governed.counted += 1
+        data = self.repeated_creations.get(key)
+        if data is not None:
+            data['count'].add(1.0)
+
+    def _sample_weight(self, dyn_ast, iid):
+        """Weight of a creation event that is fully processed, 0.0 for one that is only counted"""
+        if self.sampler is None:
+            return 1.0
+        return self.sampler.sample((dyn_ast, iid))
 
     def _get_object_type(self, obj):
         if isinstance(obj, list):
@@ -260,17 +512,10 @@ class ObjectCreationInLoopAnalysis(BaseAnalysis):
             return "tuple"
         return None
 
-    def _estimate_object_size(self, obj):
-        try:
-            import sys
-            return sys.getsizeof(obj)
-        except:
-            if isinstance(obj, list):
-                return 64 + sum(self._estimate_object_size(x) for x in obj[:10]) * (len(obj) / 10 if len(obj) > 10 else 1)
-            elif isinstance(obj, dict):
-                return 240 + len(obj) * 24
-            elif isinstance(obj, set):
-                return 224 + len(obj) * 8
-            elif isinstance(obj, tuple):
-                return 64 + sum(self._estimate_object_size(x) for x in obj[:10]) * (len(obj) / 10 if len(obj) > 10 else 1)
-            return 24
+
+def _format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
@@ -1,40 +1,276 @@
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
-from typing import Any, List, Dict
+from typing import Any, Callable, Dict, List, Optional
+import sys
+import time
+
+from .call_context import CallTracker
+from .findings import Finding, get_findings_writer
+from .governor import get_governor
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import format_location
+
+# Argument tuples remembered per function for the repeated-subproblem check
+MAX_ARGUMENT_KEYS = 1 << 16
+
+# Mean number of recursive calls per recursing frame from which recursion is considered tree shaped
+TREE_BRANCHING = 1.5
+
+# The share of repeats is measured over windows of this many checked recursive calls. Once it changes by no
+# more than SHARE_TOLERANCE between two windows the verdict of a reported function is settled.
+SHARE_WINDOW = 512
+SHARE_TOLERANCE = 0.02
+
+
+class RecursionStats:
+    """Summary of the recursion tree of one function"""
+
+    __slots__ = ("name", "calls", "recursive_calls", "max_depth", "internal_nodes",
+                 "recursive_children", "max_fanout", "repeated_calls", "unhashable_calls", "unchecked_calls",
+                 "window_calls", "window_repeats", "recent_repeats", "converged",
+                 "argument_keys", "governed")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0  # Every call of the function
+        self.recursive_calls = 0  # Calls made while the function was already active
+        self.max_depth = 0  # Most frames of the function on the stack at once
+        self.internal_nodes = 0  # Finished frames that called the function themselves
+        self.recursive_children = 0  # Direct recursive calls made by those frames
+        self.max_fanout = 0  # Most direct recursive calls made by a single frame
+        self.repeated_calls = 0  # Recursive calls with an argument tuple seen before
+        self.unhashable_calls = 0  # Recursive calls whose arguments cannot be used as a cache key
+        self.unchecked_calls = 0  # Recursive calls made once the verdict was settled, only counted
+        self.window_calls = 0  # Checked calls in the current share window
+        self.window_repeats = 0
+        self.recent_repeats: Optional[float] = None  # Share of repeats in the last complete window
+        self.converged = False  # The last two windows had about the same share
+        self.argument_keys = set()  # Hashes of the argument tuples of recursive calls
+        self.governed = None  # GovernedSite of the function
+
+    @property
+    def branching(self) -> float:
+        return self.recursive_children / self.internal_nodes if self.internal_nodes else 0.0
+
+    @property
+    def is_tree(self) -> bool:
+        return self.branching >= TREE_BRANCHING
+
+    @property
+    def checked_calls(self) -> int:
+        """Recursive calls whose argument tuple was checked for repeats"""
+        return self.recursive_calls - self.unhashable_calls - self.unchecked_calls
+
+    @property
+    def estimated_repeats(self) -> int:
+        """Repeated calls, those among the unchecked calls estimated from the share among the latest checked ones"""
+        return self.repeated_calls + round(self.unchecked_calls * (self.recent_repeats or 0.0))
+
+    @property
+    def distinct_calls(self) -> int:
+        """Calls that a memoized version would still have to make"""
+        return self.calls - self.estimated_repeats
+
+    def record_arguments(self, key: Optional[int]) -> None:
+        if key is None:
+            self.unhashable_calls += 1
+            return
+        repeated = key in self.argument_keys
+        if repeated:
+            self.repeated_calls += 1
+        elif len(self.argument_keys) < MAX_ARGUMENT_KEYS:
+            self.argument_keys.add(key)
+        self.window_calls += 1
+        self.window_repeats += repeated
+        if self.window_calls == SHARE_WINDOW:
+            share = self.window_repeats / SHARE_WINDOW
+            self.converged = self.recent_repeats is not None and abs(share - self.recent_repeats) <= SHARE_TOLERANCE
+            self.recent_repeats = share
+            self.window_calls = self.window_repeats = 0
+
+    def merge(self, other: "RecursionStats") -> None:
+        """Add the calls of the same function made by another process.
+
+        An argument tuple first seen in another process is not counted as a
+        repeat, so the merged repeats are a lower bound.
+        """
+        # Repeats among unchecked calls are estimated with each process's own share
+        unchecked = self.unchecked_calls + other.unchecked_calls
+        if unchecked:
+            self.recent_repeats = (self.unchecked_calls * (self.recent_repeats or 0.0)
+                                   + other.unchecked_calls * (other.recent_repeats or 0.0)) / unchecked
+        for slot in ("calls", "recursive_calls", "internal_nodes", "recursive_children", "repeated_calls",
+                     "unhashable_calls", "unchecked_calls"):
+            setattr(self, slot, getattr(self, slot) + getattr(other, slot))
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.max_fanout = max(self.max_fanout, other.max_fanout)
+        for key in other.argument_keys:
+            if len(self.argument_keys) >= MAX_ARGUMENT_KEYS:
+                break
+            self.argument_keys.add(key)
+
+    def end_frame(self, self_calls: int) -> None:
+        if self_calls:
+            self.internal_nodes += 1
+            self.recursive_children += self_calls
+            if self_calls > self.max_fanout:
+                self.max_fanout = self_calls
+
 
 class RecursionAnalysis(BaseAnalysis):
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, threshold: int = 10, **kwargs) -> None:
         super().__init__(**kwargs)
-        self.call_stacks: Dict[str, Dict[int, int]] = {}
-        self.threshold = 10
-        self.reported = set()  # To avoid duplicate reporting
+        # Per-thread stack of the active calls
+        self.calls = CallTracker()
+        self.functions: Dict[tuple, RecursionStats] = {}  # {(file_path, function iid): RecursionStats}
+        self.threshold = int(threshold)  # Recursion depth from which a function is reported
+        # Arguments of a reported function stop being hashed once enough of them were checked
+        self.governor = get_governor()
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
 
-    def function_enter(self, dyn_ast: str, iid: int, args: List[Any], name: str, is_lambda: bool) -> None:
-        # Initialize tracking for new functions
-        if name not in self.call_stacks:
-            self.call_stacks[name] = {}
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            function = (dyn_ast, iid)
+            frame = self.calls.enter(function)
 
-        # Initialize depth counter for this call site
-        if iid not in self.call_stacks[name]:
-            self.call_stacks[name][iid] = 0
+            stats = self.functions.get(function)
+            if stats is None:
+                stats = self.functions[function] = RecursionStats(name)
+                stats.governed = self.governor.site("RecursionAnalysis", function)
+            stats.calls += 1
+            if frame.recursion_depth > stats.max_depth:
+                stats.max_depth = frame.recursion_depth
+            if frame.recursion_depth > 1:
+                stats.recursive_calls += 1
+                governed = stats.governed
+                if governed.settled:
+                    stats.unchecked_calls += 1
+                    governed.counted += 1
+                else:
+                    start = time.perf_counter()
+                    stats.record_arguments(self._argument_key(args))
+                    self.governor.charge(governed, time.perf_counter() - start)
+                    if stats.converged and self._is_reported(stats):
+                        self.governor.settle(governed)
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
 
-        self.call_stacks[name][iid] += 1
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        try:
+            # Frames above the function's own one were left through an exception
+            for frame in self.calls.exit((dyn_ast, function_iid)):
+                stats = self.functions.get(frame.function)
+                if stats is not None:
+                    stats.end_frame(frame.self_calls)
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
 
-        # Check threshold and report once
-        if self.call_stacks[name][iid] > self.threshold and (name, iid) not in self.reported:
-            print(f"Recursion depth exceeded for function {name} at {iid}. Current depth: {self.call_stacks[name][iid]}")
-            self.reported.add((name, iid))
+        return result
 
-    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
-        # Only modify tracked functions/call sites
-        if name in self.call_stacks and function_iid in self.call_stacks[name]:
-            self.call_stacks[name][function_iid] -= 1
+    def _argument_key(self, args: List[Callable[[], Any]]) -> Optional[int]:
+        """Hash of the argument tuple of a call, None if it cannot be hashed"""
+        try:
+            return hash(tuple(arg() for arg in args))
+        except Exception:
+            return None
 
-            # Cleanup empty call sites
-            if self.call_stacks[name][function_iid] == 0:
-                del self.call_stacks[name][function_iid]
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"functions": self.functions}
 
-            # Cleanup empty functions
-            if not self.call_stacks[name]:
-                del self.call_stacks[name]
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        for function, stats in state["functions"].items():
+            if function in self.functions:
+                self.functions[function].merge(stats)
+            else:
+                self.functions[function] = stats
 
-        return result
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        functions = {}
+        for function, stats in self.functions.items():
+            # The calls the child was forked in still return in the child
+            functions[function] = RecursionStats(stats.name)
+            functions[function].governed = stats.governed
+        self.functions = functions
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            reported = [(function, stats) for function, stats in self.functions.items() if self._is_reported(stats)]
+            if not reported:
+                return
+
+            self.report.info("\n===== Recursion Analysis Report =====")
+            # Functions whose memoization saves the most calls first
+            reported.sort(key=lambda item: (item[1].estimated_repeats, item[1].calls), reverse=True)
+            for function, stats in reported:
+                self._report_function(function, stats)
+                self._emit_finding(function, stats)
+            governed = self.governor.describe("RecursionAnalysis")
+            if governed is not None:
+                self.report.info(f"\nGovernor: {governed}")
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _is_reported(self, stats: RecursionStats) -> bool:
+        return bool(stats.recursive_calls) and (stats.max_depth > self.threshold
+                                                or (stats.is_tree and stats.repeated_calls > 0))
+
+    def _emit_finding(self, function: tuple, stats: RecursionStats) -> None:
+        shape = "tree" if stats.is_tree else "linear"
+        metrics = {"function": stats.name, "shape": shape, "calls": stats.calls, "recursive_calls": stats.recursive_calls,
+                   "max_depth": stats.max_depth, "branching": round(stats.branching, 2), "max_fanout": stats.max_fanout,
+                   "repeated_calls": stats.estimated_repeats, "unhashable_calls": stats.unhashable_calls}
+        if stats.unchecked_calls:
+            metrics["unchecked_calls"] = stats.unchecked_calls
+        if stats.repeated_calls:
+            metrics["memoization_speedup"] = round(stats.calls / stats.distinct_calls, 2)
+        self.findings.emit(Finding.at(
+            "RecursionAnalysis", "R1-2", function[0], function[1],
+            f"{shape} recursion in {stats.name}, depth {stats.max_depth}, {stats.estimated_repeats} repeated subproblems",
+            metrics=metrics, cost=stats.estimated_repeats, cost_unit="redundant calls"))
+
+    def _report_function(self, function: tuple, stats: RecursionStats) -> None:
+        self.report.info(f"\nRecursive function {stats.name} at {format_location(*function)}:")
+        if stats.is_tree:
+            self.report.info(f"  Shape: tree recursion, branching factor {stats.branching:.2f} (max fan-out {stats.max_fanout}), "
+                             f"calls grow exponentially with depth")
+        else:
+            self.report.info(f"  Shape: linear recursion, branching factor {stats.branching:.2f}")
+        self.report.info(f"  Calls: {stats.calls} total, {stats.recursive_calls} recursive, maximum recursion depth {stats.max_depth}")
+        if stats.max_depth > self.threshold:
+            self.report.info(f"  Warning: recursion depth {stats.max_depth} exceeds the threshold ({self.threshold}), "
+                             f"Python's recursion limit is {sys.getrecursionlimit()}")
+
+        hashable_calls = stats.checked_calls
+        if hashable_calls:
+            share = 100.0 * stats.repeated_calls / hashable_calls
+            self.report.info(f"  Repeated subproblems: {stats.repeated_calls} of {hashable_calls} recursive calls ({share:.1f}%) "
+                             f"repeat an argument tuple seen before")
+        if stats.unchecked_calls:
+            self.report.info(f"  {stats.unchecked_calls} later recursive calls were only counted, "
+                             f"about {stats.estimated_repeats - stats.repeated_calls} of them repeats at the latest share")
+        if stats.unhashable_calls:
+            self.report.info(f"  {stats.unhashable_calls} recursive calls have unhashable arguments and were not checked for repeats")
+
+        # Assuming calls cost about the same, the speedup is the ratio of calls made before and after
+        if stats.repeated_calls:
+            speedup = stats.calls / stats.distinct_calls
+            self.report.info(f"  Memoization: caching results by argument tuple would cut {stats.calls} calls to "
+                             f"{stats.distinct_calls}, an estimated {speedup:.1f}x speedup (e.g. functools.lru_cache)")
+            self.report.info(f"  Iterative rewrite: computing the {stats.distinct_calls} distinct subproblems bottom-up "
+                             f"gives the same {speedup:.1f}x and also removes the {stats.max_depth}-deep call stack")
+        elif stats.is_tree:
+            self.report.info("  Memoization: no argument tuple repeated, caching would not save calls")
+        else:
+            self.report.info(f"  Iterative rewrite: a loop would replace the {stats.max_depth}-deep call stack, "
+                             f"saving the per-call overhead and the risk of RecursionError")
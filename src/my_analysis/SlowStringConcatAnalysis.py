@@ -1,34 +1,205 @@
-from typing import Iterable
+from typing import Any, Callable, Dict, Optional, Tuple
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+import ast
+import sys
+
+from .findings import Finding, get_findings_writer
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import SourceIndex, format_location, get_source_index
+
+# Size of an empty object of each type, what getsizeof reports beyond it is the payload
+_EMPTY_SIZE = {str: sys.getsizeof(""), bytes: sys.getsizeof(b"")}
+
+
+class ConcatSite:
+    """Growth of the strings built by one concatenation site"""
+
+    __slots__ = ("kind", "form", "concatenations", "run", "longest_run", "last_length",
+                 "bytes_copied", "bytes_wasted", "final_length")
+
+    def __init__(self, kind: str, form: str) -> None:
+        self.kind = kind  # "str" or "bytes"
+        self.form = form  # "+=" or "+"
+        self.concatenations = 0  # Every concatenation at the site
+        self.run = 0  # Consecutive concatenations with a growing accumulated value
+        self.longest_run = 0
+        self.last_length = -1  # Length of the accumulated value at the previous concatenation
+        self.bytes_copied = 0  # Bytes written by all concatenations at the site
+        self.bytes_wasted = 0  # Part of them spent copying the accumulated value again
+        self.final_length = 0  # Length the accumulated value reached in the longest run
+
+    def record(self, accumulated: Any, added: Any) -> None:
+        self.concatenations += 1
+        length = len(accumulated)
+        if length <= self.last_length:
+            # The accumulated value did not grow, e.g. it was reset, so a new run starts
+            self.run = 0
+        self.run += 1
+        self.last_length = length
+
+        # Every concatenation copies the accumulated value and the new piece into a new object
+        old_bytes = _payload(accumulated)
+        self.bytes_copied += old_bytes + _payload(added)
+        self.bytes_wasted += old_bytes
+        if self.run >= self.longest_run:
+            self.longest_run = self.run
+            self.final_length = length + len(added)
+
+    def merge(self, other: "ConcatSite") -> None:
+        """Add the concatenations of the same site recorded by another process"""
+        self.concatenations += other.concatenations
+        self.bytes_copied += other.bytes_copied
+        self.bytes_wasted += other.bytes_wasted
+        if other.longest_run > self.longest_run:
+            self.longest_run = other.longest_run
+            self.final_length = other.final_length
 
 
 class SlowStringConcatAnalysis(BaseAnalysis):
-    def __init__(self, **kwargs):
+    def __init__(self, threshold: int = 5, **kwargs):
         super().__init__(**kwargs)
-        self.in_loop = []
-        self.concat_count = []
-        self.threshold = 5
-
-    def enter_for(self, dyn_ast: str, iid: int, next_value, iterable: Iterable):
-        if (
-            self.in_loop
-            and self.in_loop[-1][0] == dyn_ast
-            and self.in_loop[-1][1] == iid
-        ):
+        self.sites: Dict[Tuple[str, int], ConcatSite] = {}  # {(file_path, iid): ConcatSite}
+        # {file_path: {span: side}} of the + expressions assigned back to one of their operands, see find_accumulations
+        self.accumulations: Dict[str, Dict[Tuple[int, int, int, int], str]] = {}
+        self.sides: Dict[Tuple[str, int], Optional[str]] = {}  # {(file_path, iid): side of the accumulated operand}
+        self.threshold = int(threshold)  # Growing concatenations from which a site is reported
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def add_assign(self, dyn_ast: str, iid: int, lhs: Callable[[], Any], rhs: Any):
+        """s += x, called before the assignment so lhs() is still the old value"""
+        if type(rhs) is str or type(rhs) is bytes:
+            try:
+                accumulated = lhs()
+                if type(accumulated) is type(rhs):
+                    self._record(dyn_ast, iid, "+=", accumulated, rhs)
+            except Exception as e:
+                self.report.error("Error: add_assign execution exception: %s", e)
+
+    def add(self, dyn_ast: str, iid: int, left: Any, right: Any, result: Any):
+        """s = s + x and s = x + s, the operand named like the assignment target is the one being accumulated"""
+        if type(result) is str or type(result) is bytes:
+            try:
+                side = self._accumulated_side(dyn_ast, iid)
+                if side == "left":
+                    self._record(dyn_ast, iid, "+", left, right)
+                elif side == "right":
+                    self._record(dyn_ast, iid, "+", right, left)
+            except Exception as e:
+                self.report.error("Error: add execution exception: %s", e)
+
+    def _record(self, dyn_ast: str, iid: int, form: str, accumulated: Any, added: Any) -> None:
+        site = self.sites.get((dyn_ast, iid))
+        if site is None:
+            site = self.sites[(dyn_ast, iid)] = ConcatSite(type(accumulated).__name__, form)
+        site.record(accumulated, added)
+
+    def _accumulated_side(self, dyn_ast: str, iid: int) -> Optional[str]:
+        """Operand of a + expression that its statement assigns back to, resolved once per iid"""
+        key = (dyn_ast, iid)
+        try:
+            return self.sides[key]
+        except KeyError:
             pass
-        else:
-            self.in_loop.append((dyn_ast, iid))
-            self.concat_count.append(0)
-
-    def exit_for(self, dyn_ast: str, iid: int):
-        curr = self.in_loop.pop()
-        assert curr[0] == dyn_ast
-        assert curr[1] == iid
-        self.concat_count.pop()
-
-    def add_assign(self, dyn_ast: str, iid: int, lhs, rhs):
-        if self.in_loop:
-            if isinstance(rhs, str):
-                self.concat_count[-1] += 1
-            if self.concat_count[-1] >= self.threshold:
-                print(f"Possible slow string concatenation in {dyn_ast} at {iid}")
+        side = None
+        index = get_source_index(dyn_ast)
+        location = index.location(iid)
+        if location is not None:
+            side = self._file_accumulations(dyn_ast, index).get(location[:4])
+        self.sides[key] = side
+        return side
+
+    def _file_accumulations(self, dyn_ast: str, index: SourceIndex) -> Dict[Tuple[int, int, int, int], str]:
+        accumulations = self.accumulations.get(dyn_ast)
+        if accumulations is None:
+            tree = index.syntax_tree()
+            accumulations = self.accumulations[dyn_ast] = find_accumulations(tree, index) if tree is not None else {}
+        return accumulations
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"sites": self.sites}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        for key, site in state["sites"].items():
+            if key in self.sites:
+                self.sites[key].merge(site)
+            else:
+                self.sites[key] = site
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        self.sites = {}
+
+    def end_execution(self):
+        if write_shard(self):
+            return
+        try:
+            reported = [(key, site) for key, site in self.sites.items() if site.longest_run >= self.threshold]
+            if not reported:
+                return
+            # Most expensive sites first
+            reported.sort(key=lambda item: item[1].bytes_wasted, reverse=True)
+
+            self.report.info("\n===== Slow String Concatenation Report =====")
+            self.report.info("Sites ranked by estimated wasted copying:")
+            for rank, ((dyn_ast, iid), site) in enumerate(reported, 1):
+                self.report.info(f"\n{rank}. {site.kind} concatenation ({site.form}) at {format_location(dyn_ast, iid)}")
+                self.report.info(f"   {site.longest_run} concatenations in the longest growing run "
+                                 f"({site.concatenations} in total), final length {site.final_length}")
+                self.report.info(f"   Estimated copying: {site.bytes_copied} bytes copied, {site.bytes_wasted} of them "
+                                 f"re-copying the accumulated {site.kind}")
+                self._emit_finding(dyn_ast, iid, site)
+                if site.kind == "bytes":
+                    self.report.info("   Suggestion: collect the pieces in a list and use b''.join(), or write them to a bytearray or io.BytesIO")
+                else:
+                    self.report.info("   Suggestion: collect the pieces in a list and use ''.join(), or write them to io.StringIO")
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _emit_finding(self, dyn_ast: str, iid: int, site: ConcatSite) -> None:
+        self.findings.emit(Finding.at(
+            "SlowStringConcatAnalysis", "R2-1", dyn_ast, iid,
+            f"{site.kind} built by {site.longest_run} repeated concatenations ({site.form})",
+            metrics={"kind": site.kind, "form": site.form, "concatenations": site.concatenations,
+                     "longest_run": site.longest_run, "final_length": site.final_length,
+                     "bytes_copied": site.bytes_copied},
+            cost=site.bytes_wasted, cost_unit="bytes re-copied"))
+
+
+def find_accumulations(tree: ast.AST, index: SourceIndex) -> Dict[Tuple[int, int, int, int], str]:
+    """{span: "left" or "right"} of the + expressions that build the value assigned back to one of their operands.
+
+    Spans are in the columns of the iid table, see SourceIndex.span_of.
+
+    In s = s + x + y both additions copy the accumulated value, so every
+    addition on the way from the assigned expression down to the target's
+    name is included.
+    """
+    accumulations = {}
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name)):
+            continue
+        for side in ("left", "right"):
+            chain = []
+            value = node.value
+            while isinstance(value, ast.BinOp) and isinstance(value.op, ast.Add):
+                chain.append(value)
+                value = getattr(value, side)
+            if chain and isinstance(value, ast.Name) and value.id == node.targets[0].id:
+                for addition in chain:
+                    accumulations[index.span_of(addition)] = side
+    return accumulations
+
+
+def _payload(value: Any) -> int:
+    """Bytes of string data in a str or bytes object"""
+    return sys.getsizeof(value) - _EMPTY_SIZE[type(value)]
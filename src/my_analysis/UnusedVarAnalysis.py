@@ -1,154 +1,278 @@
-import logging
+import ast
+import reprlib
+import textwrap
 from dynapyt.analyses.BaseAnalysis import BaseAnalysis
 from typing import Any, Dict, List, Tuple, Set, Optional
 
-class UnusedVarAnalysis(BaseAnalysis):
-    def __init__(self, debug=True, **kwargs) -> None:
-        super().__init__(**kwargs)
-        # 数据结构用于跟踪变量操作
-        self.write_ops = {}
-        self.read_ops = set()
-        self.unused_vars = {}
-        self.debug = debug
-
-        # 清除任何现有的日志处理器
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-
-        # 创建根日志记录器
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG if debug else logging.INFO)  # 设置为DEBUG级别
-
-        # 主日志文件 - 只记录INFO级别及以上
-        main_handler = logging.FileHandler('unused_vars.log', mode='w')
-        main_handler.setLevel(logging.INFO)
-        main_handler.setFormatter(logging.Formatter('%(message)s'))
-        logger.addHandler(main_handler)
+from .findings import Finding, get_findings_writer
+from .reporting import DEBUG, INFO, as_bool, get_sink
+from .shards import is_sharded, register_shards, write_shard
+from .source_index import get_source_index, iid_line
 
-        # 调试日志文件 - 记录所有级别
-        if debug:
-            debug_handler = logging.FileHandler('unused_vars_debug.log', mode='w')
-            debug_handler.setLevel(logging.DEBUG)  # 设置为DEBUG级别
-            debug_handler.setFormatter(logging.Formatter('%(message)s'))
-            logger.addHandler(debug_handler)
+# 变量标识: (文件, 作用域, 变量名)
+VarKey = Tuple[str, str, str]
 
-            # 验证调试模式已启用
-            logging.debug("调试模式已启用 - 这条消息应该出现在调试日志中")
-
-        # 确保立即刷新
-        for handler in logger.handlers:
-            handler.flush()
-
-    def log(self, message):
+class UnusedVarAnalysis(BaseAnalysis):
+    def __init__(self, debug=False, **kwargs) -> None:
+        super().__init__(**kwargs)
+        # 数据结构用于跟踪变量操作, 全部以变量标识为键, 读写均为O(1)
+        self.definitions: Dict[VarKey, list] = {}  # 每个变量最近一次写入: [iid, 值, 是否已被读取]
+        self.unused_vars: Dict[VarKey, list] = {}  # 写入后未读即被覆盖: [次数, 首次写入iid, 值, 覆盖它的iid, 是否已报告]
+        self.write_count = 0
+        self.read_count = 0
+        self.debug = as_bool(debug)
+
+        # iid到变量标识的缓存, 每个iid只解析一次源码; 写入目标附带该语句是否先读取它(增强赋值)
+        self._write_targets: Dict[Tuple[str, int], Tuple[Tuple[VarKey, bool], ...]] = {}
+        self._read_targets: Dict[Tuple[str, int], Optional[VarKey]] = {}
+
+        # 主日志文件只记录INFO级别, 调试日志文件记录所有级别, 均由后台线程批量写入
+        self.main_log = get_sink('unused_vars.log', INFO)
+        self.debug_sink = get_sink('unused_vars_debug.log', DEBUG) if self.debug else None
+        self.findings = get_findings_writer()
+
+        # 设置DYNAPERF_SHARD_DIR时每个进程把汇总写入分片, 由合并步骤统一报告
+        register_shards(self)
+
+    def log(self, message, *args):
         """记录重要信息"""
-        logging.info(message)
-        for handler in logging.root.handlers:
-            handler.flush()
-
-    def debug_log(self, message):
-        """记录调试信息"""
-        if self.debug:
-            # 直接使用logging.debug而不是logging.info
-            logging.debug(f"DEBUG: {message}")
-            for handler in logging.root.handlers:
-                handler.flush()
+        self.main_log.info(message, *args)
+        if self.debug_sink is not None:
+            self.debug_sink.info(message, *args)
+
+    def debug_log(self, message, *args):
+        """记录调试信息, 参数只在调试模式开启时格式化"""
+        if self.debug_sink is not None:
+            self.debug_sink.debug("DEBUG: " + message, *args)
 
     def write(self, dyn_ast: str, iid: int, old_vals: List[Any], new_val: Any) -> Any:
         """写操作钩子"""
         try:
-            var_name = f"var_at_iid_{iid}"
+            self.write_count += 1
 
             # 使用debug_log记录调试信息
-            self.debug_log(f"Write operation at IID {iid} with value {new_val}")
+            self.debug_log("Write operation at IID %s with value %s", iid, new_val)
 
-            if var_name in self.write_ops and var_name not in self.read_ops:
-                prev_iid, prev_val = self.write_ops[var_name]
-                self.unused_vars[var_name] = (prev_iid, prev_val)
-                message = f"UNUSED VARIABLE: {var_name} was written at IID {prev_iid} with value {prev_val} but never read before being written again at IID {iid}"
-                self.log(message)
-
-            self.write_ops[var_name] = (iid, new_val)
+            targets = self._write_targets.get((dyn_ast, iid))
+            if targets is None:
+                targets = self._write_targets[(dyn_ast, iid)] = self._resolve_write_targets(dyn_ast, iid)
 
-            if var_name in self.read_ops:
-                self.read_ops.remove(var_name)
-                self.debug_log(f"Removed {var_name} from read_ops")
+            for key, reads_first in targets:
+                previous = self.definitions.get(key)
+                if previous is not None and reads_first:
+                    # t += x先读取t, DynaPyt不为增强赋值的目标发送read事件
+                    previous[2] = True
+                if previous is not None and not previous[2]:
+                    self._record_overwrite(key, previous, iid)
+                self.definitions[key] = [iid, new_val, False]
 
         except Exception as e:
-            self.log(f"Error in write hook: {e}")
+            self.log("Error in write hook: %s", e)
 
         return new_val
 
     def read(self, dyn_ast: str, iid: int, val: Any) -> Any:
-        """读操作钩子"""
+        """读操作钩子, 标识符/属性/下标读取都会触发"""
         try:
-            var_name = f"var_at_iid_{iid}"
+            self.read_count += 1
+
+            self.debug_log("Read operation at IID %s with value %s", iid, val)
 
-            self.debug_log(f"Read operation at IID {iid} with value {val}")
+            try:
+                key = self._read_targets[(dyn_ast, iid)]
+            except KeyError:
+                key = self._read_targets[(dyn_ast, iid)] = self._resolve_read_target(dyn_ast, iid)
 
-            for name, (write_iid, write_val) in list(self.write_ops.items()):
-                if str(write_val) == str(val):
-                    self.read_ops.add(name)
-                    self.debug_log(f"Marked variable {name} as read at IID {iid}")
+            if key is not None:
+                definition = self.definitions.get(key)
+                if definition is not None and not definition[2]:
+                    definition[2] = True
+                    self.debug_log("Marked variable %s as read at IID %s", key[2], iid)
 
         except Exception as e:
-            self.log(f"Error in read hook: {e}")
+            self.log("Error in read hook: %s", e)
 
         return val
 
-    def read_identifier(self, dyn_ast: str, iid: int, val: Any) -> Any:
-        """读取标识符的钩子"""
-        self.debug_log(f"Read identifier at IID {iid} with value {val}")
-        return self.read(dyn_ast, iid, val)
-
-    def read_attribute(self, dyn_ast: str, iid: int, base: Any, name: str, val: Any) -> Any:
-        """读取属性的钩子"""
-        self.debug_log(f"Read attribute at IID {iid}: {base}.{name} = {val}")
-        return self.read(dyn_ast, iid, val)
-
-    def read_subscript(self, dyn_ast: str, iid: int, base: Any, sl: List, val: Any) -> Any:
-        """读取下标的钩子"""
-        self.debug_log(f"Read subscript at IID {iid}: {base}[{sl}] = {val}")
-        return self.read(dyn_ast, iid, val)
-
     def memory_access(self, dyn_ast: str, iid: int, val: Any) -> Any:
         """内存访问钩子"""
-        self.debug_log(f"Memory access at IID {iid} with value {val}")
+        self.debug_log("Memory access at IID %s with value %s", iid, val)
         return val
 
+    def shard_state(self) -> Dict[str, Any]:
+        """写入本进程分片的汇总, 见my_analysis.shards"""
+        # 变量的值只保留其repr, 任意对象不一定能序列化
+        definitions = {key: [iid, _Shown(_short_repr(val)), was_read]
+                       for key, (iid, val, was_read) in self.definitions.items()}
+        return {"definitions": definitions, "unused_vars": self.unused_vars,
+                "write_count": self.write_count, "read_count": self.read_count}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """合并另一个进程的汇总, 任一进程读取过的变量即视为已读"""
+        for key, definition in state["definitions"].items():
+            mine = self.definitions.get(key)
+            if mine is None:
+                self.definitions[key] = definition
+            elif definition[2]:
+                mine[2] = True
+        for key, entry in state["unused_vars"].items():
+            mine = self.unused_vars.get(key)
+            if mine is None:
+                # 分片进程不报告, 由合并后的end_execution报告
+                self.unused_vars[key] = entry[:4] + [False]
+            else:
+                mine[0] += entry[0]
+        self.write_count += state["write_count"]
+        self.read_count += state["read_count"]
+
+    def reset_shard(self) -> None:
+        """fork出的子进程清空汇总, fork之前的记录在父进程的分片中"""
+        # 子进程继续使用继承的变量定义
+        self.unused_vars = {}
+        self.write_count = 0
+        self.read_count = 0
+
     def end_execution(self) -> None:
         """分析完成时的最终处理"""
+        if write_shard(self):
+            return
+        # 合并的分片中尚未报告的覆盖
+        for key, entry in self.unused_vars.items():
+            if not entry[4]:
+                self._report_overwrite(key, entry)
         self.log("===== Analysis Complete =====")
 
         # 检查程序结束时仍未被读取的变量
         never_used_vars = {}
-        for var_name, (iid, val) in self.write_ops.items():
-            if var_name not in self.read_ops:
-                never_used_vars[var_name] = (iid, val)
-                message = f"NEVER USED: {var_name} was written at IID {iid} with value {val} but never read until program end"
+        for key, (iid, val, was_read) in self.definitions.items():
+            if not was_read:
+                never_used_vars[key] = (iid, val)
+                message = f"NEVER USED: {self._describe(key)} was written at {self._location(key[0], iid)} with value {_short_repr(val)} but never read until program end"
                 self.log(message)
-                # 添加到未使用变量列表
-                self.unused_vars[var_name] = (iid, val)
+                self._emit_finding(key, iid, f"{key[2]} is written but never read",
+                                   {"value": _short_repr(val), "kind": "never_used"})
 
         # 汇总报告
-        if len(self.unused_vars) > 0:
-            self.log(f"Found {len(self.unused_vars)} unused variables in total:")
+        total = len(self.unused_vars.keys() | never_used_vars.keys())
+        if total > 0:
+            self.log(f"Found {total} unused variables in total:")
 
             # 报告被覆盖的变量
-            overwritten_vars = {k: v for k, v in self.unused_vars.items() if k not in never_used_vars}
-            if overwritten_vars:
-                self.log(f"  Variables overwritten before being used: {len(overwritten_vars)}")
-                for var_name, (iid, val) in overwritten_vars.items():
-                    self.log(f"  - {var_name} written at IID {iid} with value {val} but overwritten before being read")
+            if self.unused_vars:
+                self.log(f"  Variables overwritten before being used: {len(self.unused_vars)}")
+                for key, (count, iid, val, _, _) in self.unused_vars.items():
+                    self.log(f"  - {self._describe(key)} written at {self._location(key[0], iid)} with value {val} but overwritten before being read ({count} times)")
 
             # 报告从未使用的变量
             if never_used_vars:
                 self.log(f"  Variables never used until program end: {len(never_used_vars)}")
-                for var_name, (iid, val) in never_used_vars.items():
-                    self.log(f"  - {var_name} written at IID {iid} with value {val} but never read")
+                for key, (iid, val) in never_used_vars.items():
+                    self.log(f"  - {self._describe(key)} written at {self._location(key[0], iid)} with value {_short_repr(val)} but never read")
         else:
             self.log("No unused variables detected.")
 
-        self.log(f"Total write operations tracked: {len(self.write_ops)}")
-        self.log(f"Total read operations tracked: {len(self.read_ops)}")
-
-        logging.shutdown()
+        self.log(f"Total variables tracked: {len(self.definitions)}")
+        self.log(f"Total write operations tracked: {self.write_count}")
+        self.log(f"Total read operations tracked: {self.read_count}")
+
+        self.main_log.flush()
+        if self.debug_sink is not None:
+            self.debug_sink.flush()
+
+    def _record_overwrite(self, key: VarKey, previous: list, iid: int) -> None:
+        """记录一次写入后未读即被覆盖, 每个变量只保存首次出现的详情和次数"""
+        entry = self.unused_vars.get(key)
+        if entry is not None:
+            entry[0] += 1
+            return
+        prev_iid, prev_val, _ = previous
+        entry = self.unused_vars[key] = [1, prev_iid, _short_repr(prev_val), iid, False]
+        if not is_sharded(self):
+            self._report_overwrite(key, entry)
+
+    def _report_overwrite(self, key: VarKey, entry: list) -> None:
+        """报告一个变量首次写入后未读即被覆盖"""
+        _, prev_iid, value, iid, _ = entry
+        entry[4] = True
+        message = f"UNUSED VARIABLE: {self._describe(key)} was written at {self._location(key[0], prev_iid)} with value {value} but never read before being written again at {self._location(key[0], iid)}"
+        self.log(message)
+        self._emit_finding(key, prev_iid, f"{key[2]} is overwritten before being read",
+                           {"value": value, "kind": "overwritten", "overwritten_at": iid_line(key[0], iid)})
+
+    def _emit_finding(self, key: VarKey, iid: int, message: str, metrics: Dict[str, Any]) -> None:
+        """以流的方式写出发现的问题, 不在内存中累积"""
+        dyn_ast, scope, name = key
+        metrics.update(variable=name, scope=scope)
+        self.findings.emit(Finding.at("UnusedVarAnalysis", "R4-2", dyn_ast, iid, f"{message} (in {scope})",
+                                      metrics=metrics, level="note"))
+
+    def _resolve_write_targets(self, dyn_ast: str, iid: int) -> Tuple[Tuple[VarKey, bool], ...]:
+        """从iid对应的赋值语句中解析被写入的变量名, 以及语句是否在写入前读取它"""
+        index = get_source_index(dyn_ast)
+        location = index.location(iid)
+        if location is None:
+            return ()
+        try:
+            tree = ast.parse(textwrap.dedent(index.source_text(iid)))
+        except SyntaxError:
+            return ()
+
+        names = []
+        reads_first = False
+        for node in tree.body[:1]:
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    _collect_names(target, names)
+            elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+                _collect_names(node.target, names)
+                reads_first = isinstance(node, ast.AugAssign)
+        return tuple(((dyn_ast, index.binding_scope(location.line, name), name), reads_first) for name in names)
+
+    def _resolve_read_target(self, dyn_ast: str, iid: int) -> Optional[VarKey]:
+        """只有读取标识符时才对应一个变量, 属性和下标读取返回None"""
+        index = get_source_index(dyn_ast)
+        location = index.location(iid)
+        if location is None or location.line != location.end_line:
+            return None
+        name = location.snippet
+        if not name.isidentifier():
+            return None
+        return (dyn_ast, index.binding_scope(location.line, name), name)
+
+    def _describe(self, key: VarKey) -> str:
+        _, scope, name = key
+        return f"{name} (in {scope})"
+
+    def _location(self, dyn_ast: str, iid: int) -> str:
+        location = get_source_index(dyn_ast).location(iid)
+        if location is None:
+            return f"IID {iid}"
+        return f"line {location.line} (IID {iid})"
+
+
+def _collect_names(target: ast.AST, names: List[str]) -> None:
+    if isinstance(target, ast.Name):
+        names.append(target.id)
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        for element in target.elts:
+            _collect_names(element, names)
+    elif isinstance(target, ast.Starred):
+        _collect_names(target.value, names)
+
+
+class _Shown:
+    """分片中保存的变量值, 只保留其repr"""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+
+def _short_repr(value: Any) -> str:
+    if isinstance(value, _Shown):
+        return value.text
+    try:
+        return reprlib.repr(value)
+    except Exception:
+        return "<non-serializable>"
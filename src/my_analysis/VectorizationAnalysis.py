@@ -0,0 +1,620 @@
+from dynapyt.analyses.BaseAnalysis import BaseAnalysis
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import ast
+import copy
+
+from .findings import Finding, get_findings_writer
+from .loop_context import LoopFrame, LoopTracker
+from .reporting import get_sink
+from .shards import register_shards, write_shard
+from .source_index import SourceIndex, format_location, get_source_index
+
+NUMERIC_TYPES = (int, float)
+
+# Ints from this size on may not fit NumPy's int64 once multiplied or summed
+INT64_MARGIN = 1 << 62
+
+# Cost model of the speedup estimate, in nanoseconds. CPython runs a simple arithmetic loop body in tens of
+# nanoseconds per iteration, NumPy pays a fixed cost per call and about a nanosecond per element, BLAS less per
+# multiply-add, and numpy.array() from a list of Python numbers costs about as much as a plain loop over it.
+PYTHON_NS_PER_ITERATION = 50.0
+NUMPY_NS_PER_CALL = 1500.0
+NUMPY_NS_PER_ELEMENT = 1.0
+NUMPY_NS_PER_MULTIPLY_ADD = 0.2
+CONVERSION_NS_PER_ELEMENT = 15.0
+
+# Functions that have a NumPy counterpart with the same name
+MATH_FUNCTIONS = {"sqrt", "exp", "log", "log2", "log10", "sin", "cos", "tan", "floor", "ceil", "fabs"}
+
+_NUMERIC_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+
+
+class NestShape:
+    """Statically recognized shape of a loop nest"""
+
+    __slots__ = ("shape", "idiom", "depth", "inputs")
+
+    def __init__(self, shape: str, idiom: str, depth: int, inputs: int) -> None:
+        self.shape = shape  # "element-wise map", "reduction", "matrix product" or "transpose"
+        self.idiom = idiom  # NumPy code that replaces the nest
+        self.depth = depth  # Loops in the nest
+        self.inputs = inputs  # Sequences the body reads from
+
+
+class NestStats:
+    """What one loop nest did at runtime"""
+
+    __slots__ = ("nest", "root_iid", "executions", "iterations", "numeric_operations", "other_operations",
+                 "numeric_reads", "other_reads", "value_types", "large_ints")
+
+    def __init__(self, nest: NestShape) -> None:
+        self.nest = nest
+        self.root_iid: Optional[int] = None
+        self.executions = 0  # Executions of the outermost loop
+        self.iterations = [0] * nest.depth  # Iterations per nesting level, outermost first
+        self.numeric_operations = 0
+        self.other_operations = 0  # Operations on anything but int and float, which NumPy cannot take over
+        self.numeric_reads = 0  # Subscript reads of numbers or rows from lists
+        self.other_reads = 0
+        self.value_types: Set[str] = set()
+        self.large_ints = False
+
+    def merge(self, other: "NestStats") -> None:
+        """Add what the same nest did in another process"""
+        if self.root_iid is None:
+            self.root_iid = other.root_iid
+        self.executions += other.executions
+        self.iterations = [mine + theirs for mine, theirs in zip(self.iterations, other.iterations)]
+        self.numeric_operations += other.numeric_operations
+        self.other_operations += other.other_operations
+        self.numeric_reads += other.numeric_reads
+        self.other_reads += other.other_reads
+        self.value_types |= other.value_types
+        self.large_ints = self.large_ints or other.large_ints
+
+    @property
+    def vectorizable(self) -> bool:
+        return not self.other_operations and not self.other_reads and not self.large_ints \
+            and (self.numeric_operations or self.numeric_reads) > 0
+
+    def trips(self) -> List[float]:
+        """Mean iterations of each level per iteration of the level around it"""
+        trips, outer = [], self.executions
+        for iterations in self.iterations:
+            trips.append(iterations / outer if outer else 0.0)
+            outer = iterations
+        return trips
+
+    def estimate(self) -> Tuple[float, float]:
+        """Estimated speedup on data already held in arrays and including the conversion from lists"""
+        innermost = self.iterations[-1]
+        python = innermost * PYTHON_NS_PER_ITERATION
+        calls = self.executions * NUMPY_NS_PER_CALL
+        if self.nest.shape == "matrix product":
+            n, m, k = self.trips()
+            work = innermost * NUMPY_NS_PER_MULTIPLY_ADD
+            converted = self.executions * (n * k + k * m)
+        else:
+            work = innermost * NUMPY_NS_PER_ELEMENT
+            converted = innermost * max(self.nest.inputs, 1)
+        numpy = calls + work
+        return python / numpy if numpy else 0.0, python / (numpy + converted * CONVERSION_NS_PER_ELEMENT) if numpy else 0.0
+
+
+class VectorizationAnalysis(BaseAnalysis):
+    """Finds numeric loop nests that a single NumPy operation could replace.
+
+    Loop nests are matched against element-wise maps, reductions, matrix
+    products and transposes on their syntax tree. At runtime the analysis
+    checks that the matched nests really only compute on ints and floats read
+    from lists, and counts their iterations per level for the speedup
+    estimate.
+    """
+
+    def __init__(self, min_iterations: int = 100, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.min_iterations = int(min_iterations)  # Innermost iterations from which a nest is reported
+        self.loops = LoopTracker()
+        self.shapes: Dict[str, Dict[Tuple[int, int], Tuple[Tuple[int, int], int, NestShape]]] = {}  # Per file, see _file_shapes
+        self.loop_nests: Dict[Tuple[str, int], Optional[Tuple[NestStats, int]]] = {}  # {(file, loop iid): (stats, level)}
+        self.nests: Dict[Tuple[str, Tuple[int, int]], NestStats] = {}  # {(file, root position): NestStats}
+        self.report = get_sink()
+        self.findings = get_findings_writer()
+
+        # Every process writes its aggregates to a shard instead of a report when DYNAPERF_SHARD_DIR is set
+        register_shards(self)
+
+    def enter_for(self, dyn_ast: str, iid: int, next_value: Any, iterable: Iterable) -> None:
+        try:
+            self._enter_loop(dyn_ast, iid, "for", not isinstance(next_value, StopIteration))
+        except Exception as e:
+            self.report.error("Error: enter_for execution exception: %s", e)
+
+    def enter_while(self, dyn_ast: str, iid: int, cond_value: bool) -> None:
+        try:
+            self._enter_loop(dyn_ast, iid, "while", bool(cond_value))
+        except Exception as e:
+            self.report.error("Error: enter_while execution exception: %s", e)
+
+    def exit_for(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self._exit_loop(dyn_ast, iid)
+        except Exception as e:
+            self.report.error("Error: exit_for execution exception: %s", e)
+
+    def exit_while(self, dyn_ast: str, iid: int) -> None:
+        try:
+            self._exit_loop(dyn_ast, iid)
+        except Exception as e:
+            self.report.error("Error: exit_while execution exception: %s", e)
+
+    def _break(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self._close_loops(self.loops.break_((dyn_ast, loop_iid)))
+        except Exception as e:
+            self.report.error("Error: _break execution exception: %s", e)
+
+    def _continue(self, dyn_ast: str, iid: int, loop_iid: int) -> None:
+        try:
+            self.loops.continue_((dyn_ast, loop_iid))
+        except Exception as e:
+            self.report.error("Error: _continue execution exception: %s", e)
+
+    def function_enter(self, dyn_ast: str, iid: int, args: List[Callable[[], Any]], name: str, is_lambda: bool) -> None:
+        try:
+            self._close_loops(self.loops.call_enter((dyn_ast, iid)))
+        except Exception as e:
+            self.report.error("Error: function_enter execution exception: %s", e)
+
+    def function_exit(self, dyn_ast: str, function_iid: int, name: str, result: Any) -> Any:
+        # A return leaves the loops of the call without exit events
+        try:
+            self._close_loops(self.loops.call_exit((dyn_ast, function_iid)))
+        except Exception as e:
+            self.report.error("Error: function_exit execution exception: %s", e)
+        return result
+
+    def binary_operation(self, dyn_ast: str, iid: int, op: str, left: Any, right: Any, result: Any) -> None:
+        if not self.loops:
+            return
+        try:
+            nest = self.loop_nests.get(self.loops.top.loop_id)
+            if nest is None:
+                return
+            stats = nest[0]
+            # An augmented assignment passes its target as a function and no result yet
+            operands = (right,) if callable(left) else (left, right, result)
+            if all(type(value) in NUMERIC_TYPES for value in operands):
+                stats.numeric_operations += 1
+                stats.value_types.update(type(value).__name__ for value in operands)
+                if any(type(value) is int and abs(value) >= INT64_MARGIN for value in operands):
+                    stats.large_ints = True
+            else:
+                stats.other_operations += 1
+        except Exception as e:
+            self.report.error("Error: binary_operation execution exception: %s", e)
+
+    def read_subscript(self, dyn_ast: str, iid: int, base: Any, sl: List[Any], val: Any) -> None:
+        if not self.loops:
+            return
+        try:
+            nest = self.loop_nests.get(self.loops.top.loop_id)
+            if nest is None:
+                return
+            stats = nest[0]
+            if type(base) is list and (type(val) in NUMERIC_TYPES or type(val) is list):
+                stats.numeric_reads += 1
+                if type(val) is not list:
+                    stats.value_types.add(type(val).__name__)
+            else:
+                stats.other_reads += 1
+        except Exception as e:
+            self.report.error("Error: read_subscript execution exception: %s", e)
+
+    def _enter_loop(self, dyn_ast: str, iid: int, kind: str, proceeds: bool) -> None:
+        frame, is_new, popped = self.loops.enter((dyn_ast, iid), kind, proceeds)
+        self._close_loops(popped)
+        if is_new:
+            nest = self._nest_of(dyn_ast, iid)
+            if nest is not None and nest[1] == 0:
+                nest[0].executions += 1
+
+    def _exit_loop(self, dyn_ast: str, iid: int) -> None:
+        self._close_loops(self.loops.exit((dyn_ast, iid)))
+
+    def _close_loops(self, popped: List[LoopFrame]) -> None:
+        for frame in popped:
+            nest = self.loop_nests.get(frame.loop_id)
+            if nest is not None:
+                nest[0].iterations[nest[1]] += frame.iterations
+
+    def _nest_of(self, dyn_ast: str, iid: int) -> Optional[Tuple[NestStats, int]]:
+        """Nest a loop belongs to and its level in it, resolved once per loop"""
+        key = (dyn_ast, iid)
+        if key in self.loop_nests:
+            return self.loop_nests[key]
+        nest = None
+        index = get_source_index(dyn_ast)
+        location = index.location(iid)
+        if location is not None:
+            shapes = self._file_shapes(dyn_ast, index)
+            match = shapes.get((location.line, location.column)) or _comprehension_at(shapes, location)
+            if match is not None:
+                root, level, shape = match
+                stats = self.nests.get((dyn_ast, root))
+                if stats is None:
+                    stats = self.nests[(dyn_ast, root)] = NestStats(shape)
+                if level == 0:
+                    stats.root_iid = iid
+                nest = (stats, level)
+        self.loop_nests[key] = nest
+        return nest
+
+    def _file_shapes(self, dyn_ast: str, index: SourceIndex) -> Dict[Tuple[int, int], Tuple[Tuple[int, int], int, NestShape]]:
+        """{loop position: (position of the nest's outermost loop, level, shape)} for the recognized nests of a file"""
+        shapes = self.shapes.get(dyn_ast)
+        if shapes is None:
+            tree = index.syntax_tree()
+            shapes = self.shapes[dyn_ast] = find_nests(tree, index) if tree is not None else {}
+        return shapes
+
+    def shard_state(self) -> Dict[str, Any]:
+        """Aggregates written to this process's shard, see my_analysis.shards"""
+        return {"nests": self.nests}
+
+    def merge_shard(self, state: Dict[str, Any]) -> None:
+        """Add the aggregates of another process"""
+        for key, stats in state["nests"].items():
+            if key in self.nests:
+                self.nests[key].merge(stats)
+            else:
+                self.nests[key] = stats
+
+    def reset_shard(self) -> None:
+        """Empty the aggregates in a forked child, what happened before the fork is in the parent's shard"""
+        fresh = {}
+        for key, stats in self.nests.items():
+            fresh[key] = NestStats(stats.nest)
+            fresh[key].root_iid = stats.root_iid
+        # Loops resolved before the fork, including the ones the child was forked in, count into the fresh stats
+        replaced = {id(self.nests[key]): stats for key, stats in fresh.items()}
+        self.loop_nests = {loop: (replaced[id(nest[0])], nest[1]) if nest is not None else None
+                           for loop, nest in self.loop_nests.items()}
+        self.nests = fresh
+
+    def end_execution(self) -> None:
+        if write_shard(self):
+            return
+        try:
+            reported = [(dyn_ast, stats) for (dyn_ast, _), stats in self.nests.items()
+                        if stats.vectorizable and stats.root_iid is not None
+                        and stats.iterations[-1] >= self.min_iterations]
+            if not reported:
+                return
+            reported.sort(key=lambda item: item[1].iterations[-1], reverse=True)
+
+            self.report.info("\n===== Vectorization Report =====")
+            self.report.info("Numeric loop nests that a NumPy operation could replace:")
+            for rank, (dyn_ast, stats) in enumerate(reported, 1):
+                self._report_nest(rank, dyn_ast, stats)
+            self.report.info("\nSpeedups are estimated from the iteration counts with a fixed cost model, "
+                             "measure them on the real data before rewriting")
+            self.report.info("\n===== Analysis Complete =====")
+        except Exception as e:
+            self.report.error("Error: end_execution execution exception: %s", e)
+        finally:
+            self.report.flush()
+
+    def _report_nest(self, rank: int, dyn_ast: str, stats: NestStats) -> None:
+        nest = stats.nest
+        in_arrays, from_lists = stats.estimate()
+        loops = "1 loop" if nest.depth == 1 else f"{nest.depth} loops"
+        trips = " x ".join(f"{trip:.0f}" for trip in stats.trips())
+        types = " and ".join(sorted(stats.value_types)) or "numbers"
+        self.report.info(f"\n{rank}. {nest.shape} ({loops}) at {format_location(dyn_ast, stats.root_iid)}")
+        self.report.info(f"   Iterations: {trips} per execution, {stats.iterations[-1]} innermost iterations "
+                         f"over {stats.executions} execution(s), values are {types}")
+        if len(stats.value_types) > 1:
+            self.report.info("   Note: ints and floats are mixed, NumPy would compute everything as float64")
+        self.report.info(f"   NumPy idiom: {nest.idiom}")
+        self.report.info(f"   Estimated speedup: ~{in_arrays:.0f}x with the data already in NumPy arrays, "
+                         f"~{from_lists:.1f}x including the conversion from lists")
+        self.findings.emit(Finding.at(
+            "VectorizationAnalysis", "R2-5", dyn_ast, stats.root_iid,
+            f"{nest.shape} over {loops} could be the NumPy operation {nest.idiom}",
+            metrics={"shape": nest.shape, "depth": nest.depth, "iterations": stats.iterations,
+                     "executions": stats.executions, "speedup_in_arrays": round(in_arrays, 1),
+                     "speedup_from_lists": round(from_lists, 1)},
+            cost=stats.iterations[-1], cost_unit="interpreted iterations"))
+
+
+def find_nests(tree: ast.AST, index: SourceIndex) -> Dict[Tuple[int, int], Tuple[Tuple[int, int], int, NestShape]]:
+    """Recognized loop nests of a module by the position of each of their loops.
+
+    Positions are in the columns of the iid table, see SourceIndex.span_of.
+    """
+    shapes = {}
+    parents = {child: node for node in ast.walk(tree) for child in ast.iter_child_nodes(node)}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.For) and not _continues_nest(node, parents.get(node)):
+            chain = _loop_chain(node)
+            # The innermost levels that form a known shape, e.g. a matrix product inside a loop over matrices
+            for start in range(len(chain)):
+                shape = classify_nest(chain[start:])
+                if shape is not None:
+                    root = index.span_of(chain[start])[:2]
+                    for level, loop in enumerate(chain[start:]):
+                        shapes[index.span_of(loop)[:2]] = (root, level, shape)
+                    break
+        elif isinstance(node, (ast.ListComp, ast.GeneratorExp)) and len(node.generators) == 1:
+            parent = parents.get(node)
+            # sum(x for ...) and sum([x for ...]) alike
+            summed = isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == "sum" \
+                and parent.args[:1] == [node]
+            shape = _classify_comprehension(node, summed)
+            if shape is not None:
+                position = ("comprehension",) + index.span_of(node.generators[0].target)[:2]
+                shapes[position] = (position, 0, shape)
+    return shapes
+
+
+def classify_nest(chain: List[ast.For]) -> Optional[NestShape]:
+    loop_names = {}
+    for loop in chain:
+        names = _loop_names(loop)
+        if names is None:
+            return None
+        loop_names.update(names)
+    body = [statement for statement in chain[-1].body if not isinstance(statement, ast.Pass)]
+    if len(body) != 1:
+        return None
+    statement = body[0]
+    depth = len(chain)
+    indices = [loop.target.id if isinstance(loop.target, ast.Name) else None for loop in chain]
+
+    if isinstance(statement, ast.AugAssign) and isinstance(statement.op, ast.Add) and depth == 3 \
+            and _is_matrix_product(statement, indices):
+        target = _base_name(statement.target)
+        factors = [_base_name(factor) for factor in (statement.value.left, statement.value.right)]
+        return NestShape("matrix product", f"{target} = {factors[0]} @ {factors[1]}  (numpy.matmul)", depth, 2)
+    if isinstance(statement, ast.Assign) and depth == 2 and _is_transpose(statement, indices):
+        return NestShape("transpose", f"{_base_name(statement.targets[0])} = {_base_name(statement.value)}.T  "
+                                      f"(numpy.transpose)", depth, 1)
+    if isinstance(statement, ast.AugAssign) and isinstance(statement.target, ast.Name) \
+            and isinstance(statement.op, (ast.Add, ast.Mult)) and _is_numeric(statement.value, loop_names):
+        return NestShape("reduction", _reduction_idiom(statement.target.id, statement.op, statement.value, loop_names),
+                         depth, _inputs(statement.value, loop_names))
+    if isinstance(statement, (ast.Assign, ast.AugAssign)):
+        targets = statement.targets if isinstance(statement, ast.Assign) else [statement.target]
+        if len(targets) == 1 and _is_indexed(targets[0], loop_names) and _is_numeric(statement.value, loop_names):
+            operator = "=" if isinstance(statement, ast.Assign) else f"{_operator(statement.op)}="
+            return NestShape("element-wise map", f"{_base_name(targets[0])} {operator} "
+                                                 f"{_array_expression(statement.value, loop_names)}",
+                             depth, _inputs(statement.value, loop_names))
+    if isinstance(statement, ast.Expr) and depth == 1 and _is_append(statement.value) \
+            and _is_numeric(statement.value.args[0], loop_names):
+        return NestShape("element-wise map", f"{_base_name(statement.value.func.value)} = "
+                                             f"{_array_expression(statement.value.args[0], loop_names)}",
+                         depth, _inputs(statement.value.args[0], loop_names))
+    return None
+
+
+def _classify_comprehension(node: ast.AST, summed: bool) -> Optional[NestShape]:
+    generator = node.generators[0]
+    if generator.ifs or generator.is_async:
+        return None
+    loop_names = _iteration_names(generator.target, generator.iter)
+    if loop_names is None or not _is_numeric(node.elt, loop_names):
+        return None
+    expression = _array_expression(node.elt, loop_names)
+    if summed:
+        return NestShape("reduction", f"numpy.sum({expression})", 1, _inputs(node.elt, loop_names))
+    if isinstance(node, ast.ListComp):
+        return NestShape("element-wise map", f"{expression}  (an array instead of the list comprehension)", 1,
+                         _inputs(node.elt, loop_names))
+    return None
+
+
+def _comprehension_at(shapes: dict, location: Any) -> Optional[Tuple[Tuple[int, int], int, NestShape]]:
+    """A comprehension's iid spans its "for ... in ..." clause, find the comprehension whose target starts first in it"""
+    best = None
+    for position, match in shapes.items():
+        if position[0] != "comprehension":
+            continue
+        _, line, column = position
+        after_start = (line, column) > (location.line, location.column)
+        before_end = (line, column) < (location.end_line, location.end_column)
+        if after_start and before_end and (best is None or (line, column) < best[0][1:]):
+            best = (position, match)
+    return best[1] if best is not None else None
+
+
+def _continues_nest(loop: ast.For, parent: Optional[ast.AST]) -> bool:
+    return isinstance(parent, ast.For) and _inner_loop(parent) is loop
+
+
+def _loop_chain(loop: ast.For) -> List[ast.For]:
+    chain = [loop]
+    inner = _inner_loop(loop)
+    while inner is not None:
+        chain.append(inner)
+        inner = _inner_loop(inner)
+    return chain
+
+
+def _inner_loop(loop: ast.For) -> Optional[ast.For]:
+    """The loop a perfectly nested loop body consists of"""
+    body = [statement for statement in loop.body if not isinstance(statement, ast.Pass)]
+    if len(body) == 1 and isinstance(body[0], ast.For) and not loop.orelse:
+        return body[0]
+    return None
+
+
+def _loop_names(loop: ast.For) -> Optional[Dict[str, Tuple[str, bool]]]:
+    if loop.orelse:
+        return None
+    return _iteration_names(loop.target, loop.iter)
+
+
+def _iteration_names(target: ast.AST, iterable: ast.AST) -> Optional[Dict[str, Tuple[str, bool]]]:
+    """Variables of a loop over range(), a sequence, zip() or enumerate().
+
+    {loop variable: (array it stands for, whether it is a sequence rather than an index)}
+    """
+    if isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name):
+        function = iterable.func.id
+        if function == "range" and isinstance(target, ast.Name) and not iterable.keywords:
+            return {target.id: (f"numpy.arange({', '.join(ast.unparse(arg) for arg in iterable.args)})", False)}
+        if function == "zip" and isinstance(target, ast.Tuple) and len(target.elts) == len(iterable.args) \
+                and all(isinstance(name, ast.Name) for name in target.elts):
+            return {name.id: (ast.unparse(arg), True) for name, arg in zip(target.elts, iterable.args)}
+        if function == "enumerate" and isinstance(target, ast.Tuple) and len(target.elts) == 2 \
+                and all(isinstance(name, ast.Name) for name in target.elts) and iterable.args:
+            return {target.elts[0].id: (_enumerate_indices(iterable), False),
+                    target.elts[1].id: (ast.unparse(iterable.args[0]), True)}
+        return None
+    if isinstance(target, ast.Name) and isinstance(iterable, (ast.Name, ast.Attribute, ast.Subscript)):
+        return {target.id: (ast.unparse(iterable), True)}
+    return None
+
+
+def _enumerate_indices(call: ast.Call) -> str:
+    """Array of the indices enumerate() counts, which start at its start argument"""
+    length = f"len({ast.unparse(call.args[0])})"
+    starts = call.args[1:] + [keyword.value for keyword in call.keywords if keyword.arg == "start"]
+    if not starts:
+        return f"numpy.arange({length})"
+    start = ast.unparse(starts[0])
+    return f"numpy.arange({start}, {start} + {length})"
+
+
+def _is_numeric(node: ast.AST, loop_names: Dict[str, Tuple[str, bool]]) -> bool:
+    """Whether an expression only combines numbers, loop variables and elements indexed by loop variables"""
+    if isinstance(node, ast.BinOp):
+        return isinstance(node.op, _NUMERIC_OPERATORS) and _is_numeric(node.left, loop_names) \
+            and _is_numeric(node.right, loop_names)
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.op, (ast.USub, ast.UAdd)) and _is_numeric(node.operand, loop_names)
+    if isinstance(node, ast.Constant):
+        return type(node.value) in NUMERIC_TYPES
+    if isinstance(node, ast.Name):
+        return True
+    if isinstance(node, ast.Subscript):
+        return _is_indexed(node, loop_names)
+    if isinstance(node, ast.Call):
+        return _math_function(node) is not None and len(node.args) == 1 and not node.keywords \
+            and _is_numeric(node.args[0], loop_names)
+    return False
+
+
+def _is_indexed(node: ast.AST, loop_names: Dict[str, Tuple[str, bool]]) -> bool:
+    """a[i], a[i][j] or a[i + 1] with every index built from loop variables"""
+    if not isinstance(node, ast.Subscript):
+        return False
+    index = node.slice
+    if not (isinstance(index, ast.Name) and index.id in loop_names) and not (
+            isinstance(index, ast.BinOp) and isinstance(index.op, (ast.Add, ast.Sub))
+            and isinstance(index.left, ast.Name) and index.left.id in loop_names
+            and isinstance(index.right, ast.Constant) and type(index.right.value) is int):
+        return False
+    return isinstance(node.value, (ast.Name, ast.Attribute)) or _is_indexed(node.value, loop_names)
+
+
+def _is_matrix_product(statement: ast.AugAssign, indices: List[Optional[str]]) -> bool:
+    """C[i][j] += A[i][k] * B[k][j] with i, j and k the loop variables, in any order of the loops"""
+    product = statement.value
+    if None in indices or not (isinstance(product, ast.BinOp) and isinstance(product.op, ast.Mult)):
+        return False
+    target, left, right = (_index_names(node) for node in (statement.target, product.left, product.right))
+    if any(names is None or len(names) != 2 for names in (target, left, right)):
+        return False
+    i, j = target
+    k = left[1]
+    return left == [i, k] and right == [k, j] and {i, j, k} == set(indices) and len({i, j, k}) == 3
+
+
+def _is_transpose(statement: ast.Assign, indices: List[Optional[str]]) -> bool:
+    """R[j][i] = M[i][j]"""
+    if len(statement.targets) != 1 or None in indices:
+        return False
+    target, source = _index_names(statement.targets[0]), _index_names(statement.value)
+    return target is not None and source is not None and len(target) == 2 and target == source[::-1] \
+        and set(target) == set(indices) and target[0] != target[1]
+
+
+def _index_names(node: ast.AST) -> Optional[List[str]]:
+    """["i", "j"] for a[i][j], None if any index is not a plain name"""
+    names = []
+    while isinstance(node, ast.Subscript):
+        if not isinstance(node.slice, ast.Name):
+            return None
+        names.append(node.slice.id)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return names[::-1]
+
+
+def _is_append(call: ast.AST) -> bool:
+    return isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute) and call.func.attr == "append" \
+        and len(call.args) == 1 and not call.keywords
+
+
+def _math_function(call: ast.Call) -> Optional[str]:
+    function = call.func
+    if isinstance(function, ast.Attribute) and isinstance(function.value, ast.Name) and function.value.id == "math" \
+            and function.attr in MATH_FUNCTIONS:
+        return function.attr
+    if isinstance(function, ast.Name) and function.id == "abs":
+        return "abs"
+    return None
+
+
+def _base_name(node: ast.AST) -> str:
+    while isinstance(node, ast.Subscript):
+        node = node.value
+    return ast.unparse(node)
+
+
+def _inputs(node: ast.AST, loop_names: Dict[str, Tuple[str, bool]]) -> int:
+    """Distinct sequences an expression reads elements of"""
+    return len({_base_name(sub) for sub in ast.walk(node) if isinstance(sub, ast.Subscript)}
+               | {loop_names[name.id][0] for name in ast.walk(node)
+                  if isinstance(name, ast.Name) and name.id in loop_names and loop_names[name.id][1]})
+
+
+def _reduction_idiom(accumulator: str, op: ast.AST, value: ast.AST, loop_names: Dict[str, Tuple[str, bool]]) -> str:
+    if isinstance(op, ast.Mult):
+        return f"{accumulator} *= numpy.prod({_array_expression(value, loop_names)})"
+    if isinstance(value, ast.BinOp) and isinstance(value.op, ast.Mult) \
+            and all(isinstance(factor, (ast.Subscript, ast.Name)) for factor in (value.left, value.right)):
+        left, right = (_array_expression(factor, loop_names) for factor in (value.left, value.right))
+        return f"{accumulator} += numpy.dot({left}, {right})"
+    return f"{accumulator} += numpy.sum({_array_expression(value, loop_names)})"
+
+
+def _array_expression(node: ast.AST, loop_names: Dict[str, Tuple[str, bool]]) -> str:
+    """The loop body expression written on whole arrays: a[i] becomes a, a loop variable the array it runs over"""
+
+    class ToArrays(ast.NodeTransformer):
+        def visit_Subscript(self, sub):
+            return ast.Name(id=_base_name(sub), ctx=ast.Load())
+
+        def visit_Name(self, name):
+            if name.id in loop_names:
+                return ast.Name(id=loop_names[name.id][0], ctx=ast.Load())
+            return name
+
+        def visit_Call(self, call):
+            self.generic_visit(call)
+            function = _math_function(call)
+            if function is not None:
+                call.func = ast.Name(id=f"numpy.{function}", ctx=ast.Load())
+            return call
+
+    return ast.unparse(ToArrays().visit(copy.deepcopy(node)))
+
+
+def _operator(op: ast.AST) -> str:
+    return {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.FloorDiv: "//", ast.Mod: "%",
+            ast.Pow: "**"}.get(type(op), "?")
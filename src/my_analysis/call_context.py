@@ -0,0 +1,117 @@
+from typing import Dict, Hashable, List, Optional
+
+from .task_local import TaskLocal
+
+
+class CallFrame:
+    """One active call of an instrumented function"""
+
+    __slots__ = ("function", "parent", "depth", "recursion_depth", "self_calls", "start", "node")
+
+    def __init__(self, function: Hashable, parent: Optional["CallFrame"], recursion_depth: int) -> None:
+        self.function = function  # (file, function iid)
+        self.parent = parent  # Calling frame, None for a call from uninstrumented or module level code
+        self.depth = parent.depth + 1 if parent is not None else 1
+        self.recursion_depth = recursion_depth  # Frames of the same function on the stack, this one included
+        self.self_calls = 0  # Direct calls this frame made to its own function
+        self.start = 0.0  # Time the call started, set by analyses that time calls
+        self.node = None  # Calling context of the call, set by the profiler
+
+
+class _TaskCalls:
+    __slots__ = ("top", "active", "in_event", "replay")
+
+    def __init__(self) -> None:
+        self.top: Optional[CallFrame] = None
+        self.active: Dict[Hashable, int] = {}  # Frames per function on this thread's or task's stack
+        self.in_event = False
+        self.replay: Optional[tuple] = None
+
+
+class CallTracker:
+    """Per-thread and per-asyncio-task stack of the instrumented functions that are currently executing.
+
+    DynaPyt reports no exit for a call that ends with an exception, so exits
+    are matched to the innermost active frame of the same function and any
+    frames above it are popped with it. A per-function count of active frames
+    makes the recursion depth of a new call and the "not active" check of an
+    unmatched exit O(1).
+    """
+
+    def __init__(self) -> None:
+        self._tasks: TaskLocal[_TaskCalls] = TaskLocal(_TaskCalls)
+
+    @property
+    def top(self) -> Optional[CallFrame]:
+        return self._tasks.get().top
+
+    @property
+    def depth(self) -> int:
+        top = self._tasks.get().top
+        return top.depth if top is not None else 0
+
+    def active_count(self, function: Hashable) -> int:
+        return self._tasks.get().active.get(function, 0)
+
+    def begin_event(self) -> None:
+        """Start one runtime event on a tracker shared by several analyses, see LoopTracker.begin_event"""
+        state = self._tasks.get()
+        state.in_event = True
+        state.replay = None
+
+    def end_event(self) -> None:
+        state = self._tasks.get()
+        state.in_event = False
+        state.replay = None
+
+    def enter(self, function: Hashable) -> CallFrame:
+        """Push a call of function, returns its frame"""
+        state = self._tasks.get()
+        if state.in_event:
+            replay = state.replay
+            if replay is not None and replay[0] == "enter" and replay[1] == function:
+                return replay[2]
+            frame = self._enter(state, function)
+            state.replay = ("enter", function, frame)
+            return frame
+        return self._enter(state, function)
+
+    def exit(self, function: Hashable) -> List[CallFrame]:
+        """Leave the innermost call of function, returns the popped frames from the innermost one outwards"""
+        state = self._tasks.get()
+        if state.in_event:
+            replay = state.replay
+            if replay is not None and replay[0] == "exit" and replay[1] == function:
+                return replay[2]
+            popped = self._exit(state, function)
+            state.replay = ("exit", function, popped)
+            return popped
+        return self._exit(state, function)
+
+    def _enter(self, state: _TaskCalls, function: Hashable) -> CallFrame:
+        parent = state.top
+        active = state.active.get(function, 0) + 1
+        state.active[function] = active
+        frame = CallFrame(function, parent, active)
+        if parent is not None and parent.function == function:
+            parent.self_calls += 1
+        state.top = frame
+        return frame
+
+    def _exit(self, state: _TaskCalls, function: Hashable) -> List[CallFrame]:
+        if not state.active.get(function):
+            return []
+        popped = []
+        frame = state.top
+        while frame is not None:
+            popped.append(frame)
+            count = state.active[frame.function] - 1
+            if count:
+                state.active[frame.function] = count
+            else:
+                del state.active[frame.function]
+            if frame.function == function:
+                break
+            frame = frame.parent
+        state.top = frame.parent if frame is not None else None
+        return popped
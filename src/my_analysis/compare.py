@@ -0,0 +1,235 @@
+"""Compares the findings of two runs and reports the sites that got worse.
+
+Each argument is a findings file written by the analyses, or a directory
+that holds one, e.g. the output directory of my_analysis.incremental.
+Sites are matched by rule, source file and the source fingerprint of the
+finding, so edits elsewhere in a file do not break the match. Matched
+sites are compared by their estimated cost and by the iteration,
+allocation, byte, call and time metrics they carry. The exit status is 1
+when a site regressed by more than the threshold or a new site appeared.
+
+    python -m my_analysis.compare baseline/dynaperf_findings.jsonl candidate/dynaperf_findings.jsonl --threshold 0.1
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from .findings import DEFAULT_FINDINGS_PATH, RULES, read_findings
+
+# Metrics compared besides the cost, {metric: unit}
+COMPARED_METRICS = {
+    "iterations": "iterations",
+    "count": "allocations",
+    "peak_bytes": "bytes",
+    "net_bytes": "bytes",
+    "bytes_copied": "bytes copied",
+    "concatenations": "concatenations",
+    "calls": "calls",
+    "total_seconds": "seconds",
+}
+
+SiteKey = Tuple[str, Optional[str], str, str]  # (rule id, cost unit, file, fingerprint)
+
+
+def load(path: str) -> List[Dict[str, Any]]:
+    if os.path.isdir(path):
+        path = os.path.join(path, DEFAULT_FINDINGS_PATH)
+    return list(read_findings(path))
+
+
+def site_key(finding: Dict[str, Any], file: str) -> SiteKey:
+    # Findings written before fingerprints existed fall back to the line
+    fingerprint = finding.get("fingerprint") or f"line {finding.get('line')}"
+    return finding["rule_id"], finding.get("cost_unit"), file, fingerprint
+
+
+def match_files(baseline: List[str], candidate: List[str]) -> Dict[str, str]:
+    """{candidate file: baseline file} for the files whose paths share the longest tail of components"""
+    matched = {}
+    for path in candidate:
+        parts = _components(path)
+        best, best_length = None, 0
+        for other in baseline:
+            length = _common_tail(parts, _components(other))
+            if length > best_length:
+                best, best_length = other, length
+        if best is not None:
+            matched[path] = best
+    return matched
+
+
+def compare(baseline: List[Dict[str, Any]], candidate: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Results for every site of either run, sorted from the largest regression to the largest improvement.
+
+    Findings without an estimated cost, such as unused variables, are not compared.
+    """
+    baseline = [finding for finding in baseline if finding.get("cost") is not None]
+    candidate = [finding for finding in candidate if finding.get("cost") is not None]
+    files = match_files(sorted({f["file"] for f in baseline}), sorted({f["file"] for f in candidate}))
+    before = _by_site(baseline, lambda file: file)
+    after = _by_site(candidate, lambda file: files.get(file, file))
+
+    results = []
+    for key in before.keys() | after.keys():
+        old, new = before.get(key), after.get(key)
+        if old is None:
+            status = "new"
+        elif new is None:
+            status = "resolved"
+        else:
+            status = "matched"
+        shown = new if new is not None else old
+        old_cost, new_cost = _cost(old), _cost(new)
+        deltas = {}
+        for metric, unit in COMPARED_METRICS.items():
+            old_value, new_value = _metric(old, metric), _metric(new, metric)
+            if old_value is not None or new_value is not None:
+                deltas[metric] = {"baseline": old_value, "candidate": new_value, "unit": unit,
+                                  "change": relative_change(old_value or 0, new_value or 0)}
+        results.append({
+            "status": status, "rule_id": shown["rule_id"], "analysis": shown["analysis"], "file": shown["file"],
+            "line": shown.get("line"), "iid": shown.get("iid"), "message": shown["message"],
+            "fingerprint": shown.get("fingerprint"), "cost_unit": shown.get("cost_unit"),
+            "baseline_cost": old_cost, "candidate_cost": new_cost,
+            "change": relative_change(old_cost, new_cost), "metrics": deltas,
+        })
+    results.sort(key=lambda result: (result["change"], result["candidate_cost"] - result["baseline_cost"]), reverse=True)
+    return results
+
+
+def relative_change(before: float, after: float) -> float:
+    """(after - before) / before, infinite for a cost that appeared"""
+    if before:
+        return (after - before) / before
+    return math.inf if after else 0.0
+
+
+def is_regression(result: Dict[str, Any], threshold: float, min_cost: float) -> bool:
+    if result["candidate_cost"] - result["baseline_cost"] < min_cost:
+        return False
+    return result["status"] == "new" or result["change"] > threshold
+
+
+def print_report(results: List[Dict[str, Any]], threshold: float, min_cost: float) -> None:
+    print("\n===== Performance Comparison Report =====")
+    counts = {status: sum(1 for result in results if result["status"] == status)
+              for status in ("matched", "new", "resolved")}
+    print(f"{counts['matched']} sites in both runs, {counts['new']} new, {counts['resolved']} resolved")
+
+    regressions = [result for result in results if is_regression(result, threshold, min_cost)]
+    improvements = [result for result in results if result["change"] < 0]
+    improvements.reverse()
+    if regressions:
+        print(f"\nRegressions above {100.0 * threshold:.0f}%, largest first:")
+        for rank, result in enumerate(regressions, 1):
+            _print_result(rank, result)
+    else:
+        print(f"\nNo site regressed by more than {100.0 * threshold:.0f}%")
+    if improvements:
+        print("\nImprovements, largest first:")
+        for rank, result in enumerate(improvements, 1):
+            _print_result(rank, result)
+    print("\n===== Comparison Complete =====")
+
+
+def _print_result(rank: int, result: Dict[str, Any]) -> None:
+    rule = RULES.get(result["rule_id"], result["rule_id"])
+    location = f"{result['file']}:{result['line']}" if result.get("line") else result["file"]
+    print(f"\n{rank}. [{result['rule_id']} {rule}] {result['message']} at {location}")
+    unit = result["cost_unit"] or "cost"
+    if result["status"] == "new":
+        print(f"   New site, cost {_format_number(result['candidate_cost'])} {unit}")
+    elif result["status"] == "resolved":
+        print(f"   Resolved, cost was {_format_number(result['baseline_cost'])} {unit}")
+    else:
+        print(f"   Cost: {_format_number(result['baseline_cost'])} -> {_format_number(result['candidate_cost'])} {unit} "
+              f"({_format_change(result['change'])})")
+    for metric, delta in result["metrics"].items():
+        if result["status"] == "matched" and delta["baseline"] != delta["candidate"]:
+            print(f"   {metric}: {_format_number(delta['baseline'])} -> {_format_number(delta['candidate'])} "
+                  f"{delta['unit']} ({_format_change(delta['change'])})")
+
+
+def _to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Infinite changes, of sites or metrics that appeared, are not valid JSON and become null"""
+    metrics = {metric: dict(delta, change=_finite(delta["change"])) for metric, delta in result["metrics"].items()}
+    return dict(result, change=_finite(result["change"]), metrics=metrics)
+
+
+def _finite(change: float) -> Optional[float]:
+    return None if math.isinf(change) else change
+
+
+def _by_site(findings: List[Dict[str, Any]], file_of) -> Dict[SiteKey, Dict[str, Any]]:
+    sites: Dict[SiteKey, Dict[str, Any]] = {}
+    for finding in findings:
+        key = site_key(finding, file_of(finding["file"]))
+        # A site reported twice in one run keeps its costliest finding
+        if key not in sites or _cost(finding) > _cost(sites[key]):
+            sites[key] = finding
+    return sites
+
+
+def _cost(finding: Optional[Dict[str, Any]]) -> float:
+    if finding is None or finding.get("cost") is None:
+        return 0.0
+    return float(finding["cost"])
+
+
+def _metric(finding: Optional[Dict[str, Any]], metric: str) -> Optional[float]:
+    if finding is None:
+        return None
+    value = finding.get("metrics", {}).get(metric)
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _components(path: str) -> List[str]:
+    return os.path.normpath(path).replace("\\", "/").split("/")
+
+
+def _common_tail(a: List[str], b: List[str]) -> int:
+    length = 0
+    while length < min(len(a), len(b)) and a[-1 - length] == b[-1 - length]:
+        length += 1
+    return length
+
+
+def _format_number(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float) and not value.is_integer():
+        return f"{value:.4g}"
+    return f"{int(value)}"
+
+
+def _format_change(change: float) -> str:
+    if math.isinf(change):
+        return "new"
+    return f"{100.0 * change:+.1f}%"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the findings of a baseline and a candidate run")
+    parser.add_argument("baseline", help="Findings file or directory of the baseline run")
+    parser.add_argument("candidate", help="Findings file or directory of the candidate run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative cost increase above which a site counts as a regression")
+    parser.add_argument("--min-cost", type=float, default=0.0,
+                        help="Cost increases smaller than this are never regressions")
+    parser.add_argument("--output", help="JSON file the comparison is written to")
+    args = parser.parse_args()
+
+    results = compare(load(args.baseline), load(args.candidate))
+    print_report(results, args.threshold, args.min_cost)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([_to_json(result) for result in results], f, indent=2, ensure_ascii=False)
+    regressed = any(is_regression(result, args.threshold, args.min_cost) for result in results)
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
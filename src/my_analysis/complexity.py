@@ -0,0 +1,238 @@
+"""Estimates how the loops and functions of a program grow with its input size.
+
+The program is instrumented once for ComplexityAnalysis and run at every
+given size. It reads its size through input_size(), the size hook:
+
+    from my_analysis.complexity import input_size
+    data = list(range(input_size(1000)))
+
+The iteration count of every loop and the call count of every function are
+then fitted to a * f(n) + b for each growth curve f, and the curve with the
+smallest relative error is reported with a confidence that reflects how much
+worse the next best curve fits.
+
+    python -m my_analysis.complexity --entry prog.py --sizes 100 200 400 800 1600
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+SIZE_ENV = "DYNAPERF_INPUT_SIZE"
+
+ANALYSIS = "my_analysis.ComplexityAnalysis.ComplexityAnalysis"
+
+# Candidate growth curves, simplest first
+GROWTH_CURVES: List[Tuple[str, Callable[[float], float]]] = [
+    ("1", lambda n: 1.0),
+    ("log n", lambda n: math.log2(n)),
+    ("n", lambda n: n),
+    ("n log n", lambda n: n * math.log2(n)),
+    ("n²", lambda n: n ** 2),
+    ("n³", lambda n: n ** 3),
+    ("2ⁿ", lambda n: 2.0 ** n),
+]
+
+# Curves whose error is within this fraction of the best one count as a tie, which the simpler curve wins
+TIE_TOLERANCE = 0.05
+
+# Confidence from which a fit is labelled high or medium
+HIGH_CONFIDENCE = 0.5
+MEDIUM_CONFIDENCE = 0.2
+
+# Growth faster than linear
+SUPERLINEAR = {"n log n", "n²", "n³", "2ⁿ"}
+
+
+def input_size(default: int) -> int:
+    """Size the complexity driver is running the program at, default when run on its own"""
+    value = os.environ.get(SIZE_ENV)
+    return int(value) if value else default
+
+
+class Fit:
+    __slots__ = ("curve", "a", "b", "error", "confidence", "runner_up")
+
+    def __init__(self, curve: str, a: float, b: float, error: float) -> None:
+        self.curve = curve
+        self.a = a  # count ~ a * f(n) + b
+        self.b = b
+        self.error = error  # Root mean square of the residuals relative to the counts
+        self.confidence = 0.0  # 1 - error / error of the runner-up, 0 when both fit equally well
+        self.runner_up: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        if self.confidence >= HIGH_CONFIDENCE:
+            return "high"
+        return "medium" if self.confidence >= MEDIUM_CONFIDENCE else "low"
+
+
+def fit_curve(name: str, f: Callable[[float], float], sizes: List[int], counts: List[float]) -> Optional[Fit]:
+    """Least squares fit of counts to a * f(n) + b with a > 0, None if the curve cannot describe them"""
+    try:
+        xs = [f(n) for n in sizes]
+        k = len(xs)
+        mean_x, mean_y = sum(xs) / k, sum(counts) / k
+        var_x = sum((x - mean_x) ** 2 for x in xs)
+        if var_x == 0:
+            a = 0.0
+        else:
+            a = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, counts)) / var_x
+            if a <= 0:
+                # Flat or shrinking counts are the constant curve's to describe
+                return None
+        b = mean_y - a * mean_x
+        error = math.sqrt(sum(((y - (a * x + b)) / max(abs(y), 1.0)) ** 2 for x, y in zip(xs, counts)) / k)
+    except (OverflowError, ValueError, ZeroDivisionError):
+        # E.g. 2ⁿ at sizes far beyond what an exponential site could run at
+        return None
+    if math.isnan(error) or math.isinf(error):
+        return None
+    return Fit(name, a, b, error)
+
+
+def best_fit(sizes: List[int], counts: List[float]) -> Optional[Fit]:
+    fits = [fit for fit in (fit_curve(name, f, sizes, counts) for name, f in GROWTH_CURVES) if fit is not None]
+    if not fits:
+        return None
+    smallest = min(fit.error for fit in fits)
+    # fits are in the order of GROWTH_CURVES, so the first one within the tolerance is the simplest
+    best = next(fit for fit in fits if fit.error <= smallest * (1 + TIE_TOLERANCE) + 1e-12)
+    others = [fit for fit in fits if fit is not best]
+    if others:
+        runner_up = min(others, key=lambda fit: fit.error)
+        best.runner_up = runner_up.curve
+        best.confidence = 1.0 - best.error / runner_up.error if runner_up.error > 0 else 0.0
+        best.confidence = max(best.confidence, 0.0)
+    else:
+        best.confidence = 1.0
+    return best
+
+
+class ComplexityDriver:
+    def __init__(self, entry: Path, root: Path, sizes: List[int], timeout: float, work_dir: Path) -> None:
+        self.entry = entry
+        self.root = root
+        self.sizes = sizes
+        self.timeout = timeout
+        self.work_dir = work_dir
+        self.tree_dir = work_dir / "tree"
+
+    def run(self) -> Dict[Tuple[str, int], dict]:
+        """Counts of every site at every size, {(file, iid): site with "counts": {size: count}}"""
+        from .instrument_tree import TreeInstrumenter
+
+        counts = TreeInstrumenter(self.root, self.tree_dir, [ANALYSIS], os.cpu_count() or 1, []).run()
+        if counts["failed"]:
+            print(f"{counts['failed']} modules could not be instrumented", file=sys.stderr)
+
+        sites: Dict[Tuple[str, int], dict] = {}
+        for size in self.sizes:
+            for site in self._run_at(size):
+                key = (site["file"], site["iid"])
+                sites.setdefault(key, dict(site, counts={}))["counts"][size] = site["count"]
+        for site in sites.values():
+            del site["count"]
+            site["file"] = self._project_path(site["file"])
+        return sites
+
+    def _run_at(self, size: int) -> List[dict]:
+        output = self.work_dir / f"counts-{size}.json"
+        env = dict(os.environ)
+        env[SIZE_ENV] = str(size)
+        env["DYNAPERF_FINDINGS"] = ""
+        src_dir = str(Path(__file__).resolve().parent.parent)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_dir, env.get("PYTHONPATH")]))
+        entry = self.tree_dir / self.entry.relative_to(self.root)
+        command = [sys.executable, "-m", "dynapyt.run_analysis", "--entry", str(entry),
+                   "--analysis", f"{ANALYSIS};output_file={output}"]
+        print(f"Running at size {size}")
+        result = subprocess.run(command, cwd=entry.parent, env=env, stdout=subprocess.DEVNULL, timeout=self.timeout)
+        if result.returncode != 0 or not output.exists():
+            raise RuntimeError(f"run at size {size} failed with exit status {result.returncode}")
+        with open(output, "r", encoding="utf-8") as f:
+            return json.load(f)["sites"]
+
+    def _project_path(self, path: str) -> str:
+        try:
+            return str(self.root / Path(path).resolve().relative_to(self.tree_dir.resolve()))
+        except ValueError:
+            return path
+
+
+def analyse(sites: Dict[Tuple[str, int], dict], sizes: List[int], min_count: int) -> List[dict]:
+    results = []
+    for site in sites.values():
+        counts = [site["counts"].get(size, 0) for size in sizes]
+        if max(counts) < min_count:
+            continue
+        fit = best_fit(sizes, counts)
+        if fit is None:
+            continue
+        results.append(dict(site, counts={str(size): count for size, count in zip(sizes, counts)},
+                            growth=fit.curve, coefficient=fit.a, intercept=fit.b, error=fit.error,
+                            confidence=fit.confidence, confidence_label=fit.label, runner_up=fit.runner_up))
+    # Fastest growing first, then the most work at the largest size
+    order = {name: rank for rank, (name, _) in enumerate(GROWTH_CURVES)}
+    results.sort(key=lambda result: (-order[result["growth"]], -counts_at_largest(result)))
+    return results
+
+
+def counts_at_largest(result: dict) -> int:
+    return list(result["counts"].values())[-1]
+
+
+def print_report(results: List[dict], sizes: List[int]) -> None:
+    print("\n===== Complexity Estimation Report =====")
+    print(f"Input sizes: {', '.join(str(size) for size in sizes)}")
+    if len(sizes) < 4:
+        print("Warning: fewer than 4 sizes, growth curves are hard to tell apart")
+    for result in results:
+        what = f"function {result['name']}" if result["kind"] == "function" else f"{result['kind']} loop"
+        unit = "calls" if result["kind"] == "function" else "iterations"
+        counts = ", ".join(str(count) for count in result["counts"].values())
+        print(f"\n{what} at {result['file']}:{result['line']} (iid: {result['iid']})")
+        print(f"  {unit}: {counts}")
+        print(f"  Best fit: O({result['growth']}), {result['confidence_label']} confidence "
+              f"({result['confidence']:.2f}, relative error {result['error']:.3f}"
+              + (f", next best O({result['runner_up']})" if result["runner_up"] else "") + ")")
+        if result["growth"] in SUPERLINEAR:
+            print("  Warning: grows faster than linearly with the input size")
+    print("\n===== Analysis Complete =====")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Estimate the growth of loops and functions with the input size")
+    parser.add_argument("--entry", required=True, help="Entry script, which reads its size with input_size()")
+    parser.add_argument("--sizes", type=int, nargs="+", required=True, help="Input sizes to run at, at least 3")
+    parser.add_argument("--root", help="Project directory to instrument, the entry's directory by default")
+    parser.add_argument("--min-count", type=int, default=10,
+                        help="Sites with fewer calls or iterations at every size are not reported")
+    parser.add_argument("--output", help="JSON file the fits are written to")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds after which a run is killed")
+    args = parser.parse_args()
+
+    sizes = sorted(set(args.sizes))
+    if len(sizes) < 3 or sizes[0] < 1:
+        parser.error("--sizes needs at least 3 distinct positive sizes")
+    entry = Path(args.entry).resolve()
+    root = Path(args.root).resolve() if args.root else entry.parent
+
+    with tempfile.TemporaryDirectory(prefix="dynaperf-complexity-") as work_dir:
+        sites = ComplexityDriver(entry, root, sizes, args.timeout, Path(work_dir)).run()
+    results = analyse(sites, sizes, args.min_count)
+    print_report(results, sizes)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"sizes": sizes, "sites": results}, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import argparse
+import atexit
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from .reporting import INFO, ReportSink
+from .source_index import get_source_index, iid_line
+
+# Rule ids from the issue table in the README
+RULES = {
+    "R1-1": "Inefficient API Usage",
+    "R1-2": "Excessive Recursion",
+    "R1-3": "Memoization Opportunity",
+    "R2-1": "String Concatenation in Loops",
+    "R2-2": "Nested Looping",
+    "R2-3": "Object Creation in Loops",
+    "R2-4": "Loop-Invariant Computation",
+    "R2-5": "Vectorizable Numeric Loop",
+    "R4-2": "Unused Variables",
+}
+
+# Findings file of a run, the SARIF log is written next to it at exit. An empty value disables both.
+FINDINGS_ENV = "DYNAPERF_FINDINGS"
+DEFAULT_FINDINGS_PATH = "dynaperf_findings.jsonl"
+
+SARIF_SCHEMA = "https://json.schemastore.org/sarif-2.1.0.json"
+
+
+class Finding:
+    """One performance issue found by an analysis"""
+
+    __slots__ = ("analysis", "rule_id", "message", "file", "line", "iid", "metrics", "cost", "cost_unit", "level",
+                 "fingerprint")
+
+    def __init__(self, analysis: str, rule_id: str, message: str, file: str, line: Optional[int], iid: Optional[int],
+                 metrics: Optional[Dict[str, Any]] = None, cost: Optional[float] = None,
+                 cost_unit: Optional[str] = None, level: str = "warning", fingerprint: Optional[str] = None) -> None:
+        self.analysis = analysis  # Class name of the analysis
+        self.rule_id = rule_id  # Issue id from RULES
+        self.message = message
+        self.file = file  # Source file, without DynaPyt's .orig suffix
+        self.line = line
+        self.iid = iid
+        self.metrics = metrics or {}  # Measured values, JSON serializable
+        self.cost = cost  # Estimated cost of the issue, in cost_unit
+        self.cost_unit = cost_unit
+        self.level = level  # SARIF level: "error", "warning" or "note"
+        self.fingerprint = fingerprint  # Source fingerprint that matches the site across runs, see SourceIndex.fingerprint
+
+    @classmethod
+    def at(cls, analysis: str, rule_id: str, dyn_ast: str, iid: int, message: str, **kwargs) -> "Finding":
+        """Finding located at an iid of an instrumented file"""
+        kwargs.setdefault("fingerprint", get_source_index(dyn_ast).fingerprint(iid))
+        return cls(analysis, rule_id, message, source_file(dyn_ast), iid_line(dyn_ast, iid), iid, **kwargs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class FindingsWriter:
+    """Streams findings to a JSON Lines file through a background report sink"""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path  # None disables the writer
+        self._sink = ReportSink(path, INFO) if path else None
+        # Findings emitted by this process. The file is only opened, and truncated, by the first one, so a process
+        # that emitted nothing, e.g. the one that instruments, must not convert what an earlier run left there.
+        self.emitted = 0
+
+    def emit(self, finding: Finding) -> None:
+        if self._sink is not None:
+            self.emitted += 1
+            self._sink.info(json.dumps(finding.to_dict(), ensure_ascii=False, default=str))
+
+    def flush(self) -> None:
+        if self._sink is not None:
+            self._sink.flush()
+
+    def write_sarif(self, sarif_path: Optional[str] = None) -> Optional[str]:
+        """Convert everything written so far to a SARIF log, returns its path"""
+        if self._sink is None:
+            return None
+        self.flush()
+        if not os.path.exists(self.path):
+            return None
+        sarif_path = sarif_path or os.path.splitext(self.path)[0] + ".sarif"
+        write_sarif(read_findings(self.path), sarif_path)
+        return sarif_path
+
+
+_writer: Optional[FindingsWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_findings_writer() -> FindingsWriter:
+    """Findings writer shared by all analyses of a run"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = FindingsWriter(os.environ.get(FINDINGS_ENV, DEFAULT_FINDINGS_PATH))
+        return _writer
+
+
+def source_file(dyn_ast: str) -> str:
+    return dyn_ast[:-5] if dyn_ast.endswith(".orig") else dyn_ast
+
+
+def read_findings(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def to_sarif(findings: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    rules_used = set()
+    results = []
+    for finding in findings:
+        rules_used.add(finding["rule_id"])
+        location = {"artifactLocation": {"uri": _file_uri(finding["file"])}}
+        if finding.get("line"):
+            location["region"] = {"startLine": finding["line"]}
+        properties = {"analysis": finding["analysis"], "iid": finding.get("iid"), "metrics": finding.get("metrics", {})}
+        if finding.get("cost") is not None:
+            properties["cost"] = finding["cost"]
+            properties["costUnit"] = finding.get("cost_unit")
+        result = {
+            "ruleId": finding["rule_id"],
+            "level": finding.get("level", "warning"),
+            "message": {"text": finding["message"]},
+            "locations": [{"physicalLocation": location}],
+            "properties": properties,
+        }
+        if finding.get("fingerprint"):
+            result["partialFingerprints"] = {"dynaperfSource/v1": finding["fingerprint"]}
+        results.append(result)
+
+    rules = [{"id": rule_id, "name": RULES.get(rule_id, rule_id), "shortDescription": {"text": RULES.get(rule_id, rule_id)}}
+             for rule_id in sorted(rules_used)]
+    return {
+        "$schema": SARIF_SCHEMA,
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {"name": "DynaPerf", "informationUri": "https://github.com/immengzi/DynaPerf", "rules": rules}},
+            "results": results,
+        }],
+    }
+
+
+def write_sarif(findings: Iterable[Dict[str, Any]], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(to_sarif(findings), f, indent=2, ensure_ascii=False)
+
+
+def _file_uri(path: str) -> str:
+    path = path.replace(os.sep, "/")
+    return "file://" + path if path.startswith("/") else path
+
+
+def _write_sarif_at_exit() -> None:
+    if _writer is not None and _writer.emitted:
+        try:
+            _writer.write_sarif()
+        except (OSError, ValueError):
+            pass
+
+
+def _reset_after_fork() -> None:
+    # A forked child appends to its parent's file, the parent converts it
+    if _writer is not None:
+        _writer.emitted = 0
+
+
+# Registered after the report sinks' own flush, so it runs before it
+atexit.register(_write_sarif_at_exit)
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert DynaPerf findings from JSON Lines to SARIF")
+    parser.add_argument("findings", nargs="+", help="JSON Lines files written by the analyses")
+    parser.add_argument("--output", required=True, help="SARIF file to write")
+    args = parser.parse_args()
+    write_sarif((finding for path in args.findings for finding in read_findings(path)), args.output)
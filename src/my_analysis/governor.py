@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+MAX_SLOWDOWN_ENV = "DYNAPERF_MAX_SLOWDOWN"
+DEFAULT_MAX_SLOWDOWN = "2.0"
+
+# Events a site is fully processed for before the budget may retire it
+WARMUP_EVENTS = 64
+
+# Charged events between two checks of the budget, and the least time a check looks back over
+CHECK_EVERY = 1024
+MIN_WINDOW = 0.05
+
+
+class GovernedSite:
+    """Time spent processing the events of one site of one analysis"""
+
+    __slots__ = ("analysis", "site", "events", "seconds", "window", "epoch", "counted", "settled", "reason")
+
+    def __init__(self, analysis: str, site: Hashable) -> None:
+        self.analysis = analysis
+        self.site = site
+        self.events = 0  # Fully processed events
+        self.seconds = 0.0  # Time spent processing them
+        self.window = 0.0  # Part of that time spent since the governor's last check
+        self.epoch = 0  # Check the window belongs to
+        self.counted = 0  # Events only counted once the site was settled
+        self.settled = False  # The analysis only counts the events of a settled site
+        self.reason: Optional[str] = None  # "verdict" when the analysis settled it, "budget" when the governor did
+
+
+class Governor:
+    """Keeps the time analyses spend in their hooks within an overhead budget.
+
+    Analyses time the detailed processing of each event and charge it to
+    the site the event belongs to. A site whose verdict cannot change any
+    more is settled by its analysis, after which its events are only
+    counted. Every CHECK_EVERY charges the governor compares the processing
+    time of the last window with the time the program ran in it, and when
+    the slowdown exceeds max_slowdown it settles the sites that cost the
+    most until the window would have been within budget. Sites are always
+    processed for WARMUP_EVENTS events first, so a long-running program
+    pays for the detailed analysis mostly while it warms up.
+
+    Only time spent in the governed handlers is measured, the cost of the
+    instrumentation itself is not part of the budget.
+    """
+
+    def __init__(self, max_slowdown: float = 2.0, warmup: int = WARMUP_EVENTS) -> None:
+        # 0 or less turns the budget off, sites are then only settled by their analyses
+        self.max_slowdown = float(max_slowdown)
+        self.warmup = int(warmup)
+        self.started = time.perf_counter()
+        self.seconds = 0.0  # Processing time charged by all sites
+        self._sites: Dict[Tuple[str, Hashable], GovernedSite] = {}
+        self._epoch = 0
+        self._pending = 0  # Charges since the last check
+        self._window_start = self.started
+        self._window_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def site(self, analysis: str, site: Hashable) -> GovernedSite:
+        """Handle of a site, analyses keep it next to their own state for the site"""
+        governed = self._sites.get((analysis, site))
+        if governed is None:
+            governed = self._sites.setdefault((analysis, site), GovernedSite(analysis, site))
+        return governed
+
+    def charge(self, governed: GovernedSite, seconds: float) -> None:
+        governed.events += 1
+        governed.seconds += seconds
+        if governed.epoch != self._epoch:
+            governed.epoch = self._epoch
+            governed.window = 0.0
+        governed.window += seconds
+        self.seconds += seconds
+        self._window_seconds += seconds
+        self._pending += 1
+        if self._pending >= CHECK_EVERY:
+            self._check()
+
+    def settle(self, governed: GovernedSite, reason: str = "verdict") -> None:
+        if not governed.settled:
+            governed.settled = True
+            governed.reason = reason
+
+    def _check(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._pending = 0
+            now = time.perf_counter()
+            elapsed = now - self._window_start
+            if elapsed < MIN_WINDOW:
+                return
+            processing = self._window_seconds
+            if self.max_slowdown > 0:
+                program = max(elapsed - processing, 0.0)
+                excess = processing - (self.max_slowdown - 1.0) * program
+                if excess > 0:
+                    self._retire(excess)
+            self._epoch += 1
+            self._window_start = now
+            self._window_seconds = 0.0
+        finally:
+            self._lock.release()
+
+    def _retire(self, excess: float) -> None:
+        """Settle the costliest warmed-up sites of the window until they account for the excess time"""
+        candidates = [governed for governed in list(self._sites.values())
+                      if not governed.settled and governed.epoch == self._epoch and governed.events >= self.warmup]
+        candidates.sort(key=lambda governed: governed.window, reverse=True)
+        for governed in candidates:
+            if excess <= 0:
+                break
+            self.settle(governed, "budget")
+            excess -= governed.window
+
+    def sites_of(self, analysis: str) -> List[GovernedSite]:
+        return [governed for (name, _), governed in list(self._sites.items()) if name == analysis]
+
+    def describe(self, analysis: str) -> Optional[str]:
+        """Summary of what the governor did for an analysis, None when every event was fully processed"""
+        sites = self.sites_of(analysis)
+        counted = sum(governed.counted for governed in sites)
+        if not counted:
+            return None
+        settled = [governed for governed in sites if governed.settled]
+        retired = sum(1 for governed in settled if governed.reason == "budget")
+        processed = sum(governed.events for governed in sites)
+        total = processed + counted
+        share = 100.0 * processed / total if total else 100.0
+        elapsed = time.perf_counter() - self.started
+        text = f"{len(settled)} of {len(sites)} sites settled"
+        if self.max_slowdown > 0:
+            text += f", {retired} of them to stay within {self.max_slowdown:g}x"
+        return (f"{text}; fully processed {processed} of {total} events ({share:.1f}%), "
+                f"governed handlers took {self.seconds:.2f} s of the {elapsed:.2f} s run")
+
+
+_governor: Optional[Governor] = None
+_governor_lock = threading.Lock()
+
+
+def get_governor() -> Governor:
+    """Governor shared by all analyses of a run, its budget is read from DYNAPERF_MAX_SLOWDOWN"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            value = os.environ.get(MAX_SLOWDOWN_ENV, DEFAULT_MAX_SLOWDOWN).strip()
+            _governor = Governor(float(value) if value else 0.0)
+        return _governor
@@ -0,0 +1,223 @@
+"""Re-analyses only the modules of a project that changed since the last run.
+
+The findings of every run are cached per module together with the hash of
+the module's source. On the next run the modules whose hash changed, and the
+modules that import them directly or indirectly, are instrumented and
+analysed again; every other module is copied without instrumentation and
+keeps the findings it had. The fresh and the cached findings are merged
+into one findings file and SARIF log that point at the project's sources.
+
+    python -m my_analysis.incremental <project_dir> --out <output_dir> --entry main.py --analysis my_analysis.CompositeAnalysis.CompositeAnalysis
+
+Findings of a cached module describe the run in which it was last analysed:
+a change in how an unchanged module is called from changed code shows up in
+the findings of the changed code, not in those of the cached module. Pass
+--full to analyse everything again.
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from .findings import FINDINGS_ENV, read_findings, write_sarif
+from .instrument_tree import TreeInstrumenter, walk_tree
+
+CACHE_NAME = ".dynaperf-findings-cache.json"
+CACHE_VERSION = 1
+
+RUN_FINDINGS = "dynaperf_run_findings.jsonl"
+MERGED_FINDINGS = "dynaperf_findings.jsonl"
+
+
+def module_name(relative: Path) -> str:
+    parts = list(relative.with_suffix("").parts)
+    if parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def imported_modules(tree: ast.AST, package: str) -> Iterable[str]:
+    """Modules an import statement can refer to, relative imports resolved against package"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ""
+            if node.level:
+                parent = package.split(".") if package else []
+                parent = parent[:len(parent) - (node.level - 1)] if node.level > 1 else parent
+                base = ".".join(parent + ([base] if base else []))
+            if base:
+                yield base
+            # "from package import name" may import the submodule package.name
+            for alias in node.names:
+                yield f"{base}.{alias.name}" if base else alias.name
+
+
+class ImportGraph:
+    """Which project modules import which, from the import statements of their sources"""
+
+    def __init__(self, root: Path, names: Iterable[str]) -> None:
+        modules = {module_name(Path(name)): name for name in names}
+        self.importers: Dict[str, Set[str]] = {name: set() for name in modules.values()}
+        for module, name in modules.items():
+            path = root / name
+            package = module if path.name == "__init__.py" else module.rpartition(".")[0]
+            try:
+                with open(path, "rb") as f:
+                    tree = ast.parse(f.read(), str(path))
+            except (SyntaxError, ValueError, OSError):
+                continue
+            for imported in imported_modules(tree, package):
+                # Importing a.b.c runs a/__init__.py and a/b/__init__.py as well
+                parts = imported.split(".")
+                for i in range(1, len(parts) + 1):
+                    target = modules.get(".".join(parts[:i]))
+                    if target is not None and target != name:
+                        self.importers[target].add(name)
+
+    def affected(self, changed: Set[str]) -> Set[str]:
+        """Changed modules and every module that imports one of them, directly or through other modules"""
+        affected = set(changed)
+        pending = list(changed)
+        while pending:
+            for importer in self.importers.get(pending.pop(), ()):
+                if importer not in affected:
+                    affected.add(importer)
+                    pending.append(importer)
+        return affected
+
+
+class IncrementalRunner:
+    def __init__(self, root: Path, out_dir: Path, entry: str, analyses: List[str], jobs: int,
+                 exclude: List[str], full: bool = False) -> None:
+        self.root = root
+        self.out_dir = out_dir
+        self.entry = entry
+        self.analyses = analyses
+        self.jobs = jobs
+        self.exclude = exclude
+        self.cache_path = out_dir / CACHE_NAME
+        self.cache = self._load_cache(full)
+
+    def run(self) -> int:
+        hashes = {}
+        for relative in walk_tree(self.root, self.out_dir, self.exclude):
+            if relative.suffix == ".py":
+                with open(self.root / relative, "rb") as f:
+                    hashes[relative.as_posix()] = hashlib.sha256(f.read()).hexdigest()
+
+        files = self.cache["files"]
+        changed = {name for name, digest in hashes.items() if files.get(name, {}).get("hash") != digest}
+        affected = ImportGraph(self.root, hashes).affected(changed)
+        print(f"{len(changed)} changed modules, {len(affected)} to analyse, {len(hashes) - len(affected)} from cache")
+
+        counts = TreeInstrumenter(self.root, self.out_dir, self.analyses, self.jobs, self.exclude, only=affected).run()
+        if counts["failed"]:
+            print(f"{counts['failed']} modules could not be instrumented", file=sys.stderr)
+
+        run_findings = self.out_dir / RUN_FINDINGS
+        if run_findings.exists():
+            run_findings.unlink()
+        returncode = self._run_analysis(run_findings)
+        if returncode != 0:
+            # Findings of a failed run may be incomplete, keep the cache as it was
+            print(f"Analysis run exited with status {returncode}, cache not updated", file=sys.stderr)
+            return returncode
+
+        fresh = self._findings_by_module(run_findings)
+        for name in list(files):
+            if name not in hashes:
+                del files[name]
+        for name in affected:
+            files[name] = {"hash": hashes[name], "findings": fresh.pop(name, [])}
+        self._save_cache()
+
+        merged = [finding for name in sorted(files) for finding in files[name]["findings"]]
+        # Findings in code outside the project, e.g. instrumented libraries, are not cached
+        merged += [finding for findings in fresh.values() for finding in findings]
+        merged_path = self.out_dir / MERGED_FINDINGS
+        with open(merged_path, "w", encoding="utf-8") as f:
+            for finding in merged:
+                f.write(json.dumps(finding, ensure_ascii=False) + "\n")
+        write_sarif(merged, str(merged_path.with_suffix(".sarif")))
+        print(f"{len(merged)} findings written to {merged_path}")
+        return 0
+
+    def _run_analysis(self, findings_path: Path) -> int:
+        env = dict(os.environ)
+        env[FINDINGS_ENV] = str(findings_path)
+        src_dir = str(Path(__file__).resolve().parent.parent)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_dir, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "dynapyt.run_analysis", "--entry", str(self.out_dir / self.entry),
+                   "--analysis"] + self.analyses
+        return subprocess.run(command, cwd=self.out_dir, env=env).returncode
+
+    def _findings_by_module(self, path: Path) -> Dict[Optional[str], List[dict]]:
+        """Findings of a run per module, with their paths moved from the instrumented copy back to the project"""
+        by_module: Dict[Optional[str], List[dict]] = {}
+        if not path.exists():
+            return by_module
+        for finding in read_findings(str(path)):
+            name = None
+            try:
+                relative = Path(finding["file"]).resolve().relative_to(self.out_dir)
+                name = relative.as_posix()
+                finding["file"] = str(self.root / relative)
+            except ValueError:
+                pass
+            by_module.setdefault(name, []).append(finding)
+        return by_module
+
+    def _load_cache(self, full: bool) -> dict:
+        empty = {"version": CACHE_VERSION, "analyses": sorted(self.analyses), "files": {}}
+        if full:
+            return empty
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            # Findings of another analysis set say nothing about this one
+            if cache.get("version") == CACHE_VERSION and cache.get("analyses") == empty["analyses"]:
+                return cache
+        except (OSError, ValueError):
+            pass
+        return empty
+
+    def _save_cache(self) -> None:
+        temporary = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.cache, f, ensure_ascii=False)
+        os.replace(temporary, self.cache_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Analyse the modules of a project that changed since the last run")
+    parser.add_argument("root", help="Project directory")
+    parser.add_argument("--out", required=True, help="Directory holding the instrumented copy, the cache and the findings")
+    parser.add_argument("--entry", required=True, help="Entry script, relative to the project directory")
+    parser.add_argument("--analysis", nargs="+", required=True,
+                        help="Analyses to run (full dotted path, optionally followed by ;key=value options)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Instrumentation worker processes")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Glob patterns of files and directories to leave out")
+    parser.add_argument("--full", action="store_true", help="Ignore the cache and analyse every module")
+    args = parser.parse_args()
+
+    root, out_dir = Path(args.root).resolve(), Path(args.out).resolve()
+    if root == out_dir:
+        parser.error("--out must differ from the project directory, the sources are never modified")
+
+    start = time.perf_counter()
+    returncode = IncrementalRunner(root, out_dir, args.entry, args.analysis, args.jobs, args.exclude, args.full).run()
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""Instruments every Python file of a project tree in parallel.
+
+The tree is mirrored into an output directory, where each module is
+instrumented by DynaPyt in a pool of worker processes while the sources stay
+untouched. A manifest in the output directory records for every file the key
+it was instrumented with, a hash of the source, of the hooks the analyses
+select and of the DynaPyt version. Files whose key did not change are
+skipped, so after a small edit only the edited modules are instrumented
+again.
+
+    python -m my_analysis.instrument_tree <project_dir> --out <output_dir> --analysis my_analysis.CompositeAnalysis.CompositeAnalysis
+    python -m dynapyt.run_analysis --entry <output_dir>/main.py --analysis my_analysis.CompositeAnalysis.CompositeAnalysis
+"""
+import argparse
+import contextlib
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+MANIFEST_NAME = ".dynaperf-instrument.json"
+MANIFEST_VERSION = 1
+
+# Directories that never hold project modules
+SKIPPED_DIRS = {"__pycache__", "node_modules", "site-packages", "venv", "env"}
+
+# Files handed to one worker at a time
+CHUNK_SIZE = 8
+
+# Manifest key prefix of modules that were copied without instrumenting them
+PLAIN_PREFIX = "plain:"
+
+
+def walk_tree(root: Path, out_dir: Path, exclude: List[str]) -> Iterator[Path]:
+    """Files of the tree relative to root, without hidden and virtualenv directories or DynaPyt's own outputs"""
+    for dir_path, dir_names, file_names in os.walk(root):
+        current = Path(dir_path)
+        dir_names[:] = sorted(name for name in dir_names
+                              if not name.startswith(".") and name not in SKIPPED_DIRS
+                              and current / name != out_dir
+                              and not _excluded(current.relative_to(root) / name, exclude))
+        for name in sorted(file_names):
+            if name.endswith(".py.orig") or name.endswith("-dynapyt.json") or name.endswith(".pyc"):
+                continue
+            relative = current.relative_to(root) / name
+            if not _excluded(relative, exclude):
+                yield relative
+
+
+def instrumentation_key(source: bytes, hooks_digest: str, dynapyt_version: str) -> str:
+    digest = hashlib.sha256(source)
+    digest.update(hooks_digest.encode())
+    digest.update(dynapyt_version.encode())
+    return digest.hexdigest()
+
+
+def hooks_digest(hooks: Dict[str, Dict[str, List[str]]]) -> str:
+    """Hash of the selected hooks, analyses that select the same hooks produce the same instrumented code"""
+    return hashlib.sha256(json.dumps(hooks, sort_keys=True).encode()).hexdigest()
+
+
+def outputs_of(target: Path) -> Tuple[Path, Path]:
+    """Copy of the original source and iid file DynaPyt writes next to an instrumented module"""
+    return target.with_name(target.name + ".orig"), target.with_name(target.stem + "-dynapyt.json")
+
+
+def instrument_one(task: Tuple[str, str, Dict[str, Dict[str, List[str]]]]) -> Tuple[str, bool, str]:
+    """Worker: instruments one mirrored module in place, returns (target, succeeded, DynaPyt's output)"""
+    from dynapyt.instrument.instrument import instrument_file
+
+    source, target, hooks = task
+    try:
+        orig, iids = outputs_of(Path(target))
+        # A stale iid file would make DynaPyt continue numbering from the previous version of the module
+        for stale in (orig, iids):
+            if stale.exists():
+                stale.unlink()
+        shutil.copyfile(source, target)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            status = instrument_file(target, hooks)
+        return target, status is None and orig.exists(), output.getvalue()
+    except Exception as e:
+        return target, False, f"{type(e).__name__}: {e}"
+
+
+class TreeInstrumenter:
+    def __init__(self, root: Path, out_dir: Path, analyses: List[str], jobs: int, exclude: List[str],
+                 only: Optional[Set[str]] = None) -> None:
+        from dynapyt.utils.hooks import get_hooks_from_analysis
+
+        self.root = root
+        self.out_dir = out_dir
+        self.jobs = jobs
+        self.exclude = exclude
+        self.only = only  # Modules to instrument, relative posix paths, the others are copied as they are. None for all.
+        self.hooks = get_hooks_from_analysis(analyses)
+        self.hooks_digest = hooks_digest(self.hooks)
+        self.dynapyt_version = _dynapyt_version()
+        self.manifest_path = out_dir / MANIFEST_NAME
+        self.manifest = self._load_manifest()
+
+    def run(self) -> Dict[str, int]:
+        counts = {"instrumented": 0, "unchanged": 0, "copied": 0, "removed": 0, "failed": 0}
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        files = self.manifest["files"]
+        seen = set()
+        tasks = []
+        for relative in walk_tree(self.root, self.out_dir, self.exclude):
+            name = relative.as_posix()
+            seen.add(name)
+            source, target = self.root / relative, self.out_dir / relative
+            if relative.suffix != ".py":
+                counts["copied" if _sync_file(source, target) else "unchanged"] += 1
+                continue
+            with open(source, "rb") as f:
+                content = f.read()
+            if self.only is not None and name not in self.only:
+                counts["copied" if self._copy_plain(name, content, source, target) else "unchanged"] += 1
+                continue
+            key = instrumentation_key(content, self.hooks_digest, self.dynapyt_version)
+            if files.get(name) == key and target.exists() and all(path.exists() for path in outputs_of(target)):
+                counts["unchanged"] += 1
+                continue
+            files.pop(name, None)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tasks.append((name, key, (str(source), str(target), self.hooks)))
+
+        for name in [name for name in files if name not in seen]:
+            self._remove(name)
+            counts["removed"] += 1
+
+        keys = {str(self.out_dir / name): (name, key) for name, key, _ in tasks}
+        for target, succeeded, output in self._instrument([task for _, _, task in tasks]):
+            name, key = keys[target]
+            if succeeded:
+                files[name] = key
+                counts["instrumented"] += 1
+            else:
+                counts["failed"] += 1
+                print(f"Failed to instrument {name}:\n{output.strip()}", file=sys.stderr)
+        self._save_manifest()
+        return counts
+
+    def _instrument(self, tasks: list) -> Iterator[Tuple[str, bool, str]]:
+        if self.jobs <= 1 or len(tasks) < 2:
+            for task in tasks:
+                yield instrument_one(task)
+            return
+        with Pool(min(self.jobs, len(tasks))) as pool:
+            yield from pool.imap_unordered(instrument_one, tasks, chunksize=CHUNK_SIZE)
+
+    def _copy_plain(self, name: str, content: bytes, source: Path, target: Path) -> bool:
+        key = PLAIN_PREFIX + hashlib.sha256(content).hexdigest()
+        files = self.manifest["files"]
+        if files.get(name) == key and target.exists():
+            return False
+        for stale in outputs_of(target):
+            if stale.exists():
+                stale.unlink()
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, target)
+        files[name] = key
+        return True
+
+    def _remove(self, name: str) -> None:
+        """Drop the outputs of a file that is no longer in the tree"""
+        target = self.out_dir / name
+        for path in (target,) + (outputs_of(target) if target.suffix == ".py" else ()):
+            if path.exists():
+                path.unlink()
+        self.manifest["files"].pop(name, None)
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION and manifest.get("root") == str(self.root):
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {"version": MANIFEST_VERSION, "root": str(self.root), "files": {}}
+
+    def _save_manifest(self) -> None:
+        # Written to a temporary file first so an interrupted run never leaves a truncated manifest
+        temporary = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(temporary, "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(temporary, self.manifest_path)
+
+
+def _sync_file(source: Path, target: Path) -> bool:
+    """Copy a non-Python file unless the copy is already up to date"""
+    stat = source.stat()
+    if target.exists():
+        copy = target.stat()
+        if copy.st_size == stat.st_size and copy.st_mtime_ns == stat.st_mtime_ns:
+            return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(source, target)
+    return True
+
+
+def _excluded(relative: Path, patterns: List[str]) -> bool:
+    name = relative.as_posix()
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative.name, pattern) for pattern in patterns)
+
+
+def _dynapyt_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("dynapyt")
+    except Exception:
+        return "unknown"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Instrument a project tree for DynaPerf analyses")
+    parser.add_argument("root", help="Project directory to instrument")
+    parser.add_argument("--out", required=True, help="Directory the instrumented copy of the tree is written to")
+    parser.add_argument("--analysis", nargs="+", required=True,
+                        help="Analyses to instrument for (full dotted path, optionally followed by ;key=value options)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Glob patterns of files and directories to leave out")
+    args = parser.parse_args()
+
+    root, out_dir = Path(args.root).resolve(), Path(args.out).resolve()
+    if root == out_dir:
+        parser.error("--out must differ from the project directory, the sources are never modified")
+
+    start = time.perf_counter()
+    counts = TreeInstrumenter(root, out_dir, args.analysis, args.jobs, args.exclude).run()
+    print(f"{counts['instrumented']} instrumented, {counts['unchanged']} unchanged, {counts['copied']} copied, "
+          f"{counts['removed']} removed, {counts['failed']} failed in {time.perf_counter() - start:.1f}s")
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,289 @@
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .task_local import TaskLocal
+
+
+class LoopFrame:
+    """One active execution of a loop"""
+
+    __slots__ = ("loop_id", "kind", "parent", "depth", "iterations", "finished", "start", "node")
+
+    def __init__(self, loop_id: Hashable, kind: str, parent: Optional["LoopFrame"]) -> None:
+        self.loop_id = loop_id
+        self.kind = kind  # "for" or "while"
+        self.parent = parent  # Enclosing loop frame, possibly in a calling function, None for an outermost loop
+        self.depth = parent.depth + 1 if parent is not None else 1
+        self.iterations = 0  # Iterations of this execution of the loop so far
+        self.finished = False  # Set by the header event that ends the loop
+        self.start = 0.0  # Time the loop was entered, set by analyses that time loops
+        self.node = None  # Calling context of the loop, set by the profiler
+
+    def chain(self) -> List["LoopFrame"]:
+        """Frames from the outermost loop down to this one"""
+        chain = []
+        frame = self
+        while frame is not None:
+            chain.append(frame)
+            frame = frame.parent
+        chain.reverse()
+        return chain
+
+
+class _CallScope:
+    """Loops executed by one active call, the bottom scope holds the loops of module level code"""
+
+    __slots__ = ("function", "parent", "loops", "frames")
+
+    def __init__(self, function: Optional[Hashable], parent: Optional["_CallScope"], loops: Optional[LoopFrame]) -> None:
+        self.function = function  # (file, function iid), None for module level code
+        self.parent = parent  # Scope of the caller
+        self.loops = loops  # Loop frame on top when the call started, the frames above it belong to the call
+        self.frames: Dict[Hashable, LoopFrame] = {}  # {loop id: frame} of the loops the call is executing
+
+
+class _TaskLoops:
+    __slots__ = ("top", "scope", "leaving", "in_event", "replay")
+
+    def __init__(self) -> None:
+        self.top: Optional[LoopFrame] = None
+        self.scope = _CallScope(None, None, None)
+        # Loop whose exit event was seen, popped unless a continue or its next header event follows
+        self.leaving: Optional[LoopFrame] = None
+        # Set while a shared tracker is inside one runtime event, see begin_event
+        self.in_event = False
+        self.replay: Optional[tuple] = None
+
+
+class LoopTracker:
+    """Per-thread and per-asyncio-task stack of the loops that are currently executing.
+
+    Frames are linked through their parent, and an index from loop id to its
+    frame makes push, pop and the "same loop, next iteration" check O(1).
+    Concurrent threads and tasks each see their own stack, so their events do
+    not interleave on one stack.
+
+    DynaPyt sends a loop's exit event before every break and continue as well
+    as when the loop ends, and none when a return or an exception leaves the
+    loop. An exit is therefore only final after the header event that ended
+    the loop or a break; after a continue, or when the same loop's header
+    event comes next, the loop goes on. Frames belong to the call that
+    executes them: call_exit pops the loops a returning call left behind, a
+    recursive call starts its own frames, and a header event of a loop owned
+    by a calling function unwinds the calls an exception left without an
+    exit. Every method that pops frames returns them from the innermost one
+    outwards, so analyses can close what they keep for them. A generator's
+    loops are closed at every yield and continue as a new execution.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: TaskLocal[_TaskLoops] = TaskLocal(_TaskLoops)
+        self._owners: Dict[Hashable, Optional[Hashable]] = {}  # {loop id: function the loop is in}
+
+    @property
+    def top(self) -> Optional[LoopFrame]:
+        return self._tasks.get().top
+
+    @property
+    def depth(self) -> int:
+        top = self._tasks.get().top
+        return top.depth if top is not None else 0
+
+    def __bool__(self) -> bool:
+        return self._tasks.get().top is not None
+
+    def frame_of(self, loop_id: Hashable) -> Optional[LoopFrame]:
+        """Frame of a loop executed by the current call"""
+        return self._tasks.get().scope.frames.get(loop_id)
+
+    def begin_event(self) -> None:
+        """Start one runtime event on a tracker shared by several analyses.
+
+        Until end_event, repeating the first call that moves the stack returns
+        its result again instead of moving it further, so every analysis that
+        handles the event sees the same frames.
+        """
+        state = self._tasks.get()
+        state.in_event = True
+        state.replay = None
+
+    def end_event(self) -> None:
+        state = self._tasks.get()
+        state.in_event = False
+        state.replay = None
+
+    def enter(self, loop_id: Hashable, kind: str, proceeds: bool = True) -> Tuple[LoopFrame, bool, List[LoopFrame]]:
+        """Record a loop header event.
+
+        Returns the loop's frame, whether the loop was just entered and the
+        frames popped on the way. proceeds is False for the header event that
+        ends the loop (the final StopIteration or false condition), which is
+        not counted as an iteration.
+        """
+        state = self._tasks.get()
+        if state.in_event:
+            return self._replay(state, "enter", loop_id, self._enter, loop_id, kind, proceeds)
+        return self._enter(state, loop_id, kind, proceeds)
+
+    def exit(self, loop_id: Hashable) -> List[LoopFrame]:
+        """Record a loop exit event, returns the popped frames.
+
+        The loop itself is only popped here when its header event ended it,
+        otherwise by break, or by the next event that is not a continue.
+        """
+        state = self._tasks.get()
+        if state.in_event:
+            return self._replay(state, "exit", loop_id, self._exit, loop_id)
+        return self._exit(state, loop_id)
+
+    def break_(self, loop_id: Hashable) -> List[LoopFrame]:
+        """Record a break out of a loop, returns the popped frames"""
+        state = self._tasks.get()
+        if state.in_event:
+            return self._replay(state, "break", loop_id, self._break, loop_id)
+        return self._break(state, loop_id)
+
+    def continue_(self, loop_id: Hashable) -> None:
+        """Record a continue, the exit event sent before it did not end the loop"""
+        state = self._tasks.get()
+        leaving = state.leaving
+        if leaving is not None and leaving.loop_id == loop_id:
+            state.leaving = None
+
+    def call_enter(self, function: Hashable) -> List[LoopFrame]:
+        """Record the start of a call of function, returns the popped frames"""
+        state = self._tasks.get()
+        if state.in_event:
+            return self._replay(state, "call_enter", function, self._call_enter, function)
+        return self._call_enter(state, function)
+
+    def call_exit(self, function: Hashable) -> List[LoopFrame]:
+        """Record the end of the innermost call of function, returns the loops it and the calls above it left"""
+        state = self._tasks.get()
+        if state.in_event:
+            return self._replay(state, "call_exit", function, self._call_exit, function)
+        return self._call_exit(state, function)
+
+    def _replay(self, state: _TaskLoops, operation: str, key: Hashable, method, *args):
+        replay = state.replay
+        if replay is not None and replay[0] == operation and replay[1] == key:
+            return replay[2]
+        result = method(state, *args)
+        state.replay = (operation, key, result)
+        return result
+
+    def _enter(self, state: _TaskLoops, loop_id: Hashable, kind: str, proceeds: bool) -> Tuple[LoopFrame, bool, List[LoopFrame]]:
+        popped = self._unwind_to_owner(state, loop_id)
+        if state.leaving is not None:
+            # The loop goes on when its own header event follows its exit event, e.g. after a continue
+            popped += self._settle_leaving(state, loop_id)
+        frame = state.scope.frames.get(loop_id)
+        if frame is not None and frame.finished:
+            # A loop that ended without an exit event is entered again
+            popped += self._pop(state, frame)
+            frame = None
+        is_new = frame is None
+        if is_new:
+            frame = LoopFrame(loop_id, kind, state.top)
+            state.scope.frames[loop_id] = frame
+            state.top = frame
+        elif frame is not state.top:
+            # Inner loops that were left without an exit event, e.g. through a caught exception
+            popped += self._pop_above(state, frame)
+        if proceeds:
+            frame.iterations += 1
+        else:
+            frame.finished = True
+        return frame, is_new, popped
+
+    def _exit(self, state: _TaskLoops, loop_id: Hashable) -> List[LoopFrame]:
+        popped = self._unwind_to_owner(state, loop_id)
+        frame = state.scope.frames.get(loop_id)
+        if state.leaving is not None and state.leaving is not frame:
+            popped += self._settle_leaving(state, None)
+        if frame is None:
+            return popped
+        if frame.finished:
+            popped += self._pop(state, frame)
+        else:
+            state.leaving = frame
+        return popped
+
+    def _break(self, state: _TaskLoops, loop_id: Hashable) -> List[LoopFrame]:
+        leaving = state.leaving
+        if leaving is None or leaving.loop_id != loop_id:
+            return []
+        state.leaving = None
+        return self._pop(state, leaving)
+
+    def _call_enter(self, state: _TaskLoops, function: Hashable) -> List[LoopFrame]:
+        popped = self._settle_leaving(state, None) if state.leaving is not None else []
+        state.scope = _CallScope(function, state.scope, state.top)
+        return popped
+
+    def _call_exit(self, state: _TaskLoops, function: Hashable) -> List[LoopFrame]:
+        scope = state.scope
+        while scope.function != function:
+            scope = scope.parent
+            if scope is None:
+                # Not an active call, e.g. one that started before the analysis did
+                return []
+        return self._unwind(state, scope.parent)
+
+    def _settle_leaving(self, state: _TaskLoops, continuing: Optional[Hashable]) -> List[LoopFrame]:
+        leaving = state.leaving
+        state.leaving = None
+        if leaving.loop_id == continuing:
+            return []
+        return self._pop(state, leaving)
+
+    def _unwind_to_owner(self, state: _TaskLoops, loop_id: Hashable) -> List[LoopFrame]:
+        """Unwind calls that ended without an exit event when the loop of a calling function goes on"""
+        function = state.scope.function
+        owner = self._owners.setdefault(loop_id, function)
+        if owner == function:
+            return []
+        scope = state.scope.parent
+        while scope is not None and scope.function != owner:
+            scope = scope.parent
+        if scope is None:
+            # The loop's function is not on the stack, e.g. a resumed generator, it runs in the current call
+            return []
+        return self._unwind(state, scope)
+
+    def _unwind(self, state: _TaskLoops, scope: _CallScope) -> List[LoopFrame]:
+        """Pop the calls above scope and the loops they were executing"""
+        bottom = state.scope
+        while bottom.parent is not scope:
+            bottom = bottom.parent
+        popped = []
+        top = state.top
+        while top is not bottom.loops:
+            popped.append(top)
+            top = top.parent
+        state.top = top
+        state.scope = scope
+        state.leaving = None
+        return popped
+
+    def _pop(self, state: _TaskLoops, frame: LoopFrame) -> List[LoopFrame]:
+        """Pop a frame of the current call together with the frames above it"""
+        popped = self._pop_above(state, frame)
+        del state.scope.frames[frame.loop_id]
+        state.top = frame.parent
+        if state.leaving is frame:
+            state.leaving = None
+        popped.append(frame)
+        return popped
+
+    def _pop_above(self, state: _TaskLoops, frame: LoopFrame) -> List[LoopFrame]:
+        popped = []
+        frames = state.scope.frames
+        top = state.top
+        while top is not frame:
+            popped.append(top)
+            del frames[top.loop_id]
+            top = top.parent
+        state.top = frame
+        if state.leaving is not None and state.leaving in popped:
+            state.leaving = None
+        return popped
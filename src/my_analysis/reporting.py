@@ -0,0 +1,201 @@
+import atexit
+import os
+import queue
+import sys
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+DEBUG = 10
+INFO = 20
+ERROR = 40
+
+# Most lines written with a single write() call
+BATCH_SIZE = 1024
+
+# Seconds between the checks that the writer thread is still alive while flushing
+FLUSH_POLL = 0.1
+
+
+class ReportSink:
+    """Report output written by a background thread in batches.
+
+    Messages are %-style format strings. Nothing is formatted or queued when
+    the level is disabled, so a disabled debug call costs one comparison.
+    Enabled messages are formatted on the calling thread, so the __repr__ of
+    the program's objects runs where the program expects it, and only the
+    writing is left to the background thread.
+    """
+
+    def __init__(self, path: Optional[str] = None, level: int = INFO, mode: str = "w") -> None:
+        self.path = path  # None writes to stdout
+        self.level = level
+        self.mode = mode
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        _all_sinks.add(self)
+
+    def is_enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def debug(self, message: str, *args: Any) -> None:
+        if self.level <= DEBUG:
+            self.write(_format(message, args))
+
+    def info(self, message: str, *args: Any) -> None:
+        if self.level <= INFO:
+            self.write(_format(message, args))
+
+    def error(self, message: str, *args: Any) -> None:
+        if self.level <= ERROR:
+            self.write(_format(message, args))
+
+    def write(self, line: str) -> None:
+        """Queue a formatted line regardless of the level"""
+        if self._thread is None:
+            self._start()
+        self._queue.put(line)
+
+    def flush(self) -> None:
+        """Block until everything queued so far has been written, or the writer thread is gone"""
+        thread = self._thread
+        if thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        while not done.wait(FLUSH_POLL):
+            if not thread.is_alive():
+                return
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="dynaperf-report-writer", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self) -> None:
+        stream = None
+        writable = True
+        if self.path is not None:
+            try:
+                stream = open(self.path, self.mode, encoding="utf-8")
+            except OSError as e:
+                # The lines are dropped, but flush must still return
+                print(f"DynaPerf: cannot write {self.path}: {e}", file=sys.stderr)
+                writable = False
+        get = self._queue.get
+        get_nowait = self._queue.get_nowait
+        while True:
+            batch = [get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiters = []
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+
+            if lines and writable:
+                out = stream if stream is not None else sys.stdout
+                try:
+                    out.write("\n".join(lines) + "\n")
+                    out.flush()
+                except (OSError, ValueError):
+                    pass
+            for waiter in waiters:
+                waiter.set()
+
+    def _after_fork(self) -> None:
+        # A forked child has no writer thread, and the lines still queued are the parent's to write.
+        # It appends to the parent's file rather than truncating it.
+        self.mode = "a"
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+
+def _format(message: str, args: tuple) -> str:
+    if not args:
+        return message
+    try:
+        return message % args
+    except Exception as e:
+        return f"{message} <formatting failed: {e}>"
+
+
+# Every sink, including those not shared through get_sink, so forked children can reset them
+_all_sinks: "weakref.WeakSet[ReportSink]" = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for sink in list(_all_sinks):
+        sink._after_fork()
+
+
+class Report:
+    """One caller's view of a shared sink, with a level of its own.
+
+    Analyses that share a destination each filter their own messages, so one
+    that asks for debug output does not turn it on for the others.
+    """
+
+    __slots__ = ("sink", "level")
+
+    def __init__(self, sink: ReportSink, level: int) -> None:
+        self.sink = sink
+        self.level = level
+
+    def is_enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def debug(self, message: str, *args: Any) -> None:
+        if self.level <= DEBUG:
+            self.sink.write(_format(message, args))
+
+    def info(self, message: str, *args: Any) -> None:
+        if self.level <= INFO:
+            self.sink.write(_format(message, args))
+
+    def error(self, message: str, *args: Any) -> None:
+        if self.level <= ERROR:
+            self.sink.write(_format(message, args))
+
+    def flush(self) -> None:
+        self.sink.flush()
+
+
+_sinks: Dict[Optional[str], ReportSink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path: Optional[str] = None, level: int = INFO) -> Report:
+    """Report to the shared sink of a destination, stdout when path is None"""
+    with _sinks_lock:
+        sink = _sinks.get(path)
+        if sink is None:
+            sink = _sinks[path] = ReportSink(path, DEBUG)
+        return Report(sink, level)
+
+
+def flush_all() -> None:
+    for sink in list(_sinks.values()):
+        sink.flush()
+
+
+def as_bool(value: Any) -> bool:
+    """Analysis options arrive as strings when passed through DynaPyt's conf"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+atexit.register(flush_all)
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,495 @@
+"""Turns string concatenation and object creation findings into a source patch.
+
+Findings of SlowStringConcatAnalysis (R2-1) and ObjectCreationInLoopAnalysis
+(R2-3) are resolved through their iids to the libcst nodes DynaPyt
+instrumented, and rewritten where the loop around them allows it:
+
+- s += x and s = s + x in a loop that reads s nowhere else become an append
+  to a list of pieces, joined into s once the loop is done;
+- a dict, list or set literal of constants that is rebuilt on every
+  iteration and only read is built once before the outermost loop. Constant
+  tuples are left alone, CPython already builds them once as constants.
+
+Everything else is listed with the reason it was skipped. With --entry, the
+project is run before and after the patch: the patch is only written when
+both runs print the same output, and the report gives the measured speedup.
+
+    python -m my_analysis.rewrite --findings dynaperf_findings.jsonl --root <project_dir> --entry main.py
+"""
+import argparse
+import difflib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import libcst as cst
+from libcst.metadata import MetadataWrapper, ParentNodeProvider, PositionProvider
+
+from .findings import read_findings
+from .instrument_tree import walk_tree
+from .source_index import iids_path
+
+DEFAULT_PATCH = "dynaperf.patch"
+
+# Rules whose findings can be rewritten
+REWRITTEN_RULES = {"R2-1", "R2-3"}
+
+# Methods that read a dict, list, set or tuple without changing it
+READ_METHODS = {"get", "keys", "values", "items", "count", "index", "copy", "issubset", "issuperset", "isdisjoint"}
+
+# Builtins that only read the object passed to them
+READ_FUNCTIONS = {"len", "sorted", "tuple", "list", "set", "frozenset", "dict", "sum", "min", "max", "any", "all",
+                  "enumerate", "zip", "reversed", "iter"}
+
+LITERAL_KINDS = {cst.Dict: "dict", cst.List: "list", cst.Set: "set", cst.Tuple: "tuple"}
+
+_LOOPS = (cst.For, cst.While)
+_SCOPES = (cst.FunctionDef, cst.ClassDef, cst.Lambda)
+
+
+class Rewrite:
+    """One rewritten site"""
+
+    __slots__ = ("rule_id", "line", "description")
+
+    def __init__(self, rule_id: str, line: int, description: str) -> None:
+        self.rule_id = rule_id
+        self.line = line
+        self.description = description
+
+
+class FileRewriter:
+    """Collects the rewrites of one source file and applies them in a single pass over its libcst tree"""
+
+    def __init__(self, path: Path, source: str, spans: Dict[int, Tuple[int, int, int, int]]) -> None:
+        self.path = path
+        self.source = source
+        self.spans = spans  # {iid: (line, column, end line, end column)} from the DynaPyt iid table
+        self.wrapper = MetadataWrapper(cst.parse_module(source))
+        self.positions = self.wrapper.resolve(PositionProvider)
+        self.parents = self.wrapper.resolve(ParentNodeProvider)
+        self.nodes: Dict[Tuple[int, int, int, int], List[cst.CSTNode]] = {}
+        for node, position in self.positions.items():
+            span = (position.start.line, position.start.column, position.end.line, position.end.column)
+            self.nodes.setdefault(span, []).append(node)
+        self.names: Set[str] = {node.value for node in self.positions if isinstance(node, cst.Name)}
+
+        self.before: Dict[cst.CSTNode, List[cst.BaseStatement]] = {}  # {loop: statements inserted before it}
+        self.after: Dict[cst.CSTNode, List[cst.BaseStatement]] = {}  # {loop: statements inserted after it}
+        self.replace: Dict[cst.CSTNode, cst.CSTNode] = {}
+        self.remove: Set[cst.CSTNode] = set()
+        self.rewrites: List[Rewrite] = []
+
+    def rewrite(self, finding: dict) -> Optional[str]:
+        """Plan the rewrite of one finding, returns why it was skipped or None"""
+        span = self.spans.get(finding.get("iid"))
+        if span is None:
+            return "its iid is not in the DynaPyt iid table"
+        nodes = self.nodes.get(span, [])
+        if finding["rule_id"] == "R2-1":
+            node = next((node for node in nodes if isinstance(node, (cst.AugAssign, cst.BinaryOperation))), None)
+            if node is None:
+                return "no concatenation at its location"
+            return self._rewrite_concatenation(node, finding.get("metrics", {}).get("kind", "str"))
+        node = next((node for node in nodes if isinstance(node, (cst.Assign, *LITERAL_KINDS))), None)
+        if node is None:
+            return "no literal at its location, e.g. a loop-level memory finding"
+        return self._hoist_literal(node)
+
+    def _rewrite_concatenation(self, node: cst.CSTNode, kind: str) -> Optional[str]:
+        if isinstance(node, cst.AugAssign):
+            statement = node
+            if not isinstance(node.operator, cst.AddAssign) or not isinstance(node.target, cst.Name):
+                return "only s += x on a plain name is rewritten"
+            name, piece, reads = node.target.value, node.value, 1
+        else:
+            # s = s + a + b is parsed as (s + a) + b, the whole chain is rewritten
+            parent = self.parents[node]
+            while isinstance(parent, cst.BinaryOperation) and parent.left is node:
+                node, parent = parent, self.parents[parent]
+            statement = parent
+            if not isinstance(statement, cst.Assign) or statement.value is not node or len(statement.targets) != 1 \
+                    or not isinstance(statement.targets[0].target, cst.Name):
+                return "only s = s + x on a plain name is rewritten"
+            name = statement.targets[0].target.value
+            pieces = []
+            while isinstance(node, cst.BinaryOperation) and isinstance(node.operator, cst.Add):
+                pieces.append(node.right)
+                node = node.left
+            if not pieces or not isinstance(node, cst.Name) or node.value != name:
+                return "only appending to the end of the accumulated value is rewritten"
+            piece = pieces.pop()
+            while pieces:
+                piece = cst.BinaryOperation(left=piece, operator=cst.Add(), right=pieces.pop())
+            reads = 2
+        line = self.parents[statement]
+        if not isinstance(line, cst.SimpleStatementLine) or len(line.body) != 1:
+            return "the concatenation shares its line with other statements"
+        loop = self._enclosing_loop(line)
+        if loop is None:
+            return "it is not directly inside a loop"
+        if statement in self.replace:
+            return "rewritten with another finding of the same statement"
+        if loop in self.after:
+            return "another concatenation in this loop is already rewritten"
+        if getattr(loop, "orelse", None) is not None:
+            return "the loop has an else clause"
+        if _contains(loop, (cst.Return, cst.Yield, cst.Global, cst.Nonlocal, *_SCOPES)):
+            return "the loop returns, yields or defines functions, the joined value could be needed early"
+        if len(_uses(loop, name, self.parents)) != reads:
+            return f"the loop reads {name} elsewhere, it needs the partial value"
+
+        parts = self._fresh_name(f"{name}_parts")
+        empty = 'b""' if kind == "bytes" else '""'
+        self.before.setdefault(loop, []).append(cst.parse_statement(f"{parts} = [{name}]"))
+        self.after[loop] = [cst.parse_statement(f"{name} = {empty}.join({parts})")]
+        self.replace[statement] = cst.Expr(cst.Call(
+            func=cst.Attribute(value=cst.Name(parts), attr=cst.Name("append")), args=[cst.Arg(piece)]))
+        self.rewrites.append(Rewrite("R2-1", self.positions[line].start.line,
+                                     f"{kind} accumulation into {name} collected in {parts} and joined after the loop "
+                                     f"at line {self.positions[loop].start.line}"))
+        return None
+
+    def _hoist_literal(self, node: cst.CSTNode) -> Optional[str]:
+        if isinstance(node, cst.Assign):
+            if len(node.targets) != 1 or not isinstance(node.targets[0].target, cst.Name) \
+                    or not isinstance(node.value, tuple(LITERAL_KINDS)):
+                return "only name = literal assignments are hoisted"
+            literal, name = node.value, node.targets[0].target.value
+        else:
+            literal, name = node, None
+        kind = LITERAL_KINDS[type(literal)]
+        if not _is_constant(literal):
+            return f"the {kind} holds values that can change between iterations"
+        if kind == "tuple":
+            return "CPython already folds a constant tuple into a constant"
+        if literal in self.replace or self.parents.get(node) in self.remove:
+            return "another rewrite already changes it"
+
+        outermost = None
+        current = self.parents.get(literal)
+        while current is not None and not isinstance(current, (*_SCOPES, cst.Module)):
+            if isinstance(current, _LOOPS):
+                outermost = current
+            current = self.parents.get(current)
+        if outermost is None:
+            return "it is not inside a loop"
+        scope = current
+
+        if name is not None:
+            line = self.parents[node]
+            if not isinstance(line, cst.SimpleStatementLine) or len(line.body) != 1:
+                return "the assignment shares its line with other statements"
+            block = self.parents[line]
+            if isinstance(block, cst.IndentedBlock) and len(block.body) == 1:
+                return "it is the only statement of its block"
+            uses = _uses(outermost, name, self.parents)
+            bindings = [use for use in uses if isinstance(self.parents[use], cst.AssignTarget)]
+            if len(bindings) != 1 or not all(_is_read_only(use, self.parents) for use in uses if use not in bindings):
+                return f"{name} is rebound, mutated or passed on inside the loop"
+            binding = self.positions[bindings[0]].start
+            if any(self.positions[use].start.line < binding.line for use in uses):
+                return f"{name} is read before the assignment, where it may still hold an older value"
+            # Hoisted, the value is bound even when the loop runs no iteration or the assignment is skipped
+            inside = set(uses)
+            if any(use not in inside for use in _uses(scope, name, self.parents)):
+                return f"{name} is also used outside the loop, where it may hold another value"
+            self.remove.add(line)
+            hoisted = line
+        else:
+            if not _is_read_only(literal, self.parents):
+                return f"the {kind} is mutated or passed on"
+            parent = self.parents[literal]
+            if isinstance(parent, cst.For) or isinstance(parent, cst.ComparisonTarget):
+                return f"CPython already folds a constant {kind} used this way into a constant"
+            name = self._fresh_name(f"hoisted_{kind}")
+            self.replace[literal] = cst.Name(name)
+            hoisted = cst.SimpleStatementLine([cst.Assign([cst.AssignTarget(cst.Name(name))], literal)])
+        self.before.setdefault(outermost, []).append(hoisted)
+        self.rewrites.append(Rewrite("R2-3", self.positions[literal].start.line,
+                                     f"constant {kind} {name} built once before the loop at line "
+                                     f"{self.positions[outermost].start.line}"))
+        return None
+
+    def _enclosing_loop(self, node: cst.CSTNode) -> Optional[cst.CSTNode]:
+        current = self.parents.get(node)
+        while current is not None and not isinstance(current, (*_SCOPES, cst.Module)):
+            if isinstance(current, _LOOPS):
+                return current
+            current = self.parents.get(current)
+        return None
+
+    def _fresh_name(self, base: str) -> str:
+        name, suffix = base, 2
+        while name in self.names:
+            name, suffix = f"{base}_{suffix}", suffix + 1
+        self.names.add(name)
+        return name
+
+    def result(self) -> str:
+        if not self.rewrites:
+            return self.source
+        return self.wrapper.module.visit(_Applier(self)).code
+
+
+class _Applier(cst.CSTTransformer):
+    def __init__(self, rewriter: FileRewriter) -> None:
+        super().__init__()
+        self.rewriter = rewriter
+
+    def on_leave(self, original_node, updated_node):
+        rewriter = self.rewriter
+        if original_node in rewriter.remove:
+            return cst.RemoveFromParent()
+        if original_node in rewriter.replace:
+            return rewriter.replace[original_node]
+        before, after = rewriter.before.get(original_node), rewriter.after.get(original_node)
+        if before or after:
+            return cst.FlattenSentinel([*(before or []), updated_node, *(after or [])])
+        return updated_node
+
+
+def _is_constant(node: cst.CSTNode) -> bool:
+    if isinstance(node, (cst.Integer, cst.Float, cst.Imaginary, cst.SimpleString)):
+        return True
+    if isinstance(node, cst.ConcatenatedString):
+        return _is_constant(node.left) and _is_constant(node.right)
+    if isinstance(node, cst.Name):
+        return node.value in ("True", "False", "None")
+    if isinstance(node, cst.UnaryOperation):
+        return isinstance(node.operator, (cst.Minus, cst.Plus)) and isinstance(node.expression, (cst.Integer, cst.Float))
+    if isinstance(node, (cst.List, cst.Tuple, cst.Set)):
+        return all(isinstance(element, cst.Element) and _is_constant(element.value) for element in node.elements)
+    if isinstance(node, cst.Dict):
+        return all(isinstance(element, cst.DictElement) and _is_constant(element.key) and _is_constant(element.value)
+                   for element in node.elements)
+    return False
+
+
+def _uses(tree: cst.CSTNode, name: str, parents: dict) -> List[cst.Name]:
+    """Name nodes of a variable in a subtree, without attribute and keyword names"""
+    uses = []
+    for node in _walk(tree):
+        if isinstance(node, cst.Name) and node.value == name:
+            parent = parents.get(node)
+            if isinstance(parent, cst.Attribute) and parent.attr is node:
+                continue
+            if isinstance(parent, cst.Arg) and parent.keyword is node:
+                continue
+            uses.append(node)
+    return uses
+
+
+def _is_read_only(node: cst.CSTNode, parents: dict) -> bool:
+    """Whether the value of an expression is only read where it is used, so one shared object can serve every use"""
+    parent = parents.get(node)
+    if isinstance(parent, cst.ComparisonTarget):
+        return parent.comparator is node and isinstance(parent.operator, (cst.In, cst.NotIn))
+    if isinstance(parent, cst.For):
+        return parent.iter is node
+    if isinstance(parent, cst.Subscript):
+        target = parents.get(parent)
+        return parent.value is node and not isinstance(target, (cst.AssignTarget, cst.AugAssign, cst.Del, cst.AnnAssign))
+    if isinstance(parent, cst.Attribute):
+        call = parents.get(parent)
+        return parent.value is node and parent.attr.value in READ_METHODS \
+            and isinstance(call, cst.Call) and call.func is parent
+    if isinstance(parent, cst.Arg):
+        call = parents.get(parent)
+        return isinstance(call, cst.Call) and isinstance(call.func, cst.Name) and call.func.value in READ_FUNCTIONS \
+            and not parent.star
+    return False
+
+
+def _contains(tree: cst.CSTNode, types: tuple) -> bool:
+    return any(isinstance(node, types) for node in _walk(tree))
+
+
+def _walk(tree: cst.CSTNode):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children)
+
+
+def read_iid_spans(path: Path) -> Dict[int, Tuple[int, int, int, int]]:
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    return {int(iid): (loc["start_line"], loc["start_column"], loc["end_line"], loc["end_column"])
+            for iid, loc in table["iid_to_location"].items()}
+
+
+def original_source(path: Path) -> str:
+    """Source of a module before DynaPyt instrumented it in place"""
+    orig = path.with_name(path.name + ".orig")
+    with open(orig if orig.exists() else path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def plan(findings: List[dict], root: Path, instrumented: Optional[Path]) -> Tuple[Dict[Path, FileRewriter], List[tuple]]:
+    """Rewriters of the files with rewritable findings, and the (finding, reason) pairs that were skipped"""
+    rewriters: Dict[Path, FileRewriter] = {}
+    skipped = []
+    for finding in findings:
+        path = Path(finding["file"]).resolve()
+        rewriter = rewriters.get(path)
+        if rewriter is None:
+            try:
+                relative = path.relative_to(root)
+            except ValueError:
+                skipped.append((finding, "the file is outside the project"))
+                continue
+            table = Path(iids_path(str(path)))
+            if not table.exists() and instrumented is not None:
+                table = Path(iids_path(str(instrumented / relative)))
+            try:
+                rewriter = rewriters[path] = FileRewriter(relative, original_source(path), read_iid_spans(table))
+            except (OSError, ValueError, KeyError, cst.ParserSyntaxError) as e:
+                skipped.append((finding, f"cannot read the module or its iid table: {e}"))
+                continue
+        reason = rewriter.rewrite(finding)
+        if reason is not None:
+            skipped.append((finding, reason))
+    return rewriters, skipped
+
+
+def make_patch(rewriters: Dict[Path, FileRewriter]) -> Tuple[str, Dict[Path, str]]:
+    """Unified diff of all rewritten files, for patch -p1 or git apply, and the new sources by relative path"""
+    patch, sources = [], {}
+    for rewriter in rewriters.values():
+        new_source = rewriter.result()
+        if new_source == rewriter.source:
+            continue
+        sources[rewriter.path] = new_source
+        relative = rewriter.path.as_posix()
+        patch.extend(difflib.unified_diff(rewriter.source.splitlines(keepends=True), new_source.splitlines(keepends=True),
+                                          f"a/{relative}", f"b/{relative}"))
+    return "".join(patch), sources
+
+
+class Verifier:
+    """Runs the project without instrumentation before and after the rewrites"""
+
+    def __init__(self, root: Path, entry: str, sources: Dict[Path, str], repeat: int, timeout: float,
+                 work_dir: Path) -> None:
+        self.root = root
+        self.entry = entry
+        self.sources = sources
+        self.repeat = repeat
+        self.timeout = timeout
+        self.before_dir = work_dir / "before"
+        self.after_dir = work_dir / "after"
+
+    def run(self) -> dict:
+        for target in (self.before_dir, self.after_dir):
+            self._copy_tree(target)
+        for relative, source in self.sources.items():
+            with open(self.after_dir / relative, "w", encoding="utf-8") as f:
+                f.write(source)
+
+        times = {"before": [], "after": []}
+        outputs = {}
+        # Alternate the runs so that a machine getting busier affects both sides alike
+        for _ in range(self.repeat):
+            for side, tree in (("before", self.before_dir), ("after", self.after_dir)):
+                seconds, output = self._run_in(tree)
+                times[side].append(seconds)
+                if outputs.setdefault(side, output) != output:
+                    outputs[side] = None
+        before, after = min(times["before"]), min(times["after"])
+        return {"identical": outputs["before"] is not None and outputs["before"] == outputs["after"],
+                "deterministic": outputs["before"] is not None, "before": before, "after": after,
+                "speedup": before / after if after > 0 else 0.0}
+
+    def _copy_tree(self, target: Path) -> None:
+        for relative in walk_tree(self.root, target, []):
+            destination = target / relative
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            source = self.root / relative
+            if source.suffix == ".py":
+                with open(destination, "w", encoding="utf-8") as f:
+                    f.write(original_source(source))
+            else:
+                with open(source, "rb") as src, open(destination, "wb") as dst:
+                    dst.write(src.read())
+
+    def _run_in(self, tree: Path) -> Tuple[float, Tuple[int, bytes]]:
+        entry = tree / self.entry
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(tree), env.get("PYTHONPATH")]))
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, str(entry)], cwd=entry.parent, env=env, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=self.timeout)
+        return time.perf_counter() - start, (result.returncode, result.stdout)
+
+
+def print_report(rewriters: Dict[Path, FileRewriter], skipped: List[tuple], verification: Optional[dict]) -> None:
+    print("\n===== Rewrite Report =====")
+    rewrites = [(rewriter.path, rewrite) for rewriter in rewriters.values() for rewrite in rewriter.rewrites]
+    if rewrites:
+        print("Rewritten sites:")
+        for rank, (path, rewrite) in enumerate(sorted(rewrites, key=lambda item: (str(item[0]), item[1].line)), 1):
+            print(f"{rank}. [{rewrite.rule_id}] {path}:{rewrite.line}: {rewrite.description}")
+    else:
+        print("No finding could be rewritten")
+    if skipped:
+        print("\nSkipped findings:")
+        for finding, reason in skipped:
+            print(f"  - [{finding['rule_id']}] {finding['file']}:{finding.get('line')} (iid: {finding.get('iid')}): {reason}")
+    if verification is not None:
+        print("\nVerification:")
+        if not verification["deterministic"]:
+            print("  The original program printed different output on different runs, the rewrite cannot be checked")
+        elif verification["identical"]:
+            print("  Output is identical before and after the rewrite")
+        else:
+            print("  Output differs after the rewrite")
+        print(f"  Fastest run: {verification['before']:.3f} s before, {verification['after']:.3f} s after, "
+              f"speedup {verification['speedup']:.2f}x")
+    print("\n===== Analysis Complete =====")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Rewrite string concatenation and object creation findings into a patch")
+    parser.add_argument("--findings", required=True, help="Findings file written by the analyses")
+    parser.add_argument("--root", default=".", help="Project directory the findings point into")
+    parser.add_argument("--instrumented", help="Instrumented copy of the project holding the iid tables, "
+                                               "when it was not instrumented in place")
+    parser.add_argument("--entry", help="Entry script relative to the project directory, run before and after the patch")
+    parser.add_argument("--output", default=DEFAULT_PATCH, help="Patch file to write")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs on each side, the fastest one is compared")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds after which a run is killed")
+    args = parser.parse_args()
+
+    root = Path(args.root).resolve()
+    instrumented = Path(args.instrumented).resolve() if args.instrumented else None
+    findings = [finding for finding in read_findings(args.findings) if finding["rule_id"] in REWRITTEN_RULES]
+    rewriters, skipped = plan(findings, root, instrumented)
+    patch, sources = make_patch(rewriters)
+
+    verification = None
+    if sources and args.entry:
+        with tempfile.TemporaryDirectory(prefix="dynaperf-rewrite-") as work_dir:
+            verification = Verifier(root, args.entry, sources, max(args.repeat, 1), args.timeout, Path(work_dir)).run()
+    print_report(rewriters, skipped, verification)
+
+    if not sources:
+        return 0
+    if verification is not None and not verification["identical"]:
+        print(f"\nNo patch written, {args.output} would change the program's output")
+        return 1
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(patch)
+    note = "" if verification is not None else ", not verified since no --entry was given"
+    print(f"\nPatch written to {args.output}{note}, apply it with patch -p1 or git apply")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
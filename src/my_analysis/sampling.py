@@ -0,0 +1,127 @@
+import math
+import random
+from typing import Dict, Hashable, Optional
+
+# z value of the two-sided 95% interval used for error bounds
+Z_95 = 1.96
+
+
+class Estimate:
+    """Horvitz-Thompson estimate of a total from sampled events.
+
+    Every sampled event is added with its weight, the inverse of the
+    probability it had of being sampled, so the total is unbiased and the
+    variance can be estimated from the same weights.
+    """
+
+    __slots__ = ("total", "variance")
+
+    def __init__(self) -> None:
+        self.total = 0.0
+        self.variance = 0.0
+
+    def add(self, weight: float) -> None:
+        self.total += weight
+        self.variance += weight * (weight - 1.0)
+
+    def merge(self, other: "Estimate") -> None:
+        self.total += other.total
+        self.variance += other.variance
+
+    @property
+    def exact(self) -> bool:
+        return self.variance == 0.0
+
+    def error(self) -> float:
+        """Half width of the 95% interval around the total"""
+        return Z_95 * math.sqrt(self.variance)
+
+    def describe(self) -> str:
+        if self.exact:
+            return str(int(round(self.total)))
+        return f"~{self.total:.0f} ± {self.error():.0f}"
+
+    def __float__(self) -> float:
+        return self.total
+
+
+class _SiteState:
+    __slots__ = ("events", "sampled", "period", "at_period", "countdown")
+
+    def __init__(self, period: int, countdown: int) -> None:
+        self.events = 0  # Every event seen at the site
+        self.sampled = 0  # Events that were fully processed
+        self.period = period  # Current mean distance between processed events
+        self.at_period = 0  # Events processed since the period last changed
+        self.countdown = countdown  # Events left until the next processed one
+
+
+class Sampler:
+    """Decides which events of high-frequency hooks get fully processed.
+
+    Every event is counted. The first `warmup` events of a site are always
+    processed, after that each event is processed with probability 1/period,
+    starting at 1-in-`rate`. Once a site has had `warmup` events processed at
+    its current period the period doubles, up to `rate * max_backoff`, so hot
+    sites that were already seen cost less and less. The gaps between
+    processed events are drawn from a geometric distribution, which makes
+    skipping an event a single decrement.
+
+    sample() returns the weight of a processed event and 0.0 for a skipped
+    one. Processed events are denser while a site warms up, so whatever is
+    kept of them must carry the weight: counts are added to an Estimate and
+    values are offered to a weighted streaming.Reservoir. Results that keep
+    only the first or last processed event, or a maximum, are lower bounds.
+    """
+
+    def __init__(self, rate: int, warmup: int = 16, max_backoff: int = 64, seed: Optional[int] = None) -> None:
+        self.rate = max(1, int(rate))
+        self.warmup = max(1, int(warmup))
+        self.max_period = self.rate * max(1, int(max_backoff))
+        self._sites: Dict[Hashable, _SiteState] = {}
+        self._rng = random.Random(seed)
+
+    def sample(self, site: Hashable) -> float:
+        state = self._sites.get(site)
+        if state is None:
+            state = self._sites[site] = _SiteState(self.rate, self._gap(self.rate))
+        state.events += 1
+        if state.events <= self.warmup:
+            state.sampled += 1
+            return 1.0
+
+        state.countdown -= 1
+        if state.countdown > 0:
+            return 0.0
+
+        weight = float(state.period)
+        state.sampled += 1
+        state.at_period += 1
+        if state.at_period >= self.warmup and state.period < self.max_period:
+            state.period = min(state.period * 2, self.max_period)
+            state.at_period = 0
+        state.countdown = self._gap(state.period)
+        return weight
+
+    def events(self, site: Hashable) -> int:
+        state = self._sites.get(site)
+        return state.events if state is not None else 0
+
+    def totals(self):
+        """Events seen and events processed over all sites"""
+        events = sampled = 0
+        for state in self._sites.values():
+            events += state.events
+            sampled += state.sampled
+        return events, sampled
+
+    def describe(self) -> str:
+        events, sampled = self.totals()
+        share = 100.0 * sampled / events if events else 100.0
+        return f"fully processed {sampled} of {events} events ({share:.1f}%) at a base rate of 1-in-{self.rate}"
+
+    def _gap(self, period: int) -> int:
+        if period <= 1:
+            return 1
+        # Number of events up to and including the next processed one, geometric with p = 1 / period
+        return int(math.log(1.0 - self._rng.random()) / math.log(1.0 - 1.0 / period)) + 1
@@ -0,0 +1,234 @@
+"""Per-process shards of analysis state, and the merge step that turns them into one report.
+
+A workload that forks worker processes, with multiprocessing or a pre-fork
+server such as gunicorn, gives every process its own copy of the analyses.
+When DYNAPERF_SHARD_DIR is set, every process writes the state of its
+analyses to a shard in that directory when it exits: a zlib compressed
+pickle of mergeable aggregates such as counts, trip count histograms and
+value samples. A forked child starts from empty aggregates, so every event
+is in exactly one shard. Analyses write their shard instead of printing a
+report of their own. The merge step folds the shards of a run into fresh
+analyses and calls their end_execution, which prints one report and writes
+one findings file.
+
+    DYNAPERF_SHARD_DIR=shards python -m dynapyt.run_analysis --entry server.py --analysis ...
+    python -m my_analysis.shards shards
+
+Shards are pickles, only merge shards written by your own runs.
+"""
+import argparse
+import atexit
+import glob
+import importlib
+import os
+import pickle
+import signal
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+SHARD_DIR_ENV = "DYNAPERF_SHARD_DIR"
+
+# Run id shared by a process and its children, spawned children read it from the environment
+RUN_ENV = "DYNAPERF_SHARD_RUN"
+
+SHARD_SUFFIX = ".dpshard"
+MAGIC = b"DPSHARD1"
+
+
+class ShardWriter:
+    """Writes the state of the registered analyses of this process to its shard at exit.
+
+    Analyses that support sharding implement shard_state(), which returns
+    their aggregates, merge_shard(state), which adds a state written by
+    another process, and reset_shard(), which empties the aggregates in a
+    freshly forked child.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.run = os.environ.get(RUN_ENV) or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        os.environ[RUN_ENV] = self.run
+        self.analyses: List[Any] = []
+        self.written_by: Optional[int] = None  # Pid that wrote its shard, a forked child has not written its own yet
+        self._previous_sigterm: Any = None  # SIGTERM handler a forked child inherited
+        self._lock = threading.Lock()
+        atexit.register(self.write)
+        os.register_at_fork(after_in_child=self._after_fork)
+        # multiprocessing children leave through os._exit, which skips atexit. Finalizers registered
+        # after the fork still run, and hooks registered here run once the child cleared the parent's.
+        from multiprocessing import util
+        util.register_after_fork(self, ShardWriter._after_multiprocessing_fork)
+
+    def add(self, analysis: Any) -> None:
+        self.analyses.append(analysis)
+
+    def write(self) -> Optional[str]:
+        """Write this process's shard once, returns its path"""
+        # A SIGTERM arriving while the shard is written waits until it is complete, its handler writes too
+        if not hasattr(signal, "pthread_sigmask"):
+            return self._write()
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        try:
+            return self._write()
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+
+    def _write(self) -> Optional[str]:
+        with self._lock:
+            pid = os.getpid()
+            if self.written_by == pid or not self.analyses:
+                return None
+            self.written_by = pid
+            states = []
+            for analysis in self.analyses:
+                try:
+                    states.append((_class_path(analysis), analysis.shard_state()))
+                except Exception as e:
+                    print(f"DynaPerf: state of {type(analysis).__name__} not sharded: {e}", file=sys.stderr)
+            payload = {"run": self.run, "pid": pid, "analyses": states}
+            try:
+                data = MAGIC + zlib.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{self.run}-{pid}{SHARD_SUFFIX}")
+                # Written under a temporary name so the merge never reads a partial shard
+                with open(path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                print(f"DynaPerf: shard of process {pid} not written: {e}", file=sys.stderr)
+                return None
+            return path
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+        for analysis in self.analyses:
+            analysis.reset_shard()
+        # Pool.terminate() ends workers with SIGTERM. The child inherits either the default action or
+        # DynaPyt's handler, which ends the analyses but leaves the process running, so both are replaced
+        # by one that writes the shard and then terminates. A handler the program installed is kept.
+        previous = signal.getsignal(signal.SIGTERM)
+        if previous == signal.SIG_DFL or _is_dynapyt_handler(previous):
+            self._previous_sigterm = previous
+            signal.signal(signal.SIGTERM, self._on_sigterm)
+
+    def _after_multiprocessing_fork(self) -> None:
+        from multiprocessing import util
+        util.Finalize(None, self.write, exitpriority=0)
+
+    def _on_sigterm(self, signum, frame) -> None:
+        if callable(self._previous_sigterm):
+            self._previous_sigterm(signum, frame)
+        self.write()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+
+_writer: Optional[ShardWriter] = None
+_writer_lock = threading.Lock()
+
+
+def register_shards(analysis: Any) -> None:
+    """Shard the state of an analysis at exit, does nothing unless DYNAPERF_SHARD_DIR is set"""
+    global _writer
+    directory = os.environ.get(SHARD_DIR_ENV)
+    if not directory:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = ShardWriter(directory)
+        _writer.add(analysis)
+
+
+def is_sharded(analysis: Any) -> bool:
+    """Whether the analysis writes a shard, its report and findings then come from the merge step"""
+    writer = _writer
+    return writer is not None and analysis in writer.analyses
+
+
+def write_shard(analysis: Any) -> bool:
+    """Write this process's shard in place of the analysis's report, False when the analysis is not sharded"""
+    if not is_sharded(analysis):
+        return False
+    _writer.write()
+    return True
+
+
+def _is_dynapyt_handler(handler: Any) -> bool:
+    # DynaPyt's runtime engine installs its bound end_execution for SIGINT and SIGTERM
+    owner = getattr(handler, "__self__", None)
+    return getattr(handler, "__name__", None) == "end_execution" and type(owner).__module__.startswith("dynapyt")
+
+
+def read_shard(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a DynaPerf shard")
+    return pickle.loads(zlib.decompress(data[len(MAGIC):]))
+
+
+def shard_paths(directory: str, run: Optional[str] = None) -> List[str]:
+    """Shards of a run, of the most recently written one by default"""
+    paths = glob.glob(os.path.join(directory, f"*{SHARD_SUFFIX}"))
+    if run is None and paths:
+        run = _run_of(max(paths, key=os.path.getmtime))
+    return sorted(path for path in paths if _run_of(path) == run)
+
+
+def merge(paths: List[str], options: Optional[Dict[str, Dict[str, str]]] = None) -> List[Any]:
+    """Fresh analyses holding the merged state of the shards, one per analysis class"""
+    options = options or {}
+    analyses: Dict[str, Any] = {}
+    for path in paths:
+        for class_path, state in read_shard(path)["analyses"]:
+            analysis = analyses.get(class_path)
+            if analysis is None:
+                module_name, class_name = class_path.rsplit(".", 1)
+                analysis_class = getattr(importlib.import_module(module_name), class_name)
+                analysis = analyses[class_path] = analysis_class(**options.get(class_path, {}))
+            analysis.merge_shard(state)
+    return list(analyses.values())
+
+
+def _run_of(path: str) -> str:
+    # Shards are named <run>-<pid>.dpshard
+    return os.path.basename(path)[:-len(SHARD_SUFFIX)].rsplit("-", 1)[0]
+
+
+def _class_path(analysis: Any) -> str:
+    return f"{type(analysis).__module__}.{type(analysis).__qualname__}"
+
+
+def _parse_analysis(spec: str) -> Tuple[str, Dict[str, str]]:
+    """Split a DynaPyt --analysis value, module.Class;key=value;..., into the class and its options"""
+    class_path, *pairs = spec.split(";")
+    return class_path, dict(pair.split("=", 1) for pair in pairs if "=" in pair)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Merge the per-process shards of a run into one report")
+    parser.add_argument("directory", help="Directory the processes wrote their shards to")
+    parser.add_argument("--run", help="Run to merge, the most recent one by default")
+    parser.add_argument("--analysis", action="append", default=[],
+                        help="Options of an analysis as given to DynaPyt, e.g. "
+                             "\"my_analysis.NestedLoopingAnalysis.NestedLoopingAnalysis;depth_threshold=3\"")
+    args = parser.parse_args()
+
+    # The merged analyses must not write a shard of their own
+    os.environ.pop(SHARD_DIR_ENV, None)
+    paths = shard_paths(args.directory, args.run)
+    if not paths:
+        print(f"No shards found in {args.directory}", file=sys.stderr)
+        return 1
+    print(f"Merging {len(paths)} shards of run {_run_of(paths[0])}")
+    analyses = merge(paths, dict(_parse_analysis(spec) for spec in args.analysis))
+    for analysis in analyses:
+        analysis.end_execution()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
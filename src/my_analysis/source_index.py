@@ -0,0 +1,248 @@
+import ast
+import hashlib
+import json
+import os
+import symtable
+from collections import namedtuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+SourceLocation = namedtuple("SourceLocation", ["line", "column", "end_line", "end_column", "snippet"])
+
+# Longest snippet kept per location
+SNIPPET_LENGTH = 60
+
+
+class SourceIndex:
+    """Maps the iids of one instrumented file to source locations.
+
+    The DynaPyt iid table and the original source are read once, snippets are
+    cut out lazily the first time an iid is resolved.
+    """
+
+    def __init__(self, dyn_ast: str) -> None:
+        self.dyn_ast = dyn_ast
+        self._spans: Dict[int, Tuple[int, int, int, int]] = {}
+        self._lines: List[str] = []
+        self._resolved: Dict[int, Optional[SourceLocation]] = {}
+        self._line_scopes: Optional[List[symtable.SymbolTable]] = None
+        self._parents: Dict[int, symtable.SymbolTable] = {}
+        self._occurrences: Optional[Dict[int, Tuple[str, str, int]]] = None
+        self._tree: Optional[ast.Module] = None
+        self._parsed = False
+        self.max_iid = -1
+
+        try:
+            with open(iids_path(dyn_ast), "r") as f:
+                table = json.load(f)
+            for iid, loc in table["iid_to_location"].items():
+                self._spans[int(iid)] = (loc["start_line"], loc["start_column"], loc["end_line"], loc["end_column"])
+            self.max_iid = table.get("next_iid", len(self._spans)) - 1
+        except (OSError, ValueError, KeyError):
+            pass
+
+        try:
+            with open(dyn_ast, "r", encoding="utf-8") as f:
+                self._lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            pass
+
+    def location(self, iid: int) -> Optional[SourceLocation]:
+        try:
+            return self._resolved[iid]
+        except KeyError:
+            pass
+        span = self._spans.get(iid)
+        location = None
+        if span is not None:
+            location = SourceLocation(*span, self._snippet(*span))
+        self._resolved[iid] = location
+        return location
+
+    def source_text(self, iid: int) -> str:
+        """Full source text of the lines an iid spans"""
+        span = self._spans.get(iid)
+        if span is None:
+            return ""
+        return "\n".join(self._lines[span[0] - 1:span[2]])
+
+    def syntax_tree(self) -> Optional[ast.Module]:
+        """Parsed original source, shared by the analyses that look at the code around their sites"""
+        if not self._parsed:
+            self._parsed = True
+            try:
+                self._tree = ast.parse("\n".join(self._lines))
+            except (SyntaxError, ValueError):
+                self._tree = None
+        return self._tree
+
+    def span_of(self, node: ast.AST) -> Tuple[int, int, int, int]:
+        """Span of a node of syntax_tree() in the iid table's columns.
+
+        ast counts columns in UTF-8 bytes, the iid table counts characters,
+        so the two differ on lines with non-ASCII text.
+        """
+        return (node.lineno, self._character_column(node.lineno, node.col_offset),
+                node.end_lineno, self._character_column(node.end_lineno, node.end_col_offset))
+
+    def _character_column(self, line: int, offset: int) -> int:
+        if not 0 < line <= len(self._lines):
+            return offset
+        text = self._lines[line - 1]
+        if text.isascii():
+            return offset
+        return len(text.encode("utf-8")[:offset].decode("utf-8", "ignore"))
+
+    def fingerprint(self, iid: int) -> Optional[str]:
+        """Digest that identifies the code of an iid across edits elsewhere in the file.
+
+        It is made of the qualified name of the enclosing scope, the first
+        line of the node's source with whitespace collapsed, and the number
+        of earlier nodes of the same scope with the same text. Line numbers
+        and iids are left out, so inserting code above a site keeps it.
+        """
+        if self._occurrences is None:
+            self._occurrences = self._build_occurrences()
+        key = self._occurrences.get(iid)
+        if key is None:
+            return None
+        return hashlib.sha1("\0".join(map(str, key)).encode("utf-8")).hexdigest()[:16]
+
+    def _build_occurrences(self) -> Dict[int, Tuple[str, str, int]]:
+        seen: Dict[Tuple[str, str], int] = {}
+        occurrences = {}
+        for iid, span in sorted(self._spans.items(), key=lambda item: (item[1][:2], item[0])):
+            text = self._head(*span)
+            if not text:
+                continue
+            table = self._scope_at(span[0])
+            scope = self._qualified_name(table) if table is not None else "<module>"
+            occurrence = seen.get((scope, text), 0)
+            seen[(scope, text)] = occurrence + 1
+            occurrences[iid] = (scope, text, occurrence)
+        return occurrences
+
+    def _head(self, line: int, column: int, end_line: int, end_column: int) -> str:
+        """First line of a node's source, a compound statement's header, with whitespace collapsed"""
+        if not 0 < line <= len(self._lines):
+            return ""
+        text = self._lines[line - 1]
+        text = text[column:end_column] if end_line == line else text[column:]
+        return " ".join(text.split())
+
+    def binding_scope(self, line: int, name: str) -> str:
+        """Qualified name of the scope that a name used at a line binds to, following Python's scoping rules"""
+        table = self._scope_at(line)
+        if table is None:
+            return "<module>"
+        try:
+            symbol = table.lookup(name)
+        except KeyError:
+            return "<module>"
+        if table.get_type() == "module" or symbol.is_global():
+            return "<module>"
+        if symbol.is_free():
+            # Closure variable, bound by the nearest enclosing function that defines it
+            table = self._parents.get(table.get_id())
+            while table is not None and table.get_type() != "module":
+                if table.get_type() == "function":
+                    try:
+                        symbol = table.lookup(name)
+                        if symbol.is_local() and not symbol.is_free():
+                            break
+                    except KeyError:
+                        pass
+                table = self._parents.get(table.get_id())
+            if table is None or table.get_type() == "module":
+                return "<module>"
+        return self._qualified_name(table)
+
+    def in_function(self, line: int) -> bool:
+        """Whether the code at a line runs in a function, where reading a global is a dict lookup rather than a local slot"""
+        table = self._scope_at(line)
+        return table is not None and table.get_type() == "function"
+
+    def _scope_at(self, line: int) -> Optional[symtable.SymbolTable]:
+        if self._line_scopes is None:
+            self._line_scopes = self._build_line_scopes()
+        if 0 < line < len(self._line_scopes):
+            return self._line_scopes[line]
+        return None
+
+    def _build_line_scopes(self) -> List[symtable.SymbolTable]:
+        tree = self.syntax_tree()
+        if tree is None:
+            return []
+        try:
+            module = symtable.symtable("\n".join(self._lines), self.dyn_ast, "exec")
+        except (SyntaxError, ValueError):
+            return []
+
+        tables = {}
+        pending = [module]
+        while pending:
+            table = pending.pop()
+            for child in table.get_children():
+                tables[(child.get_name(), child.get_lineno())] = child
+                self._parents[child.get_id()] = table
+                pending.append(child)
+
+        # ast.walk is breadth first, so inner definitions overwrite the lines of outer ones
+        line_scopes = [module] * (len(self._lines) + 2)
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                table = tables.get((node.name, node.lineno))
+                if table is not None:
+                    for line in range(node.lineno, node.end_lineno + 1):
+                        line_scopes[line] = table
+        return line_scopes
+
+    def _qualified_name(self, table: symtable.SymbolTable) -> str:
+        names = []
+        while table is not None and table.get_type() != "module":
+            names.append(table.get_name())
+            table = self._parents.get(table.get_id())
+        return ".".join(reversed(names)) or "<module>"
+
+    def _snippet(self, line: int, column: int, end_line: int, end_column: int) -> str:
+        if not 0 < line <= len(self._lines):
+            return ""
+        text = self._lines[line - 1]
+        if end_line == line:
+            text = text[column:end_column]
+        else:
+            text = text[column:].rstrip() + " ..."
+        text = text.strip()
+        if len(text) > SNIPPET_LENGTH:
+            text = text[:SNIPPET_LENGTH - 3] + "..."
+        return text
+
+
+def iids_path(dyn_ast: str) -> str:
+    """Path of the DynaPyt iid table that belongs to a dyn_ast file"""
+    if dyn_ast.endswith(".py.orig"):
+        return dyn_ast[:-8] + "-dynapyt.json"
+    return os.path.splitext(dyn_ast)[0] + "-dynapyt.json"
+
+
+@lru_cache(maxsize=128)
+def get_source_index(dyn_ast: str) -> SourceIndex:
+    """Shared per-file index, built on first use and kept in an LRU cache"""
+    return SourceIndex(dyn_ast)
+
+
+def iid_location(dyn_ast: str, iid: int) -> Optional[SourceLocation]:
+    return get_source_index(dyn_ast).location(iid)
+
+
+def iid_line(dyn_ast: str, iid: int) -> Optional[int]:
+    location = get_source_index(dyn_ast).location(iid)
+    return location.line if location is not None else None
+
+
+def format_location(dyn_ast: str, iid: int) -> str:
+    """Human readable "file:line" for reports, falls back to the iid if it cannot be resolved"""
+    location = get_source_index(dyn_ast).location(iid)
+    if location is None:
+        return f"{dyn_ast} (iid: {iid})"
+    return f"{dyn_ast}:{location.line} (iid: {iid})"
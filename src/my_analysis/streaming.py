@@ -0,0 +1,149 @@
+import math
+import random
+import reprlib
+from typing import Any, List, Optional
+
+# Shortened repr used for sampled values, so a huge value never costs more than a few dozen characters
+_value_repr = reprlib.Repr()
+_value_repr.maxstring = 40
+_value_repr.maxother = 40
+
+
+class TripHistogram:
+    """Histogram of loop trip counts with power-of-two buckets"""
+
+    __slots__ = ("buckets", "entries", "total", "max")
+
+    def __init__(self) -> None:
+        # Bucket 0 holds zero-trip entries, bucket k holds trip counts in [2**(k-1), 2**k)
+        self.buckets: List[int] = []
+        self.entries = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, trips: int) -> None:
+        bucket = trips.bit_length()
+        if bucket >= len(self.buckets):
+            self.buckets.extend([0] * (bucket + 1 - len(self.buckets)))
+        self.buckets[bucket] += 1
+        self.entries += 1
+        self.total += trips
+        if trips > self.max:
+            self.max = trips
+
+    def mean(self) -> float:
+        return self.total / self.entries if self.entries else 0.0
+
+    def merge(self, other: "TripHistogram") -> None:
+        if len(other.buckets) > len(self.buckets):
+            self.buckets.extend([0] * (len(other.buckets) - len(self.buckets)))
+        for bucket, count in enumerate(other.buckets):
+            self.buckets[bucket] += count
+        self.entries += other.entries
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def describe(self) -> str:
+        parts = []
+        for bucket, count in enumerate(self.buckets):
+            if not count:
+                continue
+            if bucket <= 1:
+                label = str(bucket)
+            else:
+                label = f"{1 << (bucket - 1)}-{(1 << bucket) - 1}"
+            parts.append(f"{label}: {count}")
+        return ", ".join(parts)
+
+
+class Reservoir:
+    """Fixed-size sample of a value stream, weighted by the values each offer stands for.
+
+    Every offered value gets the key log(u) / weight for a uniform u, and the
+    values with the largest keys are kept (Efraimidis-Spirakis A-Res). An
+    offer made for one in w events is w times as likely to stay in the
+    sample, so thinning the offers with a Sampler does not favour the events
+    it processed while warming up. With weight 1 for every offer the sample
+    is uniform.
+    """
+
+    __slots__ = ("size", "seen", "items", "keys", "_lowest", "_rng")
+
+    def __init__(self, size: int, seed: Optional[int] = None) -> None:
+        self.size = size
+        self.seen = 0  # Values offered
+        self.items: List[str] = []
+        self.keys: List[float] = []  # Key of each kept item
+        self._lowest = 0  # Index of the smallest key once the sample is full
+        self._rng = random.Random(seed)
+
+    def offer(self, value: Any, weight: float = 1.0) -> None:
+        self.seen += 1
+        key = math.log(1.0 - self._rng.random()) / weight
+        if len(self.items) < self.size:
+            self.items.append(_safe_repr(value))
+            self.keys.append(key)
+            self._find_lowest()
+            return
+        # Only values that make it into the sample are ever converted to text
+        if key > self.keys[self._lowest]:
+            self.items[self._lowest] = _safe_repr(value)
+            self.keys[self._lowest] = key
+            self._find_lowest()
+
+    def merge(self, other: "Reservoir") -> None:
+        """Combine two samples, the largest keys of both are a sample of the combined stream"""
+        pool = sorted(zip(self.keys + other.keys, self.items + other.items), key=lambda p: p[0], reverse=True)
+        kept = pool[:self.size]
+        self.keys = [key for key, _ in kept]
+        self.items = [item for _, item in kept]
+        self.seen += other.seen
+        self._find_lowest()
+
+    def _find_lowest(self) -> None:
+        if self.keys:
+            self._lowest = min(range(len(self.keys)), key=self.keys.__getitem__)
+
+
+class LoopStats:
+    """Constant-memory summary of every execution of one loop site"""
+
+    __slots__ = ("kind", "iterations", "trips", "sample")
+
+    def __init__(self, kind: str, sample_size: int = 0) -> None:
+        self.kind = kind
+        self.iterations = 0  # Iterations over all entries of the loop
+        self.trips = TripHistogram()  # Iterations per entry
+        self.sample = Reservoir(sample_size) if sample_size > 0 else None
+
+    def record_iteration(self, value: Any = None, weight: float = 1.0) -> None:
+        """An iteration whose value is offered to the sample, standing for weight iterations"""
+        self.iterations += 1
+        if self.sample is not None:
+            self.sample.offer(value, weight)
+
+    def count_iteration(self) -> None:
+        """An iteration whose value is not offered to the sample"""
+        self.iterations += 1
+
+    def end_entry(self, trips: int) -> None:
+        self.trips.add(trips)
+
+    def merge(self, other: "LoopStats") -> None:
+        """Add the executions of the same loop recorded by another process"""
+        self.iterations += other.iterations
+        self.trips.merge(other.trips)
+        if self.sample is not None and other.sample is not None:
+            self.sample.merge(other.sample)
+
+    def describe(self) -> str:
+        trips = self.trips
+        return (f"{self.iterations} iterations over {trips.entries} entries "
+                f"(mean trip count {trips.mean():.1f}, max {trips.max})")
+
+
+def _safe_repr(value: Any) -> str:
+    try:
+        return _value_repr.repr(value)
+    except Exception:
+        return "<non-serializable>"
@@ -0,0 +1,40 @@
+import sys
+from contextvars import ContextVar
+from threading import get_ident
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def current_task() -> Optional[Any]:
+    """The running asyncio task, None outside of one or when asyncio is not in use"""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is None:
+        return None
+    loop = asyncio._get_running_loop()
+    return asyncio.current_task(loop) if loop is not None else None
+
+
+class TaskLocal(Generic[T]):
+    """One instance of a state class per thread and per asyncio task.
+
+    The state lives in a context variable. An asyncio task starts with a copy
+    of the context that created it, and a thread may too on interpreters that
+    let threads inherit contexts, so the state is stored together with the
+    thread and task it belongs to, and code that finds another thread's or
+    task's state creates its own. Lookups take no lock, and the state of a
+    finished task goes away with its context.
+    """
+
+    def __init__(self, factory: Callable[[], T]) -> None:
+        self._factory = factory
+        self._var: ContextVar = ContextVar(f"dynaperf_{getattr(factory, '__name__', 'state')}_{id(self):x}")
+
+    def get(self) -> T:
+        task, thread = current_task(), get_ident()
+        owned = self._var.get(None)
+        if owned is not None and owned[0] is task and owned[1] == thread:
+            return owned[2]
+        state = self._factory()
+        self._var.set((task, thread, state))
+        return state
@@ -0,0 +1,50 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+# The analyses are imported from the source tree, as DynaPyt does with PYTHONPATH=src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+class Program:
+    """A source file instrumented by DynaPyt, with its iids looked up by the source text they span"""
+
+    def __init__(self, dyn_ast):
+        from my_analysis.source_index import SourceIndex
+
+        self.dyn_ast = dyn_ast
+        self.index = SourceIndex(dyn_ast)
+
+    def iids(self, text):
+        """iids whose span is exactly text, in the order DynaPyt numbered them"""
+        return [iid for iid in range(self.index.max_iid + 1)
+                if self.index.location(iid) is not None and self.index.location(iid).line == self.index.location(iid).end_line
+                and self._text(iid) == text]
+
+    def iid(self, text):
+        iids = self.iids(text)
+        assert len(iids) == 1, f"{text!r} spans iids {iids}"
+        return iids[0]
+
+    def _text(self, iid):
+        line, column, _, end_column, _ = self.index.location(iid)
+        return self.index._lines[line - 1][column:end_column]
+
+
+@pytest.fixture
+def instrument(tmp_path):
+    """instrument(source, analysis class path) writes a program to tmp_path and instruments it like DynaPyt's CLI"""
+    from dynapyt.instrument.instrument import instrument_file
+    from dynapyt.utils.hooks import get_hooks_from_analysis
+
+    def instrument(source, analysis, name="program.py"):
+        path = tmp_path / name
+        path.write_text(source, encoding="utf-8")
+        with contextlib.redirect_stdout(io.StringIO()):
+            instrument_file(str(path), get_hooks_from_analysis([analysis]))
+        return Program(str(path) + ".orig")
+
+    return instrument
@@ -0,0 +1,89 @@
+"""Sites compare matches between a baseline and a candidate run, and when it fails the comparison"""
+import json
+import math
+import sys
+
+import pytest
+
+from my_analysis import compare
+from my_analysis.compare import is_regression, match_files
+
+
+def finding(file, fingerprint, cost, line=1, rule_id="R1-2", **metrics):
+    return {"analysis": "NestedLoopingAnalysis", "rule_id": rule_id, "message": f"site {fingerprint}", "file": file,
+            "line": line, "iid": 0, "fingerprint": fingerprint, "cost": cost, "cost_unit": "iterations",
+            "metrics": metrics}
+
+
+def test_files_match_by_their_longest_common_tail():
+    baseline = ["/ci/base/src/app/util.py", "/ci/base/src/lib/util.py", "/ci/base/src/app/main.py"]
+    candidate = ["/ci/head/src/lib/util.py", "/ci/head/src/app/main.py", "/ci/head/src/app/new.py"]
+    assert match_files(baseline, candidate) == {
+        "/ci/head/src/lib/util.py": "/ci/base/src/lib/util.py",
+        "/ci/head/src/app/main.py": "/ci/base/src/app/main.py",
+    }
+
+
+def test_sites_are_matched_new_or_resolved():
+    baseline = [finding("/base/a.py", "f:loop", 100, line=3, iterations=100),
+                finding("/base/a.py", "g:loop", 50),
+                finding("/base/a.py", "unused", None)]
+    # f's loop moved to line 9 and grew, g's loop is gone and h's loop is new
+    candidate = [finding("/head/a.py", "f:loop", 300, line=9, iterations=300),
+                 finding("/head/a.py", "h:loop", 20)]
+    results = {result["fingerprint"]: result for result in compare.compare(baseline, candidate)}
+    assert set(results) == {"f:loop", "g:loop", "h:loop"}
+    matched, resolved, new = results["f:loop"], results["g:loop"], results["h:loop"]
+    assert (matched["status"], matched["file"], matched["line"]) == ("matched", "/head/a.py", 9)
+    assert (matched["baseline_cost"], matched["candidate_cost"], matched["change"]) == (100, 300, 2.0)
+    assert matched["metrics"]["iterations"] == {"baseline": 100, "candidate": 300, "unit": "iterations", "change": 2.0}
+    assert (resolved["status"], resolved["candidate_cost"], resolved["change"]) == ("resolved", 0.0, -1.0)
+    assert (new["status"], new["baseline_cost"], new["change"]) == ("new", 0.0, math.inf)
+    # Largest regression first
+    assert [result["fingerprint"] for result in compare.compare(baseline, candidate)] == ["h:loop", "f:loop", "g:loop"]
+
+
+def test_same_fingerprint_under_another_rule_is_another_site():
+    results = compare.compare([finding("a.py", "f:loop", 10)], [finding("a.py", "f:loop", 10, rule_id="R2-1")])
+    assert sorted(result["status"] for result in results) == ["new", "resolved"]
+
+
+@pytest.mark.parametrize("status, old, new, threshold, min_cost, regressed", [
+    ("matched", 100, 111, 0.1, 0, True),
+    ("matched", 100, 110, 0.1, 0, False),
+    ("matched", 100, 150, 0.1, 100, False),
+    ("matched", 100, 50, 0.1, 0, False),
+    ("new", 0, 5, 0.1, 0, True),
+    ("new", 0, 5, 0.1, 10, False),
+    ("resolved", 100, 0, 0.1, 0, False),
+])
+def test_regressions_exceed_the_threshold_and_the_minimum_cost(status, old, new, threshold, min_cost, regressed):
+    result = {"status": status, "baseline_cost": old, "candidate_cost": new,
+              "change": compare.relative_change(old, new)}
+    assert is_regression(result, threshold, min_cost) is regressed
+
+
+def write_findings(path, findings):
+    path.write_text("".join(json.dumps(finding) + "\n" for finding in findings))
+    return str(path)
+
+
+@pytest.mark.parametrize("candidate_cost, status", [(100, 0), (200, 1)])
+def test_exit_status_is_one_for_a_regression(tmp_path, monkeypatch, capsys, candidate_cost, status):
+    baseline = write_findings(tmp_path / "baseline.jsonl", [finding("a.py", "f:loop", 100)])
+    candidate = write_findings(tmp_path / "candidate.jsonl", [finding("a.py", "f:loop", candidate_cost)])
+    output = tmp_path / "comparison.json"
+    monkeypatch.setattr(sys, "argv", ["compare", baseline, candidate, "--output", str(output)])
+    assert compare.main() == status
+    assert "1 sites in both runs, 0 new, 0 resolved" in capsys.readouterr().out
+    assert json.loads(output.read_text())[0]["candidate_cost"] == candidate_cost
+
+
+def test_new_site_fails_and_its_change_is_null_in_json(tmp_path, monkeypatch, capsys):
+    baseline = write_findings(tmp_path / "baseline.jsonl", [])
+    candidate = write_findings(tmp_path / "candidate.jsonl", [finding("a.py", "f:loop", 1)])
+    output = tmp_path / "comparison.json"
+    monkeypatch.setattr(sys, "argv", ["compare", baseline, candidate, "--output", str(output)])
+    assert compare.main() == 1
+    assert "New site, cost 1 iterations" in capsys.readouterr().out
+    assert json.loads(output.read_text())[0]["change"] is None
@@ -0,0 +1,49 @@
+"""Growth curves complexity fits to the counts of a site at several input sizes"""
+import math
+
+import pytest
+
+from my_analysis.complexity import GROWTH_CURVES, best_fit, fit_curve
+
+SIZES = [100, 200, 400, 800, 1600]
+
+
+@pytest.mark.parametrize("curve, count", [
+    ("n", lambda n: 3 * n + 5),
+    ("n log n", lambda n: 2 * n * math.log2(n)),
+    ("n²", lambda n: n * n / 2 + n),
+])
+def test_curve_of_synthetic_counts_is_recovered(curve, count):
+    fit = best_fit(SIZES, [count(n) for n in SIZES])
+    assert fit.curve == curve
+    assert fit.label == "high" and fit.runner_up is not None
+
+
+def test_linear_fit_recovers_its_coefficients():
+    fit = fit_curve("n", dict(GROWTH_CURVES)["n"], SIZES, [3 * n + 5 for n in SIZES])
+    assert fit.a == pytest.approx(3) and fit.b == pytest.approx(5) and fit.error == pytest.approx(0, abs=1e-12)
+
+
+def test_flat_counts_are_constant():
+    fit = best_fit(SIZES, [7.0] * len(SIZES))
+    assert fit.curve == "1" and fit.confidence == 1.0
+    # Every growing curve would need a slope of 0 or less
+    assert all(fit_curve(name, f, SIZES, [7.0] * len(SIZES)) is None for name, f in GROWTH_CURVES[1:])
+
+
+def test_tie_goes_to_the_simpler_curve():
+    # Two sizes are fitted exactly by every growing curve
+    fit = best_fit([10, 20], [15.0, 25.0])
+    assert fit.curve == "log n" and fit.error == pytest.approx(0, abs=1e-12)
+    assert fit.confidence == 0.0 and fit.label == "low"
+
+
+def test_exponential_is_recovered_at_small_sizes():
+    sizes = list(range(10, 21, 2))
+    assert best_fit(sizes, [2.0 ** n for n in sizes]).curve == "2ⁿ"
+
+
+def test_exponential_that_overflows_is_left_out():
+    sizes = [1000, 2000, 4000]
+    assert fit_curve("2ⁿ", dict(GROWTH_CURVES)["2ⁿ"], sizes, [float(n) for n in sizes]) is None
+    assert best_fit(sizes, [float(n) for n in sizes]).curve == "n"
@@ -0,0 +1,17 @@
+"""Options of the sub-analyses of CompositeAnalysis"""
+import pytest
+
+from my_analysis.CompositeAnalysis import CompositeAnalysis
+
+
+def test_prefixed_options_reach_their_analysis():
+    composite = CompositeAnalysis(analyses="NestedLoopingAnalysis,my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis",
+                                  **{"NestedLoopingAnalysis.depth_threshold": "4",
+                                     "my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis.threshold": "9"})
+    nested, concat = composite.analyses
+    assert (nested.depth_threshold, concat.threshold) == (4, 9)
+
+
+def test_options_of_an_analysis_that_is_not_run_are_an_error():
+    with pytest.raises(ValueError, match="RecursionAnalysis"):
+        CompositeAnalysis(analyses="NestedLoopingAnalysis", **{"RecursionAnalysis.depth_threshold": "4"})
@@ -0,0 +1,38 @@
+"""SARIF conversion at exit of the findings file"""
+import json
+import os
+
+from my_analysis import findings
+from my_analysis.findings import Finding, FindingsWriter
+
+
+def test_stale_findings_are_not_converted(tmp_path, monkeypatch):
+    path = tmp_path / "dynaperf_findings.jsonl"
+    path.write_text(json.dumps(Finding("A", "R2-1", "left by an earlier run", "old.py", 1, 1).to_dict()) + "\n")
+    monkeypatch.setattr(findings, "_writer", FindingsWriter(str(path)))
+    findings._write_sarif_at_exit()
+    assert not (tmp_path / "dynaperf_findings.sarif").exists()
+
+
+def test_findings_of_this_run_are_converted(tmp_path, monkeypatch):
+    path = tmp_path / "dynaperf_findings.jsonl"
+    path.write_text(json.dumps(Finding("A", "R2-1", "left by an earlier run", "old.py", 1, 1).to_dict()) + "\n")
+    writer = FindingsWriter(str(path))
+    monkeypatch.setattr(findings, "_writer", writer)
+    writer.emit(Finding("A", "R2-1", "found now", "new.py", 2, 2))
+    findings._write_sarif_at_exit()
+    sarif = json.loads((tmp_path / "dynaperf_findings.sarif").read_text())
+    assert [result["message"]["text"] for result in sarif["runs"][0]["results"]] == ["found now"]
+
+
+def test_forked_child_leaves_the_conversion_to_its_parent(tmp_path, monkeypatch):
+    writer = FindingsWriter(str(tmp_path / "dynaperf_findings.jsonl"))
+    monkeypatch.setattr(findings, "_writer", writer)
+    writer.emit(Finding("A", "R2-1", "found by the parent", "a.py", 1, 1))
+    writer.flush()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0 if findings._writer.emitted == 0 else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert writer.emitted == 1
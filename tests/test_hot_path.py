@@ -0,0 +1,36 @@
+"""Calling context stacks of HotPathProfilerAnalysis for loops left by an early return"""
+from my_analysis.HotPathProfilerAnalysis import HotPathProfilerAnalysis
+
+FILE = "example.py"
+FIND_FUNCTION, FIND_LOOP, OUTER_FUNCTION, OUTER_LOOP = 0, 1, 4, 5
+
+
+def stacks(analysis):
+    tree = analysis.tree
+    return {tuple(tree.sites[n][0] + "@" + str(tree.sites[n][2]) for n in tree.path(node))
+            for node in range(1, len(tree.sites))}
+
+
+def test_early_return_does_not_nest_a_loop_in_itself(tmp_path):
+    analysis = HotPathProfilerAnalysis(output_file=str(tmp_path / "hotpath.folded"))
+    rows = [[1, 2, 3]] * 3
+    analysis.function_enter(FILE, OUTER_FUNCTION, [], "outer", False)
+    for row in rows:
+        analysis.enter_for(FILE, OUTER_LOOP, row, rows)
+        analysis.function_enter(FILE, FIND_FUNCTION, [], "find", False)
+        analysis.enter_for(FILE, FIND_LOOP, row[0], row)
+        # return from inside the loop: function_exit and no loop exit
+        analysis.function_exit(FILE, FIND_FUNCTION, "find", row[0])
+    analysis.enter_for(FILE, OUTER_LOOP, StopIteration(), rows)
+    analysis.exit_for(FILE, OUTER_LOOP)
+    analysis.function_exit(FILE, OUTER_FUNCTION, "outer", None)
+
+    assert stacks(analysis) == {
+        ("function@4",),
+        ("function@4", "for@5"),
+        ("function@4", "for@5", "function@0"),
+        ("function@4", "for@5", "function@0", "for@1"),
+    }
+    counters = analysis.sites[FILE]
+    assert (counters.counts[OUTER_LOOP], counters.counts[FIND_LOOP], counters.counts[FIND_FUNCTION]) == (3, 3, 3)
+    assert analysis.tasks.get().node == 0
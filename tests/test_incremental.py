@@ -0,0 +1,120 @@
+"""Modules incremental re-analyses after a change, and the findings it keeps from the cache"""
+import json
+
+import pytest
+
+from my_analysis import incremental
+from my_analysis.findings import read_findings
+from my_analysis.incremental import ImportGraph, IncrementalRunner
+
+PROJECT = {
+    "main.py": "import pkg.sub.tool\n",
+    "other.py": "import json\n",
+    "pkg/__init__.py": "from .core import helper\n",
+    "pkg/core.py": "def helper():\n    return 1\n",
+    "pkg/sub/__init__.py": "",
+    "pkg/sub/util.py": "from ..core import helper\n",
+    "pkg/sub/tool.py": "from . import util\n",
+}
+
+
+def write_project(root, files):
+    for name, source in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+
+
+@pytest.fixture
+def graph(tmp_path):
+    write_project(tmp_path, PROJECT)
+    return ImportGraph(tmp_path, PROJECT)
+
+
+def test_relative_imports_reach_the_importers(graph):
+    assert graph.affected({"pkg/core.py"}) == {
+        "pkg/core.py", "pkg/__init__.py", "pkg/sub/util.py", "pkg/sub/tool.py", "main.py"}
+    assert graph.affected({"pkg/sub/util.py"}) == {"pkg/sub/util.py", "pkg/sub/tool.py", "main.py"}
+
+
+def test_package_init_fans_out_to_every_module_importing_from_the_package(graph):
+    # Importing pkg.sub.tool or anything else below pkg runs pkg/__init__.py first
+    assert graph.affected({"pkg/__init__.py"}) == {
+        "pkg/__init__.py", "pkg/sub/util.py", "pkg/sub/tool.py", "main.py"}
+    assert graph.affected({"pkg/sub/__init__.py"}) == {"pkg/sub/__init__.py", "pkg/sub/tool.py", "main.py"}
+
+
+def test_unimported_module_affects_only_itself(graph):
+    assert graph.affected({"other.py"}) == {"other.py"}
+    assert graph.affected(set()) == set()
+
+
+class Run:
+    """IncrementalRunner with the instrumentation and the analysis run replaced by recording fakes.
+
+    The fake run emits one finding per module it was asked to instrument, with the run's label as its message.
+    """
+
+    def __init__(self, monkeypatch, root, out_dir):
+        self.root, self.out_dir = root, out_dir
+        self.instrumented = None
+        self.returncode = 0
+        run = self
+
+        class Instrumenter:
+            def __init__(self, root, out_dir, analyses, jobs, exclude, only):
+                run.instrumented = set(only)
+
+            def run(self):
+                return {"failed": 0}
+
+        def run_analysis(runner, findings_path):
+            with open(findings_path, "w", encoding="utf-8") as f:
+                for name in sorted(run.instrumented) + ["/usr/lib/python3/json/__init__.py"]:
+                    path = name if name.startswith("/") else str(run.out_dir / name)
+                    f.write(json.dumps({"analysis": "A", "rule_id": "R1-1", "message": run.label, "file": path,
+                                        "line": 1, "iid": 0}) + "\n")
+            return run.returncode
+
+        monkeypatch.setattr(incremental, "TreeInstrumenter", Instrumenter)
+        monkeypatch.setattr(IncrementalRunner, "_run_analysis", run_analysis)
+
+    def __call__(self, label):
+        self.label = label
+        returncode = IncrementalRunner(self.root, self.out_dir, "main.py", ["A"], 1, []).run()
+        merged = self.out_dir / incremental.MERGED_FINDINGS
+        findings = {finding["file"]: finding["message"] for finding in read_findings(str(merged))} \
+            if merged.exists() else {}
+        return returncode, findings
+
+
+def test_unchanged_modules_keep_their_cached_findings(tmp_path, monkeypatch):
+    root, out_dir = tmp_path / "project", tmp_path / "out"
+    out_dir.mkdir()
+    write_project(root, {"a.py": "import b\n", "b.py": "x = 1\n", "c.py": "y = 2\n"})
+    run = Run(monkeypatch, root, out_dir)
+    external = "/usr/lib/python3/json/__init__.py"
+
+    assert run("first") == (0, {str(root / "a.py"): "first", str(root / "b.py"): "first",
+                                str(root / "c.py"): "first", external: "first"})
+    assert run.instrumented == {"a.py", "b.py", "c.py"}
+
+    (root / "b.py").write_text("x = 2\n")
+    assert run("second") == (0, {str(root / "a.py"): "second", str(root / "b.py"): "second",
+                                 str(root / "c.py"): "first", external: "second"})
+    assert run.instrumented == {"a.py", "b.py"}
+
+    # A failed run leaves the cache as it was, so the change is analysed again by the next run
+    cache = (out_dir / incremental.CACHE_NAME).read_text()
+    (root / "c.py").write_text("y = 3\n")
+    run.returncode = 1
+    assert run("failed")[0] == 1
+    assert (out_dir / incremental.CACHE_NAME).read_text() == cache
+    run.returncode = 0
+    assert run("third")[1][str(root / "c.py")] == "third"
+    assert run.instrumented == {"c.py"}
+
+    # Nothing changed, every module comes from the cache
+    assert run("fourth") == (0, {str(root / "a.py"): "second", str(root / "b.py"): "second",
+                                 str(root / "c.py"): "third", external: "fourth"})
+    assert run.instrumented == set()
@@ -0,0 +1,84 @@
+"""Elements InefficientApiAnalysis estimates each linear search compares"""
+from collections import deque
+
+import pytest
+
+from my_analysis.InefficientApiAnalysis import InefficientApiAnalysis, _search_method
+
+FILE, LOOP, SITE = "example.py", 0, 1
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analysis = InefficientApiAnalysis()
+    analysis.enter_for(FILE, LOOP, 0, [0])
+    return analysis
+
+
+def call(analysis, function, *args):
+    """A call DynaPyt reports with pre_call and, unless it raises, post_call"""
+    analysis.pre_call(FILE, SITE, function, list(args), {})
+    try:
+        result = function(*args)
+    except ValueError:
+        return
+    analysis.post_call(FILE, SITE, result, function, args, {})
+
+
+def scanned(analysis):
+    site = analysis.sites[(FILE, SITE)]
+    return site.operations, site.scanned
+
+
+@pytest.mark.parametrize("hook, value, result, expected", [
+    ("_in", 3, True, 5),
+    ("_in", 99, False, 10),
+    ("not_in", 99, True, 10),
+    ("not_in", 3, False, 5),
+])
+def test_membership_tests_scan_half_for_a_hit_and_all_for_a_miss(analysis, hook, value, result, expected):
+    getattr(analysis, hook)(FILE, SITE, value, list(range(10)), result)
+    assert scanned(analysis) == (1, expected)
+
+
+def test_index_scans_up_to_the_position_it_finds(analysis):
+    values = list(range(10))
+    call(analysis, values.index, 3)
+    assert scanned(analysis) == (1, 4)
+
+
+def test_index_of_a_missing_value_scans_everything(analysis):
+    values = list(range(10))
+    call(analysis, values.index, 99)
+    call(analysis, list.index, values, 99)
+    assert scanned(analysis) == (2, 20)
+
+
+def test_remove_and_count_touch_the_whole_list(analysis):
+    values = list(range(10))
+    call(analysis, values.remove, 3)
+    call(analysis, values.remove, 99)
+    call(analysis, values.count, 5)
+    assert scanned(analysis) == (3, 10 + 9 + 9)
+
+
+def test_searches_outside_loops_are_not_recorded(analysis):
+    analysis.enter_for(FILE, LOOP, StopIteration(), [0])
+    analysis.exit_for(FILE, LOOP)
+    call(analysis, list(range(10)).index, 3)
+    assert not analysis.sites
+
+
+def test_search_methods_bound_and_unbound():
+    values, items = [1, 2], deque([1, 2])
+    assert _search_method(values.index, (2,)) == ("index", values)
+    assert _search_method(list.count, (values, 2)) == ("count", values)
+    assert _search_method(list.remove, (values, 2)) == ("remove", values)
+    assert _search_method(items.remove, (2,)) == ("remove", items)
+    assert _search_method((1, 2).index, (2,)) == ("index", (1, 2))
+    # str.index searches for substrings, and the unbound list methods only take lists
+    assert _search_method("ab".index, ("b",)) is None
+    assert _search_method(list.index, ((1, 2), 2)) is None
+    assert _search_method(values.append, (3,)) is None
+    assert _search_method(len, (values,)) is None
@@ -0,0 +1,157 @@
+"""LoopTracker against the event sequences DynaPyt sends for loops.
+
+A loop that ends normally sends a header event that does not proceed and
+then an exit event. break and continue send an exit event followed by
+_break or _continue. A return sends function_exit and no loop exit.
+"""
+from my_analysis.loop_context import LoopTracker
+
+FILE = "example.py"
+OUTER, INNER, FIND = (FILE, 1), (FILE, 2), (FILE, 3)
+MAIN, FIND_FUNCTION = (FILE, 10), (FILE, 11)
+
+
+class Recorder:
+    """Drives a tracker and keeps the trip counts of the loop executions it pops"""
+
+    def __init__(self):
+        self.loops = LoopTracker()
+        self.trips = {}
+
+    def close(self, popped):
+        for frame in popped:
+            self.trips.setdefault(frame.loop_id, []).append(frame.iterations)
+
+    def iterate(self, loop_id, proceeds=True):
+        frame, is_new, popped = self.loops.enter(loop_id, "for", proceeds)
+        self.close(popped)
+        return frame
+
+    def end(self, loop_id):
+        self.iterate(loop_id, proceeds=False)
+        self.close(self.loops.exit(loop_id))
+
+    def continue_(self, loop_id):
+        self.close(self.loops.exit(loop_id))
+        self.loops.continue_(loop_id)
+
+    def break_(self, loop_id):
+        self.close(self.loops.exit(loop_id))
+        self.close(self.loops.break_(loop_id))
+
+    def call(self, function):
+        self.close(self.loops.call_enter(function))
+
+    def return_(self, function):
+        self.close(self.loops.call_exit(function))
+
+
+def test_continue_does_not_end_the_loop():
+    recorder = Recorder()
+    for _ in range(2):
+        for i in range(10):
+            recorder.iterate(OUTER)
+            if i % 2:
+                recorder.continue_(OUTER)
+        recorder.end(OUTER)
+    assert recorder.trips == {OUTER: [10, 10]}
+    assert not recorder.loops
+
+
+def test_continue_without_continue_hook_goes_on_at_the_next_header_event():
+    recorder = Recorder()
+    for _ in range(10):
+        recorder.iterate(OUTER)
+        recorder.close(recorder.loops.exit(OUTER))
+    recorder.end(OUTER)
+    assert recorder.trips == {OUTER: [10]}
+
+
+def test_break_pops_the_loop():
+    recorder = Recorder()
+    for _ in range(3):
+        recorder.iterate(OUTER)
+        for j in range(5):
+            recorder.iterate(INNER)
+            if j == 2:
+                recorder.break_(INNER)
+                break
+        assert recorder.loops.top.loop_id == OUTER
+    recorder.end(OUTER)
+    assert recorder.trips == {INNER: [3, 3, 3], OUTER: [3]}
+
+
+def test_break_without_break_hook_is_settled_by_the_next_event():
+    recorder = Recorder()
+    for _ in range(2):
+        recorder.iterate(OUTER)
+        recorder.iterate(INNER)
+        recorder.close(recorder.loops.exit(INNER))
+    recorder.end(OUTER)
+    assert recorder.trips == {INNER: [1, 1], OUTER: [2]}
+
+
+def test_early_return_closes_the_loops_of_the_call():
+    recorder = Recorder()
+    recorder.call(MAIN)
+    for _ in range(3):
+        recorder.iterate(OUTER)
+        recorder.call(FIND_FUNCTION)
+        for k in range(4):
+            frame = recorder.iterate(FIND)
+            assert frame.parent.loop_id == OUTER and frame.depth == 2
+            if k == 1:
+                break
+        recorder.return_(FIND_FUNCTION)
+        assert recorder.loops.top.loop_id == OUTER
+    recorder.end(OUTER)
+    recorder.return_(MAIN)
+    assert recorder.trips == {FIND: [2, 2, 2], OUTER: [3]}
+    assert not recorder.loops
+
+
+def test_recursive_calls_have_their_own_frames():
+    recorder = Recorder()
+
+    def walk(depth):
+        recorder.call(FIND_FUNCTION)
+        for _ in range(2):
+            frame = recorder.iterate(FIND)
+            if depth:
+                walk(depth - 1)
+        recorder.end(FIND)
+        recorder.return_(FIND_FUNCTION)
+        return frame
+
+    walk(2)
+    assert recorder.trips == {FIND: [2] * 7}
+    assert not recorder.loops
+
+
+def test_exception_leaving_a_call_is_unwound_by_the_callers_loop():
+    recorder = Recorder()
+    recorder.call(MAIN)
+    for _ in range(2):
+        recorder.iterate(OUTER)
+        # The call raises from inside its loop, the caller catches the exception
+        recorder.call(FIND_FUNCTION)
+        recorder.iterate(FIND)
+    recorder.end(OUTER)
+    recorder.return_(MAIN)
+    assert recorder.trips == {FIND: [1, 1], OUTER: [2]}
+    assert not recorder.loops
+
+
+def test_shared_tracker_replays_an_event_for_every_analysis():
+    loops = LoopTracker()
+    loops.enter(OUTER, "for")
+    loops.begin_event()
+    first = loops.exit(OUTER)
+    second = loops.exit(OUTER)
+    loops.end_event()
+    loops.begin_event()
+    popped = loops.break_(OUTER)
+    assert loops.break_(OUTER) is popped
+    loops.end_event()
+    assert first == second == []
+    assert [frame.loop_id for frame in popped] == [OUTER]
@@ -0,0 +1,74 @@
+"""Fingerprints LoopInvariantAnalysis compares across the iterations of a loop execution"""
+import pytest
+
+from my_analysis.LoopInvariantAnalysis import LoopInvariantAnalysis, _outermost
+
+FILE, LOOP, SITE = "example.py", 0, 1
+ANALYSIS = "my_analysis.LoopInvariantAnalysis.LoopInvariantAnalysis"
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return LoopInvariantAnalysis()
+
+
+def run_loops(analysis, executions, iterations, evaluate):
+    """Executions of a loop that calls evaluate(iteration) in every iteration"""
+    for _ in range(executions):
+        values = list(range(iterations))
+        for value in values:
+            analysis.enter_for(FILE, LOOP, value, values)
+            evaluate(value)
+        analysis.enter_for(FILE, LOOP, StopIteration(), values)
+        analysis.exit_for(FILE, LOOP)
+    site = analysis.sites[(FILE, SITE)]
+    site.close()
+    return site
+
+
+def test_call_with_the_same_arguments_and_result_is_invariant(analysis):
+    text = "text"
+    site = run_loops(analysis, 2, 5, lambda _: analysis.post_call(FILE, SITE, 4, len, (text,), {}))
+    assert (site.instances, site.invariant_instances, site.redundant, site.total) == (2, 2, 8, 10)
+    assert site.value == "4" and site.loop == ("for", FILE, LOOP)
+
+
+def test_call_whose_result_changes_is_not_invariant(analysis):
+    text = "text"
+    site = run_loops(analysis, 2, 5, lambda i: analysis.post_call(FILE, SITE, i, len, (text,), {}))
+    assert (site.instances, site.invariant_instances, site.redundant, site.total) == (2, 0, 0, 10)
+
+
+def test_call_with_new_arguments_is_not_invariant(analysis):
+    site = run_loops(analysis, 1, 5, lambda i: analysis.post_call(FILE, SITE, 1, len, ([i],), {}))
+    assert (site.instances, site.invariant_instances, site.redundant) == (1, 0, 0)
+
+
+def test_bound_method_reads_of_the_same_instance_are_invariant(analysis):
+    class Point:
+        def norm(self):
+            return 0
+
+    point = Point()
+    assert point.norm is not point.norm
+    site = run_loops(analysis, 2, 3, lambda _: analysis.read_attribute(FILE, SITE, point, "norm", point.norm))
+    assert (site.instances, site.invariant_instances, site.redundant, site.total) == (2, 2, 4, 6)
+
+
+def test_execution_with_a_single_iteration_is_not_counted(analysis):
+    site = run_loops(analysis, 1, 1, lambda _: analysis.post_call(FILE, SITE, 4, len, ("text",), {}))
+    assert (site.instances, site.redundant, site.total) == (0, 0, 1)
+
+
+def test_parts_of_a_reported_expression_of_the_same_loop_are_dropped(instrument, analysis):
+    program = instrument("for i in range(n):\n    y = f(a.b)\nfor j in range(n):\n    z = a.c\n", ANALYSIS)
+    call, part, other = (program.dyn_ast, program.iid("f(a.b)")), (program.dyn_ast, program.iid("a.b")), \
+        (program.dyn_ast, program.iid("a.c"))
+    analysis.enter_for(program.dyn_ast, 0, 0, [0])
+    for key in (call, part):
+        analysis._evaluate(*key, "call", (), 1)
+    analysis.enter_for(program.dyn_ast, 1, 0, [0])
+    analysis._evaluate(*other, "attribute", (), 1)
+    reported = [(key, analysis.sites[key]) for key in (call, part, other)]
+    assert [key for key, _ in _outermost(reported)] == [call, other]
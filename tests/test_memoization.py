@@ -0,0 +1,84 @@
+"""MemoizationAnalysis fed the function hooks DynaPyt sends for the calls of one function"""
+import pickle
+
+import pytest
+
+from my_analysis.MemoizationAnalysis import MemoizationAnalysis
+
+FILE, FUNCTION = "example.py", 0
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return MemoizationAnalysis(sizes="2")
+
+
+def enter(analysis, *args):
+    analysis.function_enter(FILE, FUNCTION, [lambda arg=arg: arg for arg in args], "f", False)
+
+
+def leave(analysis, result):
+    analysis.function_exit(FILE, FUNCTION, "f", result)
+
+
+def call(analysis, result, *args):
+    enter(analysis, *args)
+    leave(analysis, result)
+
+
+def caches(analysis):
+    stats = analysis.functions[(FILE, FUNCTION)]
+    return {cache.label: (cache.lookups, cache.hits) for cache in stats.caches}
+
+
+def test_least_recently_used_argument_tuple_is_evicted(analysis):
+    for arg in (1, 2, 1, 3, 2):
+        call(analysis, arg * 10, arg)
+    # maxsize=2 evicts 2 when 3 is stored, since 1 was used after it
+    assert caches(analysis) == {"maxsize=2": (5, 1), "maxsize=None": (5, 2)}
+    assert list(analysis.functions[(FILE, FUNCTION)].caches[0].keys) == [(3,), (2,)]
+
+
+def test_argument_tuples_with_the_same_hash_are_different_keys(analysis):
+    assert hash((-1,)) == hash((-2,))
+    call(analysis, "a", -1)
+    call(analysis, "b", -2)
+    stats = analysis.functions[(FILE, FUNCTION)]
+    assert caches(analysis) == {"maxsize=2": (2, 0), "maxsize=None": (2, 0)}
+    assert not stats.changed_results
+
+
+def test_results_are_compared_by_equality(analysis):
+    call(analysis, [1], 1)
+    call(analysis, [1], 1)
+    stats = analysis.functions[(FILE, FUNCTION)]
+    assert not stats.changed_results
+    call(analysis, [2], 1)
+    assert stats.changed_results == 1
+
+
+def test_recursive_calls_of_a_hit_are_not_looked_up(analysis):
+    def fib(n):
+        enter(analysis, n)
+        result = n if n < 2 else fib(n - 1) + fib(n - 2)
+        leave(analysis, result)
+        return result
+
+    fib(2)
+    assert caches(analysis) == {"maxsize=2": (3, 0), "maxsize=None": (3, 0)}
+    # fib(2) is a hit, a cached fib would not have called fib(1) and fib(0) again
+    fib(2)
+    stats = analysis.functions[(FILE, FUNCTION)]
+    assert caches(analysis) == {"maxsize=2": (4, 1), "maxsize=None": (4, 1)}
+    assert stats.calls == stats.completed == 6
+    assert all(not cache.shadowed and cache.saved > 0.0 for cache in stats.caches)
+    assert not analysis.pending
+
+
+def test_shards_leave_out_argument_tuples_that_cannot_be_pickled(analysis):
+    call(analysis, 1, len)
+    call(analysis, 2, lambda: None)
+    stats = pickle.loads(pickle.dumps(analysis.functions[(FILE, FUNCTION)]))
+    assert stats.calls == 2 and stats.unbounded.lookups == 2
+    assert list(stats.unbounded.keys.items()) == [((len,), None)]
@@ -0,0 +1,84 @@
+"""NestedLoopingAnalysis fed the hook calls DynaPyt makes for loops with continue, break and early return"""
+import pytest
+
+from my_analysis.NestedLoopingAnalysis import NestedLoopingAnalysis
+
+FILE = "example.py"
+FIND_FUNCTION, FIND_LOOP, OUTER_FUNCTION, OUTER_LOOP = 0, 1, 4, 5
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return NestedLoopingAnalysis()
+
+
+def run_loop(analysis, iid, values, stop_at=None, continue_on=()):
+    """One execution of a for loop, left through a break at stop_at or ended normally"""
+    for value in values:
+        analysis.enter_for(FILE, iid, value, values)
+        if value == stop_at:
+            analysis.exit_for(FILE, iid)
+            analysis._break(FILE, 99, iid)
+            return
+        if value in continue_on:
+            analysis.exit_for(FILE, iid)
+            analysis._continue(FILE, 98, iid)
+    analysis.enter_for(FILE, iid, StopIteration(), values)
+    analysis.exit_for(FILE, iid)
+
+
+def test_continue_keeps_one_entry(analysis):
+    for _ in range(2):
+        run_loop(analysis, OUTER_LOOP, list(range(10)), continue_on={1, 3, 5, 7, 9})
+    stats = analysis.loop_stats[(FILE, OUTER_LOOP)]
+    assert (stats.iterations, stats.trips.entries, stats.trips.max) == (20, 2, 10)
+    assert analysis.break_continue_stats[(FILE, OUTER_LOOP)] == {"normal_exits": 2, "breaks": 0, "continues": 10}
+
+
+def test_break_ends_the_entry(analysis):
+    run_loop(analysis, OUTER_LOOP, list(range(10)), stop_at=3)
+    stats = analysis.loop_stats[(FILE, OUTER_LOOP)]
+    assert (stats.iterations, stats.trips.entries, stats.trips.max) == (4, 1, 4)
+    assert not analysis.loops
+
+
+def test_early_return_nests_the_callee_loop_inside_the_caller_loop(analysis):
+    rows = [[1, 2, 3, 4]] * 5
+    analysis.function_enter(FILE, OUTER_FUNCTION, [], "outer", False)
+    for row in rows:
+        analysis.enter_for(FILE, OUTER_LOOP, row, rows)
+        analysis.function_enter(FILE, FIND_FUNCTION, [], "find", False)
+        for x in row:
+            analysis.enter_for(FILE, FIND_LOOP, x, row)
+            if x == 2:
+                break
+        # return x from inside the loop: function_exit and no loop exit
+        analysis.function_exit(FILE, FIND_FUNCTION, "find", 2)
+    analysis.enter_for(FILE, OUTER_LOOP, StopIteration(), rows)
+    analysis.exit_for(FILE, OUTER_LOOP)
+    analysis.function_exit(FILE, OUTER_FUNCTION, "outer", None)
+
+    assert list(analysis.loop_data) == [(FILE, OUTER_LOOP)]
+    assert analysis.loop_data[(FILE, OUTER_LOOP)]["nested_loops"] == [[(FILE, FIND_LOOP, "for")]]
+    outer, find = analysis.loop_stats[(FILE, OUTER_LOOP)], analysis.loop_stats[(FILE, FIND_LOOP)]
+    assert (outer.iterations, outer.trips.entries, outer.trips.max) == (5, 1, 5)
+    assert (find.iterations, find.trips.entries, find.trips.max) == (10, 5, 2)
+    assert not analysis.loops
+
+
+def test_sampling_keeps_counts_exact(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analysis = NestedLoopingAnalysis(sample_rate=8)
+    rows = [[1, 2, 3]] * 200
+    for row in rows:
+        analysis.enter_for(FILE, OUTER_LOOP, row, rows)
+        run_loop(analysis, FIND_LOOP, row)
+    analysis.enter_for(FILE, OUTER_LOOP, StopIteration(), rows)
+    analysis.exit_for(FILE, OUTER_LOOP)
+
+    assert analysis.loop_data[(FILE, OUTER_LOOP)]["nested_loops"] == [[(FILE, FIND_LOOP, "for")]]
+    events, processed = analysis.sampler.totals()
+    assert (events, processed < events) == (200, True)
+    find = analysis.loop_stats[(FILE, FIND_LOOP)]
+    assert (find.iterations, find.trips.entries) == (600, 200)
@@ -0,0 +1,92 @@
+"""ObjectCreationInLoopAnalysis fed the hook calls DynaPyt makes for loops that create objects"""
+import tracemalloc
+
+import pytest
+
+from my_analysis.governor import Governor
+from my_analysis.ObjectCreationInLoopAnalysis import ObjectCreationInLoopAnalysis
+
+FILE, OTHER_FILE = "example.py", "other.py"
+FUNCTION, LOOP, CREATION = 0, 1, 2
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    analysis = ObjectCreationInLoopAnalysis()
+    # Sites settled by another test stay settled in the process-wide governor
+    analysis.governor = Governor()
+    yield analysis
+    analysis._stop_tracing()
+
+
+def run_loop(analysis, dyn_ast, values):
+    """One execution of a for loop that builds a new list in every iteration"""
+    kept = []
+    for value in values:
+        analysis.enter_for(dyn_ast, LOOP, value, values)
+        kept.append([value] * 100)
+        analysis._list(dyn_ast, CREATION, kept[-1])
+    analysis.enter_for(dyn_ast, LOOP, StopIteration(), values)
+    analysis.exit_for(dyn_ast, LOOP)
+
+
+def test_sites_with_the_same_iid_in_two_files_stay_apart(analysis):
+    run_loop(analysis, FILE, list(range(4)))
+    run_loop(analysis, OTHER_FILE, list(range(3)))
+    sites = {key: data['count'].total for key, data in analysis.repeated_creations.items()}
+    assert sites == {(FILE, CREATION, "list"): 4, (OTHER_FILE, CREATION, "list"): 3}
+    assert set(analysis.loop_memory) == {(FILE, LOOP), (OTHER_FILE, LOOP)}
+
+
+def test_early_return_closes_the_loop(analysis):
+    values = list(range(5))
+    kept = []
+    analysis.function_enter(FILE, FUNCTION, [], "find", False)
+    for value in values[:3]:
+        analysis.enter_for(FILE, LOOP, value, values)
+        kept.append([value])
+        analysis._list(FILE, CREATION, kept[-1])
+    # return from inside the loop: function_exit and no loop exit
+    analysis.function_exit(FILE, FUNCTION, "find", None)
+    assert not analysis.loops
+    assert not analysis._windows
+    assert analysis.loop_memory[(FILE, LOOP)].iterations == 3
+    assert (FILE, CREATION, "list") in analysis.repeated_creations
+
+
+def test_tracing_started_by_the_program_is_left_alone(analysis):
+    tracemalloc.start()
+    try:
+        garbage = bytearray(1 << 20)
+        del garbage
+        _, peak = tracemalloc.get_traced_memory()
+        run_loop(analysis, FILE, list(range(3)))
+        analysis.end_execution()
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= peak
+    finally:
+        tracemalloc.stop()
+
+
+def test_state_of_a_loop_execution_is_dropped_when_it_closes(analysis):
+    run_loop(analysis, FILE, list(range(4)))
+    run_loop(analysis, FILE, list(range(4)))
+    assert not analysis.object_creations
+    assert not analysis.loop_assignments
+    # Settled after the first execution, the second one is only counted
+    assert analysis.repeated_creations[(FILE, CREATION, "list")]['count'].total == 8
+
+
+def test_assigning_the_same_object_in_every_iteration_is_not_a_creation(analysis):
+    shared = [0] * 100
+    values = list(range(50))
+    for value in values:
+        analysis.enter_for(FILE, LOOP, value, values)
+        analysis.write(FILE, CREATION, [], shared)
+        identities = analysis.loop_assignments[analysis.loops.top][(FILE, CREATION, "list")]
+        assert identities.first == id(shared) and not identities.differs
+    analysis.enter_for(FILE, LOOP, StopIteration(), values)
+    analysis.exit_for(FILE, LOOP)
+    assert not analysis.repeated_creations
+    assert not analysis.loop_assignments
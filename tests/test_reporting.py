@@ -0,0 +1,43 @@
+"""Report sinks shared by several analyses"""
+import threading
+
+from my_analysis.reporting import DEBUG, INFO, ReportSink, get_sink
+
+
+def test_flush_returns_when_the_file_cannot_be_opened(tmp_path, capsys):
+    sink = ReportSink(str(tmp_path / "missing" / "report.log"))
+    sink.info("lost")
+    sink.flush()
+    assert "cannot write" in capsys.readouterr().err
+
+
+def test_flush_returns_when_the_writer_thread_is_gone():
+    sink = ReportSink()
+    sink._run = lambda: None
+    sink.info("lost")
+    sink.flush()
+
+
+def test_levels_are_per_caller(tmp_path):
+    path = str(tmp_path / "shared.log")
+    quiet, verbose = get_sink(path, INFO), get_sink(path, DEBUG)
+    quiet.debug("quiet debug")
+    verbose.debug("verbose debug")
+    quiet.info("quiet info")
+    quiet.flush()
+    assert (tmp_path / "shared.log").read_text().splitlines() == ["verbose debug", "quiet info"]
+
+
+def test_messages_are_formatted_on_the_calling_thread(tmp_path):
+    threads = []
+
+    class Value:
+        def __repr__(self):
+            threads.append(threading.current_thread())
+            return "value"
+
+    report = get_sink(str(tmp_path / "formatted.log"))
+    report.info("%r", Value())
+    report.flush()
+    assert threads == [threading.current_thread()]
+    assert (tmp_path / "formatted.log").read_text() == "value\n"
@@ -0,0 +1,122 @@
+"""Constant literals FileRewriter hoists out of loops and the ones it leaves in place"""
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from my_analysis.rewrite import FileRewriter, read_iid_spans
+from my_analysis.source_index import iids_path
+
+ANALYSIS = "my_analysis.ObjectCreationInLoopAnalysis.ObjectCreationInLoopAnalysis"
+
+
+def hoist(instrument, source, text):
+    """Rewrite the object creation finding at the iid spanning text, returns the reason it was skipped and the source"""
+    source = textwrap.dedent(source)
+    program = instrument(source, ANALYSIS)
+    rewriter = FileRewriter(Path("program.py"), source, read_iid_spans(Path(iids_path(program.dyn_ast))))
+    reason = rewriter.rewrite({"rule_id": "R2-3", "iid": program.iid(text)})
+    return reason, rewriter.result()
+
+
+def test_named_literal_is_built_once_before_the_outermost_loop(instrument):
+    reason, result = hoist(instrument, """\
+        def f(n):
+            total = 0
+            for i in range(n):
+                for j in range(n):
+                    x = {"a": 1}
+                    total += len(x)
+            return total
+        """, 'x = {"a": 1}')
+    assert reason is None
+    assert result == textwrap.dedent("""\
+        def f(n):
+            total = 0
+            x = {"a": 1}
+            for i in range(n):
+                for j in range(n):
+                    total += len(x)
+            return total
+        """)
+
+
+def test_anonymous_literal_is_bound_to_a_fresh_name(instrument):
+    reason, result = hoist(instrument, """\
+        def g(n, hoisted_list):
+            total = 0
+            while n:
+                n -= 1
+                total += max([3, 4])
+            return total
+        """, "[3, 4]")
+    assert reason is None
+    # hoisted_list is taken by a parameter
+    assert "    hoisted_list_2 = [3, 4]\n    while n:\n" in result
+    assert "        total += max(hoisted_list_2)\n" in result
+
+
+@pytest.mark.parametrize("body, text, reason", [
+    ("o.x = [1, 2]\ng(o)", "o.x = [1, 2]", "only name = literal assignments are hoisted"),
+    ("x = [i, 2]\ng(len(x))", "x = [i, 2]", "the list holds values that can change between iterations"),
+    ("x = (1, 2)\ng(len(x))", "x = (1, 2)", "CPython already folds a constant tuple into a constant"),
+    ("x = [1, 2]; g(len(x))", "x = [1, 2]", "the assignment shares its line with other statements"),
+    ("x = [1, 2]", "x = [1, 2]", "it is the only statement of its block"),
+    ("x = [1, 2]\nx.append(i)", "x = [1, 2]", "x is rebound, mutated or passed on inside the loop"),
+    ("x = [1, 2]\ng(x)", "x = [1, 2]", "x is rebound, mutated or passed on inside the loop"),
+    ("y = len(x) if i else 0\nx = [1, 2]", "x = [1, 2]",
+     "x is read before the assignment, where it may still hold an older value"),
+    ("g([1, 2])", "[1, 2]", "the list is mutated or passed on"),
+    ("for j in [1, 2]:\n    g(j)", "[1, 2]", "CPython already folds a constant list used this way into a constant"),
+    ("if i in {1, 2}:\n    g(i)", "{1, 2}", "CPython already folds a constant set used this way into a constant"),
+])
+def test_literals_that_cannot_be_shared_stay_in_the_loop(instrument, body, text, reason):
+    source = "def f(n, o, g):\n    for i in range(n):\n" + textwrap.indent(body, " " * 8) + "\n"
+    assert hoist(instrument, source, text) == (reason, source)
+
+
+@pytest.mark.parametrize("source", [
+    # Bound before the loop, which may run no iteration
+    """\
+    def f(n):
+        x = None
+        for i in range(n):
+            x = [1, 2]
+            n -= len(x)
+        return n
+    """,
+    # Read after the loop, which may run no iteration
+    """\
+    def f(n):
+        for i in range(n):
+            x = [1, 2]
+            n -= len(x)
+        if n:
+            print(x)
+    """,
+])
+def test_names_used_outside_the_loop_stay_in_the_loop(instrument, source):
+    reason, result = hoist(instrument, source, "x = [1, 2]")
+    assert reason == "x is also used outside the loop, where it may hold another value"
+    assert result == textwrap.dedent(source)
+
+
+def test_literal_outside_loops_stays(instrument):
+    source = "def f(n):\n    x = [1, 2]\n    return len(x)\n"
+    assert hoist(instrument, source, "x = [1, 2]") == ("it is not inside a loop", source)
+
+
+def test_a_literal_is_hoisted_once(instrument):
+    source = textwrap.dedent("""\
+        def f(n):
+            for i in range(n):
+                x = [1, 2]
+                n -= len(x)
+            return n
+        """)
+    program = instrument(source, ANALYSIS)
+    rewriter = FileRewriter(Path("program.py"), source, read_iid_spans(Path(iids_path(program.dyn_ast))))
+    finding = {"rule_id": "R2-3", "iid": program.iid("x = [1, 2]")}
+    assert rewriter.rewrite(finding) is None
+    assert rewriter.rewrite(finding) == "another rewrite already changes it"
+    assert len(rewriter.rewrites) == 1
@@ -0,0 +1,39 @@
+"""Estimates and value samples drawn from the events a Sampler processes"""
+from my_analysis.sampling import Estimate, Sampler
+from my_analysis.streaming import Reservoir
+
+EVENTS = 20000
+
+
+def sampled_run(seed, sample_size):
+    """One site firing EVENTS times, returns the estimated count and the sampled event numbers"""
+    sampler, count, sample = Sampler(4, seed=seed), Estimate(), Reservoir(sample_size, seed=seed)
+    for event in range(EVENTS):
+        weight = sampler.sample("site")
+        if weight:
+            count.add(weight)
+            sample.offer(event, weight)
+    return count, [int(item) for item in sample.items]
+
+
+def test_estimate_covers_the_event_count():
+    count, _ = sampled_run(1, 10)
+    assert not count.exact
+    assert abs(count.total - EVENTS) <= count.error()
+
+
+def test_sample_is_not_biased_to_the_warm_up():
+    # The warm-up processes every event, later events only 1 in up to 256
+    values = [value for seed in range(50) for value in sampled_run(seed, 10)[1]]
+    assert abs(sum(values) / len(values) - EVENTS / 2) < 0.1 * EVENTS / 2
+
+
+def test_merged_samples_keep_the_largest_keys():
+    first, second = Reservoir(3, seed=1), Reservoir(3, seed=2)
+    for value in range(10):
+        first.offer(value)
+        second.offer(value + 100)
+    keys = sorted(first.keys + second.keys, reverse=True)[:3]
+    first.merge(second)
+    assert sorted(first.keys, reverse=True) == keys
+    assert first.seen == 20
@@ -0,0 +1,63 @@
+"""Aggregates of several processes merged through shard_state and merge_shard"""
+import pickle
+
+from my_analysis.HotPathProfilerAnalysis import ContextTree
+from my_analysis.SlowStringConcatAnalysis import SlowStringConcatAnalysis
+from my_analysis.UnusedVarAnalysis import UnusedVarAnalysis
+
+FILE = "example.py"
+
+
+def shipped(analysis):
+    """State of an analysis as the merge step reads it back from a shard"""
+    return pickle.loads(pickle.dumps(analysis.shard_state()))
+
+
+def concatenate(analysis, pieces):
+    s = ""
+    for piece in pieces:
+        analysis.add_assign(FILE, 7, lambda: s, piece)
+        s += piece
+
+
+def test_concatenation_sites_add_up():
+    workers = [SlowStringConcatAnalysis(), SlowStringConcatAnalysis()]
+    concatenate(workers[0], ["ab"] * 10)
+    concatenate(workers[1], ["ab"] * 30)
+    merged = SlowStringConcatAnalysis()
+    for worker in workers:
+        merged.merge_shard(shipped(worker))
+    site = merged.sites[(FILE, 7)]
+    assert (site.concatenations, site.longest_run, site.final_length) == (40, 30, 60)
+    assert site.bytes_wasted == sum(site.bytes_wasted for worker in workers for site in worker.sites.values())
+
+
+def test_context_trees_merge_by_site():
+    first, second = ContextTree(), ContextTree()
+    loop = first.child(first.child(0, ("function", FILE, 0)), ("for", FILE, 1))
+    first.self_times[loop] = 1.0
+    # The same stack reached in another order gets other node numbers
+    other = second.child(0, ("function", FILE, 4))
+    loop_again = second.child(second.child(0, ("function", FILE, 0)), ("for", FILE, 1))
+    second.self_times[other] = 0.5
+    second.self_times[loop_again] = 2.0
+    first.merge(pickle.loads(pickle.dumps(second)))
+    assert first.self_times[loop] == 3.0
+    assert first.self_times[first.child(0, ("function", FILE, 4))] == 0.5
+    assert len(first.sites) == 4
+
+
+def test_variable_read_in_any_process_is_read(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    key = (FILE, "<module>", "x")
+    parent, child = UnusedVarAnalysis(), UnusedVarAnalysis()
+    parent.definitions[key] = [3, object(), False]
+    child.definitions[key] = [3, object(), True]
+    parent.unused_vars[key] = [2, 1, "0", 3, True]
+    child.unused_vars[key] = [5, 1, "0", 3, False]
+    merged = UnusedVarAnalysis()
+    merged.merge_shard(shipped(parent))
+    merged.merge_shard(shipped(child))
+    assert merged.definitions[key][2]
+    # Reported again by the merged analysis, the shards' own processes did not report it
+    assert merged.unused_vars[key] == [7, 1, "0", 3, False]
@@ -0,0 +1,48 @@
+"""Concatenations that SlowStringConcatAnalysis counts as accumulating a value"""
+import ast
+
+from my_analysis.SlowStringConcatAnalysis import SlowStringConcatAnalysis, find_accumulations
+from my_analysis.source_index import SourceIndex
+
+ANALYSIS = "my_analysis.SlowStringConcatAnalysis.SlowStringConcatAnalysis"
+
+SOURCE = """\
+s = s + x
+s = x + s
+s = s + x + y
+u = s + x
+s = u + x
+s.attr = s.attr + x
+"""
+
+
+def spans_of(source, line):
+    """Spans of the additions on a line, outermost first"""
+    return [(node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+            for node in ast.walk(ast.parse(source)) if isinstance(node, ast.BinOp) and node.lineno == line]
+
+
+def test_only_additions_assigned_back_to_an_operand_accumulate(tmp_path):
+    path = tmp_path / "program.py.orig"
+    path.write_text(SOURCE)
+    accumulations = find_accumulations(ast.parse(SOURCE), SourceIndex(str(path)))
+    assert accumulations == {
+        spans_of(SOURCE, 1)[0]: "left",
+        spans_of(SOURCE, 2)[0]: "right",
+        spans_of(SOURCE, 3)[0]: "left",
+        spans_of(SOURCE, 3)[1]: "left",
+    }
+
+
+def test_non_ascii_text_before_and_inside_the_span_is_matched(instrument, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    program = instrument('s = ""\nfor i in range(30):\n    é = "é"; s = s + é + "ü"\n', ANALYSIS)
+    analysis = SlowStringConcatAnalysis()
+    inner, outer = program.iid('s + é'), program.iid('s + é + "ü"')
+    s = ""
+    for _ in range(30):
+        analysis.add(program.dyn_ast, inner, s, "é", s + "é")
+        analysis.add(program.dyn_ast, outer, s + "é", "ü", s + "éü")
+        s += "éü"
+    assert analysis.sides == {(program.dyn_ast, inner): "left", (program.dyn_ast, outer): "left"}
+    assert analysis.sites[(program.dyn_ast, outer)].longest_run == 30
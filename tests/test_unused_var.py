@@ -0,0 +1,61 @@
+"""UnusedVarAnalysis fed the write and read events DynaPyt sends for assignments"""
+import pytest
+
+from my_analysis.UnusedVarAnalysis import UnusedVarAnalysis
+
+ANALYSIS = "my_analysis.UnusedVarAnalysis.UnusedVarAnalysis"
+
+
+@pytest.fixture
+def analysis(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return UnusedVarAnalysis()
+
+
+def overwritten(analysis):
+    return {key[2] for key in analysis.unused_vars}
+
+
+def test_augmented_assignment_reads_its_target(analysis, instrument):
+    program = instrument("t = 0\nfor i in range(5):\n    t += i * 2\nprint(t)\n", ANALYSIS)
+    t = 0
+    analysis.write(program.dyn_ast, program.iid("t = 0"), [lambda: t], t)
+    for i in range(5):
+        analysis.read(program.dyn_ast, program.iid("i"), i)
+        # DynaPyt sends the write of t += x with the new value and no read of t
+        t += i * 2
+        analysis.write(program.dyn_ast, program.iid("t += i * 2"), [lambda: t], t)
+    analysis.read(program.dyn_ast, program.iid("t"), t)
+    assert not analysis.unused_vars
+    assert all(definition[2] for definition in analysis.definitions.values())
+
+
+def test_string_accumulator_is_not_overwritten(analysis, instrument):
+    program = instrument("s = ''\nfor i in range(3):\n    s += str(i)\n", ANALYSIS)
+    s = ""
+    analysis.write(program.dyn_ast, program.iid("s = ''"), [lambda: s], s)
+    for i in range(3):
+        s += str(i)
+        analysis.write(program.dyn_ast, program.iid("s += str(i)"), [lambda: s], s)
+    assert not analysis.unused_vars
+    # The last value is still never read
+    assert [definition[2] for definition in analysis.definitions.values()] == [False]
+
+
+def test_plain_assignment_overwrites_an_unread_value(analysis, instrument):
+    program = instrument("x = 1\nx = 2\nprint(x)\n", ANALYSIS)
+    analysis.write(program.dyn_ast, program.iid("x = 1"), [], 1)
+    analysis.write(program.dyn_ast, program.iid("x = 2"), [], 2)
+    analysis.read(program.dyn_ast, program.iid("x"), 2)
+    assert overwritten(analysis) == {"x"}
+
+
+def test_same_name_in_two_scopes_is_two_variables(analysis, instrument):
+    program = instrument("x = 1\ndef f():\n    x = 2\n    return x\nprint(f(), x)\n", ANALYSIS)
+    module_x, local_x = program.iids("x")[1], program.iids("x")[0]
+    analysis.write(program.dyn_ast, program.iid("x = 1"), [], 1)
+    analysis.write(program.dyn_ast, program.iid("x = 2"), [], 2)
+    analysis.read(program.dyn_ast, local_x, 2)
+    analysis.read(program.dyn_ast, module_x, 1)
+    assert not analysis.unused_vars
+    assert {key[1] for key in analysis.definitions} == {"<module>", "f"}
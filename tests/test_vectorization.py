@@ -0,0 +1,37 @@
+"""Loop nests VectorizationAnalysis recognizes and the NumPy idioms it suggests for them"""
+from my_analysis.source_index import SourceIndex
+from my_analysis.VectorizationAnalysis import VectorizationAnalysis, find_nests
+
+ANALYSIS = "my_analysis.VectorizationAnalysis.VectorizationAnalysis"
+
+
+def idioms(tmp_path, source):
+    """{(shape, idiom)} of the nests of a program"""
+    path = tmp_path / "program.py.orig"
+    path.write_text(source, encoding="utf-8")
+    index = SourceIndex(str(path))
+    return {(shape.shape, shape.idiom) for _, _, shape in find_nests(index.syntax_tree(), index).values()}
+
+
+def test_loop_variables_of_range_and_enumerate_become_their_indices(tmp_path):
+    assert idioms(tmp_path, "for i in range(len(xs)):\n    out[i] = xs[i] * i\n") == {
+        ("element-wise map", "out = xs * numpy.arange(len(xs))")}
+    assert idioms(tmp_path, "for i in range(1, n, 2):\n    out[i] = i * 2.0\n") == {
+        ("element-wise map", "out = numpy.arange(1, n, 2) * 2.0")}
+    assert idioms(tmp_path, "for i, x in enumerate(xs, 1):\n    total += x * i\n") == {
+        ("reduction", "total += numpy.dot(xs, numpy.arange(1, 1 + len(xs)))")}
+
+
+def test_sum_of_a_list_comprehension_is_a_reduction(tmp_path):
+    assert idioms(tmp_path, "total = sum([x * 2.0 for x in a])\n") == {("reduction", "numpy.sum(a * 2.0)")}
+    assert idioms(tmp_path, "total = sum(x * 2.0 for x in a)\n") == {("reduction", "numpy.sum(a * 2.0)")}
+    assert idioms(tmp_path, "doubled = [x * 2.0 for x in a]\n") == {
+        ("element-wise map", "a * 2.0  (an array instead of the list comprehension)")}
+
+
+def test_non_ascii_text_before_a_comprehension_is_matched(instrument, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    program = instrument('xs = [1.0, 2.0]\né = "é"; total = sum([x * 2.0 for x in xs])\n', ANALYSIS)
+    analysis = VectorizationAnalysis()
+    nest = analysis._nest_of(program.dyn_ast, program.iid(" for x in xs"))
+    assert nest is not None and nest[0].nest.idiom == "numpy.sum(xs * 2.0)"